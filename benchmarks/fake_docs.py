@@ -0,0 +1,68 @@
+"""Stand-in for GoogleDocsService that serves synthetic documents of a chosen size"""
+import hashlib
+import random
+
+_WORDS = (
+    "ngày xưa có một cô gái nhỏ sống trong ngôi làng ven sông mỗi sáng "
+    "cô ra bờ nước nhìn những con thuyền đi qua và mơ về thành phố xa "
+    "gió thổi qua cánh đồng lúa chín vàng tiếng chim hót vang trên cây"
+).split()
+_TERMINATORS = (".", ".", ".", "!", "?", "...")
+
+
+def synthetic_text(size: int, seed: int = 0, paragraph_sentences: int = 8) -> str:
+    """Generate roughly `size` characters of Vietnamese-looking prose"""
+    rng = random.Random(seed)
+    parts = []
+    length = 0
+    sentences = 0
+    while length < size:
+        words = [rng.choice(_WORDS) for _ in range(rng.randint(6, 20))]
+        sentence = " ".join(words).capitalize() + rng.choice(_TERMINATORS)
+        sentences += 1
+        separator = "\n" if sentences % paragraph_sentences == 0 else " "
+        parts.append(sentence + separator)
+        length += len(sentence) + 1
+    return "".join(parts)[:size]
+
+
+class FakeGoogleDocsService:
+    """
+    Serves synthetic documents. Doc IDs of the form ``synthetic-<chars>``
+    produce a document of that many characters; explicit sizes can also be
+    registered with `add_document`.
+    """
+
+    def __init__(self, seed: int = 0):
+        self.seed = seed
+        self.documents = {}
+        self.fetches = 0
+
+    def add_document(self, doc_id: str, size: int) -> str:
+        self.documents[doc_id] = synthetic_text(size, seed=self.seed)
+        return doc_id
+
+    def append_text(self, doc_id: str, text: str) -> None:
+        """Edit a document (new revision) by appending text"""
+        self.documents[doc_id] = self._text(doc_id) + text
+
+    def get_document(self, doc_id):
+        return self.fetch_document(doc_id)["text"]
+
+    def fetch_document(self, doc_id):
+        self.fetches += 1
+        text = self._text(doc_id)
+        return {
+            "text": text,
+            "title": doc_id,
+            "revision_id": hashlib.sha1(text.encode("utf-8")).hexdigest(),
+            "cached": False,
+        }
+
+    def _text(self, doc_id):
+        if doc_id not in self.documents:
+            prefix, _, size = doc_id.rpartition("-")
+            if prefix != "synthetic" or not size.isdigit():
+                raise ValueError(f"Unknown synthetic document: {doc_id}")
+            self.add_document(doc_id, int(size))
+        return self.documents[doc_id]
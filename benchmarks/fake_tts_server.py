@@ -0,0 +1,120 @@
+"""
+Local stand-in for the OpenAI speech endpoint.
+
+Serves POST /v1/audio/speech with deterministic silent MP3s whose length
+is proportional to the input text, after a configurable latency, and can
+answer a fraction of requests with 429 to exercise retry paths. Point the
+OpenAI client at it with OPENAI_BASE_URL=http://127.0.0.1:<port>/v1.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import random
+import threading
+import time
+
+# MPEG1 Layer III, 64 kbps, 44.1 kHz, mono, no CRC. A frame whose side info
+# and main data are all zero decodes to silence.
+_FRAME_HEADER = bytes([0xFF, 0xFB, 0x50, 0xC0])
+_FRAME_LENGTH = 144 * 64000 // 44100
+_FRAME_DURATION = 1152 / 44100
+SILENT_FRAME = _FRAME_HEADER + bytes(_FRAME_LENGTH - len(_FRAME_HEADER))
+
+
+def silent_mp3(duration: float) -> bytes:
+    """Return a valid MP3 of roughly `duration` seconds of silence"""
+    frames = max(1, int(round(duration / _FRAME_DURATION)))
+    return SILENT_FRAME * frames
+
+
+class FakeSpeechServer:
+    def __init__(self, host="127.0.0.1", port=0, latency=0.2, jitter=0.0,
+                 error_rate=0.0, chars_per_second=15.0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.chars_per_second = chars_per_second
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.throttled = 0
+        self.characters = 0
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-tts", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'throttled': self.throttled,
+                'characters': self.characters,
+            }
+
+    def _decide(self, text):
+        """Return (throttle?, delay) for one request, deterministically for a given seed"""
+        with self._lock:
+            self.requests += 1
+            throttle = self._random.random() < self.error_rate
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            if throttle:
+                self.throttled += 1
+            else:
+                self.characters += len(text)
+        return throttle, delay
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                if not self.path.rstrip('/').endswith('/audio/speech'):
+                    self._send(404, b'{"error": {"message": "not found"}}', 'application/json')
+                    return
+                length = int(self.headers.get('Content-Length', 0))
+                payload = json.loads(self.rfile.read(length) or b'{}')
+                text = payload.get('input', '')
+
+                throttle, delay = server._decide(text)
+                time.sleep(delay)
+                if throttle:
+                    body = json.dumps({'error': {'message': 'Rate limit reached', 'type': 'requests'}}).encode()
+                    self._send(429, body, 'application/json', {'Retry-After': '0.1'})
+                    return
+                audio = silent_mp3(len(text) / server.chars_per_second)
+                self._send(200, audio, 'audio/mpeg')
+
+            def _send(self, status, body, content_type, headers=None):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
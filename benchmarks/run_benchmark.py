@@ -0,0 +1,289 @@
+"""
+Offline end-to-end benchmark for the story pipeline.
+
+Runs every stage against local stand-ins (FakeSpeechServer for OpenAI TTS,
+FakeGoogleDocsService for Google Docs), so no API money or network is
+needed, and writes a JSON result file that can be compared across runs:
+
+    python -m benchmarks.run_benchmark --size 50000
+    python -m benchmarks.run_benchmark --size 50000 --compare benchmarks/results/<previous>.json
+"""
+from contextlib import contextmanager
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+from benchmarks.fake_docs import FakeGoogleDocsService, synthetic_text
+from benchmarks.fake_tts_server import FakeSpeechServer
+from src.utils.performance_monitor import _maxrss_bytes
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Mỗi lệnh chạy trong một interpreter mới để đo đúng thời gian import
+STARTUP_COMMANDS = {
+    "import_main": ["-c", "import src.main"],
+    "cli_help": ["-m", "src", "--help"],
+    "cache_status": ["-m", "src", "cache-status"],
+}
+
+
+@contextmanager
+def measure(result, trace_memory=False):
+    """
+    Fill result with wall time and CPU time for the enclosed block. getrusage
+    can't be reset, so the RSS figures are the process's (and its largest
+    child's) peak so far, not the block's own; with trace_memory the Python
+    heap peak is the block's.
+    """
+    # --profile có thể đã bật tracemalloc cho PerformanceMonitor: khi đó không tắt nó
+    started_tracing = trace_memory and not tracemalloc.is_tracing()
+    if trace_memory:
+        tracemalloc.start()
+        tracemalloc.reset_peak()
+    children_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    try:
+        yield result
+    finally:
+        result["seconds"] = time.perf_counter() - start
+        result["cpu_seconds"] = time.process_time() - cpu_start
+        children_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+        result["child_cpu_seconds"] = (
+            (children_after.ru_utime + children_after.ru_stime)
+            - (children_before.ru_utime + children_before.ru_stime)
+        )
+        result["lifetime_max_rss_bytes"] = _maxrss_bytes(resource.RUSAGE_SELF)
+        result["lifetime_child_max_rss_bytes"] = _maxrss_bytes(resource.RUSAGE_CHILDREN)
+        if trace_memory:
+            result["peak_python_bytes"] = tracemalloc.get_traced_memory()[1]
+            if started_tracing:
+                tracemalloc.stop()
+
+
+def bench_startup(repeats=5):
+    """Wall time of fresh interpreters running short CLI commands"""
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [REPO_ROOT, os.environ.get("PYTHONPATH")]))}
+    result = {}
+    for name, args in STARTUP_COMMANDS.items():
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, *args], env=env, check=True,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            timings.append(time.perf_counter() - start)
+        result[name] = {"min_seconds": min(timings), "median_seconds": statistics.median(timings)}
+    return result
+
+
+def bench_text(text, trace_memory):
+    from src.services.text_processor import TextProcessor
+
+    processor = TextProcessor("output")
+    result = {"chars": len(text)}
+    with measure(result, trace_memory):
+        chunks = processor.build_chunks(text)
+    result["chunks"] = len(chunks)
+    result["chars_per_second"] = len(text) / result["seconds"] if result["seconds"] else None
+    return result, chunks
+
+
+def bench_tts(chunks, workdir, workers, trace_memory):
+    from src.services.tts_cache import TTSCache
+    from src.services.tts_processor import TTSProcessor
+    from src.services.tts_service import TTSService
+
+    tts_service = TTSService("benchmark", workdir, cache=TTSCache(os.path.join(workdir, "tts-cache")))
+    processor = TTSProcessor(tts_service, max_workers=workers)
+    jobs = [
+        (chunk, os.path.join(workdir, "audio", f"part{chunk.index:03d}.mp3"))
+        for chunk in chunks
+    ]
+
+    result = {"requests": len(jobs), "workers": processor.max_workers}
+    with measure(result, trace_memory):
+        audio_files = processor.process_batch(jobs)
+    result["requests_per_second"] = len(jobs) / result["seconds"] if result["seconds"] else None
+    return result, audio_files
+
+
+def bench_audio_merge(audio_files, workdir, trace_memory):
+    from src.services.audio_merger import AudioMerger
+    from src.utils.mp3_helper import scan_mp3
+
+    output_file = os.path.join(workdir, "final", "complete_story.mp3")
+    result = {"inputs": len(audio_files)}
+    with measure(result, trace_memory):
+        AudioMerger().merge(audio_files, output_file)
+    result["audio_seconds"] = scan_mp3(output_file).duration
+    result["output_bytes"] = os.path.getsize(output_file)
+    return result
+
+
+def bench_video(audio_files, background_image, workdir, engine, render_workers, trace_memory):
+    from src.services.video_processor import VideoProcessor
+    from src.utils.mp3_helper import scan_mp3
+
+    processor = VideoProcessor(workdir, engine=engine, workers=render_workers)
+    story_dir = os.path.join(workdir, f"video-{engine}")
+    audio_seconds = sum(scan_mp3(path).duration for path in audio_files)
+    result = {"engine": engine, "segments": len(audio_files), "audio_seconds": audio_seconds,
+              "render_workers": render_workers}
+    with measure(result, trace_memory):
+        processor.create_video(audio_files, background_image, story_dir)
+    # Realtime factor: số giây video tạo được trên mỗi giây xử lý
+    result["realtime_factor"] = audio_seconds / result["seconds"] if result["seconds"] else None
+    return result
+
+
+def bench_end_to_end(doc_id, background_image, streaming, trace_memory):
+    """
+    Run the story cold, then again after editing its last sentence: the
+    warm run misses the "already rendered" shortcut and measures the
+    incremental path (manifest checks, one changed part through TTS and
+    render, merge) instead of a no-op.
+    """
+    from src.main import StoryVideoGenerator
+    from src.services.tts_service import TTSService
+    from src.utils.performance_monitor import PerformanceMonitor
+
+    monitor = PerformanceMonitor.shared()
+    docs = FakeGoogleDocsService()
+    generator = StoryVideoGenerator(
+        streaming=streaming,
+        google_docs=docs,
+        tts_service=TTSService("benchmark", "output"),
+    )
+    runs = {}
+    for run in ("cold", "warm"):
+        if run == "warm":
+            docs.append_text(doc_id, " Hết.")
+        monitor.reset()
+        result = {"streaming": streaming}
+        with measure(result, trace_memory):
+            generator.process_story(doc_id, background_image)
+        result["operations"] = monitor.get_metrics()
+        if monitor.profiling:
+            result["profile"] = monitor.profile_metrics()
+        runs[run] = result
+    return runs
+
+
+def compare(current, previous_path):
+    """Print the relative change of every numeric metric against a previous result file"""
+    with open(previous_path, "r", encoding="utf-8") as f:
+        previous = json.load(f)
+
+    def walk(new, old, prefix=""):
+        for key, value in new.items():
+            name = f"{prefix}{key}"
+            if isinstance(value, dict) and isinstance(old.get(key), dict):
+                walk(value, old[key], f"{name}.")
+            elif isinstance(value, (int, float)) and isinstance(old.get(key), (int, float)) and old[key]:
+                change = (value - old[key]) / old[key] * 100
+                print(f"{name}: {old[key]:.4g} -> {value:.4g} ({change:+.1f}%)")
+
+    walk(current["stages"], previous.get("stages", {}))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmark for the story pipeline")
+    parser.add_argument("--size", type=int, default=50000, help="synthetic document size in characters")
+    parser.add_argument("--latency", type=float, default=0.2, help="fake TTS latency per request (seconds)")
+    parser.add_argument("--jitter", type=float, default=0.05, help="extra random latency per request (seconds)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of TTS requests answered with 429")
+    parser.add_argument("--workers", type=int, default=None, help="TTS concurrency (default: TTSConfig.MAX_CONCURRENCY)")
+    parser.add_argument("--engine", choices=("loop", "ffmpeg", "moviepy"), default="loop")
+    parser.add_argument("--render-workers", type=int, default=None,
+                        help="segment render processes (default: chosen from the CPU count)")
+    parser.add_argument("--streaming", action="store_true", help="run the end-to-end stage in streaming mode")
+    parser.add_argument("--stages", default="startup,text,tts,merge,video,e2e",
+                        help="comma-separated stages to run: startup,text,tts,merge,video,e2e")
+    parser.add_argument("--trace-memory", action="store_true", help="record tracemalloc peaks (slower)")
+    parser.add_argument("--profile", action="store_true",
+                        help="record per-stage CPU/RSS/child usage of the end-to-end run (see PerformanceMonitor)")
+    parser.add_argument("--profile-stage", default=None, help="stage to run under cProfile in the end-to-end run")
+    parser.add_argument("--output", help="result file (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--compare", help="previous result file to compare against")
+    args = parser.parse_args(argv)
+
+    stages = set(args.stages.split(","))
+    timestamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    output = os.path.abspath(args.output or os.path.join(RESULTS_DIR, f"{timestamp}.json"))
+    compare_path = os.path.abspath(args.compare) if args.compare else None
+
+    results = {
+        "timestamp": timestamp,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": vars(args),
+        "stages": {},
+    }
+
+    workdir = tempfile.mkdtemp(prefix="story-bench-")
+    os.chdir(workdir)
+
+    from PIL import Image
+    background_image = os.path.join(workdir, "background.jpg")
+    Image.new("RGB", (1280, 720), (32, 48, 96)).save(background_image)
+
+    if "startup" in stages:
+        results["stages"]["startup"] = bench_startup()
+
+    with FakeSpeechServer(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate) as server:
+        os.environ["OPENAI_BASE_URL"] = server.base_url
+        os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+        text = synthetic_text(args.size)
+        text_result, chunks = bench_text(text, args.trace_memory)
+        if "text" in stages:
+            results["stages"]["text"] = text_result
+
+        audio_files = []
+        if stages & {"tts", "merge", "video"}:
+            results["stages"]["tts"], audio_files = bench_tts(
+                chunks, os.path.join(workdir, "tts"), args.workers, args.trace_memory
+            )
+        if "merge" in stages:
+            results["stages"]["merge"] = bench_audio_merge(
+                audio_files, os.path.join(workdir, "merge"), args.trace_memory
+            )
+        if "video" in stages:
+            results["stages"]["video"] = bench_video(
+                audio_files, background_image, os.path.join(workdir, "video"), args.engine,
+                args.render_workers, args.trace_memory
+            )
+        if "e2e" in stages:
+            if args.profile or args.profile_stage:
+                from src.utils.performance_monitor import PerformanceMonitor
+                PerformanceMonitor.shared().configure_profiling(
+                    cprofile_stage=args.profile_stage, profile_dir=os.path.join(RESULTS_DIR, "profiles")
+                )
+            results["stages"]["e2e"] = bench_end_to_end(
+                f"synthetic-{args.size}", background_image, args.streaming, args.trace_memory
+            )
+        results["fake_tts"] = server.stats()
+
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    print(f"Benchmark results written to {output}")
+
+    if compare_path:
+        compare(results, compare_path)
+    return results
+
+
+if __name__ == "__main__":
+    main()
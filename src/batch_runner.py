@@ -0,0 +1,119 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+import threading
+import time
+from .utils.logger import Logger
+
+
+class BatchRunner:
+    """
+    Runs many documents through StoryVideoGenerator as a stage pipeline.
+
+    Every stage in generator.stages (fetch, chunk, tts, render, merge) has
+    its own worker pool, so one document's TTS overlaps another document's
+    video encode. A document that fails is reported and the rest of the
+    batch continues.
+    """
+
+    DEFAULT_WORKERS = {
+        "fetch": 4,
+        "chunk": 2,
+        "tts": 2,
+        "stream": 2,
+        "render": 2,
+        "merge": 1,
+    }
+
+    def __init__(self, generator, stage_workers: Optional[Dict[str, int]] = None):
+        self.logger = Logger(__name__)
+        self.generator = generator
+        self.stage_workers = {**self.DEFAULT_WORKERS, **(stage_workers or {})}
+        # Các story trong pool render chia nhau CPU thay vì mỗi story dùng hết
+        generator.video_processor.concurrent_jobs = self.stage_workers["render"]
+        self._lock = threading.Lock()
+        self._results = {}
+        self._remaining = 0
+        self._done = threading.Event()
+        self._executors = {}
+
+    def run(self, doc_ids: List[str], background_image: str, resume: bool = False) -> Dict[str, dict]:
+        """
+        Process every document and return {doc_id: status}, where status has
+        'status' ('done' or 'failed'), 'video', 'error', 'stage' and 'duration'.
+        resume=True continues each story from its last checkpoint.
+        """
+        doc_ids = list(dict.fromkeys(doc_ids))
+        if not doc_ids:
+            return {}
+
+        self._results = {
+            doc_id: {"status": "pending", "video": None, "error": None, "stage": None, "duration": None}
+            for doc_id in doc_ids
+        }
+        self._remaining = len(doc_ids)
+        self._done.clear()
+
+        self._executors = {
+            stage: ThreadPoolExecutor(max_workers=self.stage_workers[stage], thread_name_prefix=f"batch-{stage}")
+            for stage in self.generator.stages
+        }
+        try:
+            for doc_id in doc_ids:
+                started = time.perf_counter()
+                try:
+                    job = self.generator.prepare_job(doc_id, background_image, resume)
+                except Exception as e:
+                    self._finish(doc_id, started, error=e, stage="validate")
+                    continue
+                self._submit(job, 0, started)
+            self._done.wait()
+        finally:
+            for executor in self._executors.values():
+                executor.shutdown(wait=True)
+
+        self.logger.info(self.format_report(self._results))
+        return self._results
+
+    def _submit(self, job, stage_index: int, started: float) -> None:
+        stage = self.generator.stages[stage_index]
+        with self._lock:
+            self._results[job.doc_id]["status"] = stage
+        future = self._executors[stage].submit(self.generator.run_stage, stage, job)
+        future.add_done_callback(lambda f: self._on_stage_done(f, job, stage_index, started))
+
+    def _on_stage_done(self, future, job, stage_index: int, started: float) -> None:
+        stage = self.generator.stages[stage_index]
+        error = future.exception()
+        if error is not None:
+            self.logger.error(f"Document {job.doc_id} failed at stage {stage}: {str(error)}")
+            self._finish(job.doc_id, started, error=error, stage=stage)
+        elif job.final_video is not None or stage_index + 1 == len(self.generator.stages):
+            self._finish(job.doc_id, started, video=job.final_video, stage=stage)
+        else:
+            self._submit(job, stage_index + 1, started)
+
+    def _finish(self, doc_id: str, started: float, video=None, error=None, stage=None) -> None:
+        with self._lock:
+            self._results[doc_id].update({
+                "status": "failed" if error is not None else "done",
+                "video": video,
+                "error": str(error) if error is not None else None,
+                "stage": stage,
+                "duration": time.perf_counter() - started,
+            })
+            self._remaining -= 1
+            if self._remaining == 0:
+                self._done.set()
+
+    @staticmethod
+    def format_report(results: Dict[str, dict]) -> str:
+        report = ["Batch Report:"]
+        for doc_id, result in results.items():
+            duration = f"{result['duration']:.2f}s" if result["duration"] is not None else "-"
+            if result["status"] == "done":
+                report.append(f"- {doc_id}: done in {duration} -> {result['video']}")
+            else:
+                report.append(f"- {doc_id}: {result['status']} at {result['stage']} after {duration}: {result['error']}")
+        failed = sum(1 for r in results.values() if r["status"] != "done")
+        report.append(f"\n{len(results) - failed}/{len(results)} documents completed")
+        return "\n".join(report)
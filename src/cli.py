@@ -0,0 +1,264 @@
+"""
+Command line entry point: python -m src <command> ...
+
+Heavy services (moviepy, openai, googleapiclient) are imported inside the
+commands that need them, so quick commands such as cache-status and
+validate-doc start in a fraction of a second.
+"""
+import argparse
+import os
+import re
+import sys
+
+from .config.daemon_config import DaemonConfig
+from .config.output_config import OutputConfig
+
+# Cho phép dán cả URL docs.google.com/document/d/<id>/edit
+_DOC_URL = re.compile(r"/document/d/([A-Za-z0-9_-]+)")
+
+
+def parse_doc_id(value: str) -> str:
+    match = _DOC_URL.search(value)
+    return match.group(1) if match else value.strip()
+
+
+def parse_size(value: str) -> int:
+    """'500M', '20G', '1024' -> bytes"""
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+    value = value.strip().upper().rstrip("B")
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+
+def _format_size(size: int) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.1f} {unit}" if unit != "B" else f"{size} B"
+        size /= 1024
+
+
+def _configure_profiling(args) -> None:
+    if args.profile or args.profile_stage:
+        from .utils.performance_monitor import PerformanceMonitor
+        PerformanceMonitor.shared().configure_profiling(cprofile_stage=args.profile_stage)
+
+
+def cmd_generate(args) -> int:
+    from .main import StoryVideoGenerator
+    _configure_profiling(args)
+    generator = StoryVideoGenerator(streaming=args.streaming, render_workers=args.render_workers,
+                                    retention=args.retention)
+    video_path = generator.process_story(doc_id=parse_doc_id(args.doc_id), background_image=args.background,
+                                         resume=args.resume)
+    print(f"Video generated successfully: {video_path}")
+    return 0
+
+
+def cmd_batch(args) -> int:
+    from .batch_runner import BatchRunner
+    from .main import StoryVideoGenerator
+    _configure_profiling(args)
+    generator = StoryVideoGenerator(streaming=args.streaming, render_workers=args.render_workers,
+                                    retention=args.retention)
+    results = BatchRunner(generator).run([parse_doc_id(d) for d in args.doc_ids], args.background,
+                                         resume=args.resume)
+    print(BatchRunner.format_report(results))
+    if generator.performance.profiling:
+        # Stage của batch chạy trên pool riêng, không thuộc story nào: báo cáo chung cho cả batch
+        print(generator.performance.generate_report())
+        profile_path = os.path.join(OutputConfig.OUTPUT_DIR, "batch_profile.json")
+        print(f"Batch profile written to {generator.performance.export_profile(profile_path)}")
+    return 0 if all(r["status"] == "done" for r in results.values()) else 1
+
+
+def cmd_daemon(args) -> int:
+    from .daemon import StoryDaemon
+    from .main import StoryVideoGenerator
+    from .services.job_queue import JobQueue
+    _configure_profiling(args)
+    generator = StoryVideoGenerator(streaming=args.streaming, render_workers=args.render_workers,
+                                    retention=args.retention)
+    StoryDaemon(generator, JobQueue(args.queue), concurrency=args.concurrency,
+                host=args.host, port=args.port,
+                default_background=os.path.abspath(args.background)).serve_forever()
+    return 0
+
+
+def cmd_submit(args) -> int:
+    import json
+    from urllib.error import HTTPError, URLError
+    from urllib.request import Request, urlopen
+    base = f"http://{args.host}:{args.port}"
+    if args.status is not None:
+        request = Request(f"{base}/jobs/{args.status}")
+    elif args.doc_id is None:
+        print("Give a document ID to submit, or --status JOB_ID")
+        return 2
+    else:
+        payload = {"doc_id": parse_doc_id(args.doc_id), "priority": args.priority, "resume": args.resume}
+        if args.background:
+            payload["background"] = os.path.abspath(args.background)
+        request = Request(f"{base}/jobs", data=json.dumps(payload).encode('utf-8'),
+                          headers={"Content-Type": "application/json"})
+    try:
+        with urlopen(request, timeout=10) as response:
+            print(json.dumps(json.load(response), indent=2))
+    except HTTPError as e:
+        print(f"Daemon rejected the request: {e.read().decode('utf-8', 'replace')}")
+        return 1
+    except URLError as e:
+        print(f"Daemon not reachable at {base}: {e.reason}")
+        return 1
+    return 0
+
+
+def cmd_cache_status(args) -> int:
+    from .config.tts_config import TTSConfig
+    from .services.tts_cache import TTSCache
+    stats = TTSCache(args.tts_cache).stats()
+    print(f"TTS cache:  {args.tts_cache} ({_format_size(stats['size_bytes'])} / "
+          f"{_format_size(stats['max_bytes'])}, enabled={TTSConfig.CACHE_ENABLED})")
+
+    docs = [name for name in os.listdir(args.docs_cache) if name.endswith(".json")] \
+        if os.path.isdir(args.docs_cache) else []
+    print(f"Docs cache: {args.docs_cache} ({len(docs)} documents)")
+
+    loops = [os.path.join(root, name) for root, _, files in os.walk(args.background_cache)
+             for name in files if name.endswith(".mp4")]
+    loops_size = sum(os.path.getsize(path) for path in loops)
+    print(f"Backgrounds: {args.background_cache} ({len(loops)} loops, {_format_size(loops_size)})")
+
+    discovery = os.path.join(args.discovery_cache, "docs.v1.json")
+    print(f"Discovery:  {'cached' if os.path.exists(discovery) else 'not cached'} ({discovery})")
+    return 0
+
+
+def cmd_gc(args) -> int:
+    from .services.retention import StoryGarbageCollector
+    collector = StoryGarbageCollector(args.output_dir)
+    report = collector.collect(args.max_bytes, delete_finals=args.delete_finals, dry_run=args.dry_run)
+    prefix = "Would free" if args.dry_run else "Freed"
+    print(f"Stories: {_format_size(report['before'])} -> {_format_size(report['after'])} "
+          f"(limit {_format_size(args.max_bytes)})")
+    for story_dir in report["trimmed"]:
+        print(f"  trimmed to finals: {story_dir}")
+    for story_dir in report["deleted"]:
+        print(f"  deleted: {story_dir}")
+    for story_dir in report["skipped"]:
+        print(f"  skipped (pending checkpoint): {story_dir}")
+    print(f"{prefix} {_format_size(report['freed'])}")
+
+    if args.tts_max_bytes is not None and not args.dry_run:
+        from .services.tts_cache import TTSCache
+        cache = TTSCache(args.tts_cache, max_bytes=args.tts_max_bytes)
+        cache.evict()
+        print(f"TTS cache: {_format_size(cache.stats()['size_bytes'])}")
+    return 0
+
+
+def cmd_validate_doc(args) -> int:
+    from .utils.validation_helper import ValidationHelper
+    doc_id = parse_doc_id(args.doc_id)
+    try:
+        ValidationHelper().validate_google_doc_id(doc_id)
+    except ValueError as e:
+        print(f"{doc_id}: {e}")
+        return 1
+    if not args.check_access:
+        print(f"{doc_id}: valid")
+        return 0
+
+    from .services.google_docs_service import GoogleDocsService
+    try:
+        revision = GoogleDocsService(credentials_path=args.credentials).get_revision(doc_id)
+    except Exception as e:
+        print(f"{doc_id}: not accessible ({e})")
+        return 1
+    print(f"{doc_id}: accessible, revision {revision}")
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m src", description="Turn Google Docs stories into narrated videos")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    def add_render_options(sub):
+        sub.add_argument("--background", default="assets/background.jpg", help="background image")
+        sub.add_argument("--retention", choices=OutputConfig.RETENTION_POLICIES, default=None,
+                         help=f"artifacts to keep after merging (default: {OutputConfig.RETENTION})")
+        sub.add_argument("--streaming", action="store_true", help="render segments as soon as their audio is ready")
+        sub.add_argument("--render-workers", type=int, default=2, help="segment render threads in streaming mode")
+        sub.add_argument("--profile", action="store_true",
+                         help="record CPU, RSS, child-process and tracemalloc usage per stage (profile.json)")
+        sub.add_argument("--profile-stage", default=None, metavar="NAME",
+                         help="also run the stage with this name under cProfile, e.g. 'Merging outputs'")
+
+    def add_resume_option(sub):
+        sub.add_argument("--resume", action="store_true",
+                         help="continue an interrupted run from its last checkpoint instead of re-fetching")
+
+    generate = subparsers.add_parser("generate", help="generate the video for one document")
+    generate.add_argument("doc_id", help="Google Doc ID or URL")
+    add_render_options(generate)
+    add_resume_option(generate)
+    generate.set_defaults(func=cmd_generate)
+
+    batch = subparsers.add_parser("batch", help="generate videos for several documents")
+    batch.add_argument("doc_ids", nargs="+", help="Google Doc IDs or URLs")
+    add_render_options(batch)
+    add_resume_option(batch)
+    batch.set_defaults(func=cmd_batch)
+
+    daemon = subparsers.add_parser("daemon", help="process queued jobs with warm clients and serve a local HTTP API")
+    daemon.add_argument("--queue", default=DaemonConfig.QUEUE_PATH, help="SQLite job queue")
+    daemon.add_argument("--concurrency", type=int, default=DaemonConfig.CONCURRENCY, help="stories processed at once")
+    daemon.add_argument("--host", default=DaemonConfig.HOST)
+    daemon.add_argument("--port", type=int, default=DaemonConfig.PORT)
+    add_render_options(daemon)
+    daemon.set_defaults(func=cmd_daemon)
+
+    submit = subparsers.add_parser("submit", help="queue a document on a running daemon, or show a job's status")
+    submit.add_argument("doc_id", nargs="?", help="Google Doc ID or URL")
+    submit.add_argument("--priority", type=int, default=0, help="higher runs first")
+    submit.add_argument("--status", type=int, default=None, metavar="JOB_ID", help="show a job instead of submitting")
+    submit.add_argument("--background", default=None, help="background image (default: the daemon's)")
+    submit.add_argument("--resume", action="store_true", help="continue from the story's last checkpoint")
+    submit.add_argument("--host", default=DaemonConfig.HOST)
+    submit.add_argument("--port", type=int, default=DaemonConfig.PORT)
+    submit.set_defaults(func=cmd_submit)
+
+    cache_status = subparsers.add_parser("cache-status", help="show TTS, document, background and discovery cache usage")
+    cache_status.add_argument("--tts-cache", default="cache/tts")
+    cache_status.add_argument("--docs-cache", default="cache/docs")
+    cache_status.add_argument("--background-cache", default="cache/backgrounds")
+    cache_status.add_argument("--discovery-cache", default="cache/discovery")
+    cache_status.set_defaults(func=cmd_cache_status)
+
+    gc = subparsers.add_parser("gc", help="reclaim disk space across stories, least recently used first")
+    gc.add_argument("--max-bytes", type=parse_size, default=OutputConfig.GC_MAX_BYTES,
+                    help="target size of the output dir, e.g. 50G")
+    gc.add_argument("--delete-finals", action="store_true",
+                    help="also delete whole stories if trimming intermediates is not enough")
+    gc.add_argument("--dry-run", action="store_true", help="only report what would be removed")
+    gc.add_argument("--output-dir", default=OutputConfig.OUTPUT_DIR)
+    gc.add_argument("--tts-cache", default="cache/tts")
+    gc.add_argument("--tts-max-bytes", type=parse_size, default=None, help="also evict the TTS cache down to this size")
+    gc.set_defaults(func=cmd_gc)
+
+    validate = subparsers.add_parser("validate-doc", help="check a document ID (and optionally access to it)")
+    validate.add_argument("doc_id", help="Google Doc ID or URL")
+    validate.add_argument("--check-access", action="store_true", help="fetch the revision ID with the service account")
+    validate.add_argument("--credentials", default=None, help="service account JSON (default: bundled path)")
+    validate.set_defaults(func=cmd_validate_doc)
+
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,30 @@
+class AudioConfig:
+    # Hậu kỳ từng phần audio sau TTS: cắt khoảng lặng, chuẩn hoá âm lượng, chèn khoảng nghỉ
+    POSTPROCESS = True
+
+    # Xử lý theo block cố định: bộ nhớ phụ thuộc block, không phụ thuộc độ dài story
+    BLOCK_SECONDS = 1.0
+    # Độ phân giải khi phát hiện khoảng lặng
+    FRAME_SECONDS = 0.01
+
+    # Frame có RMS dưới ngưỡng này được coi là im lặng
+    SILENCE_DBFS = -45.0
+    # Khoảng lặng giữ lại ở đầu/cuối mỗi phần
+    KEEP_SILENCE_SECONDS = 0.1
+    # Khoảng lặng bên trong dài hơn sẽ được rút ngắn còn chừng này
+    MAX_SILENCE_SECONDS = 1.5
+    # Khoảng nghỉ chèn sau mỗi phần (trừ phần cuối)
+    PAUSE_SECONDS = 0.6
+
+    # Loudness: AGC một lượt, đưa RMS của giọng nói về mức mục tiêu
+    TARGET_DBFS = -20.0
+    MAX_GAIN_DB = 12.0
+    AGC_SECONDS = 3.0   # hằng số thời gian khi giọng nhỏ đi
+    AGC_ATTACK_SECONDS = 0.5   # ... và khi giọng to lên
+    PEAK_DBFS = -1.0
+
+    # Encode lại đúng một lần; mọi phần cùng tham số nên vẫn stream-merge được
+    BITRATE = "128k"
+
+    # Số phần được hậu kỳ song song (chạy chồng lên TTS của các phần khác)
+    WORKERS = 4
@@ -0,0 +1,15 @@
+class DaemonConfig:
+    # Hàng đợi job (SQLite), giữ nguyên qua các lần restart daemon
+    QUEUE_PATH = "cache/jobs.sqlite3"
+
+    # HTTP interface chỉ nghe trên localhost
+    HOST = "127.0.0.1"
+    PORT = 8765
+
+    # Số story chạy đồng thời
+    CONCURRENCY = 2
+
+    # Worker rảnh chờ tối đa bao lâu (giây) trước khi kiểm tra lại queue
+    POLL_INTERVAL = 5.0
+
+    DEFAULT_BACKGROUND = "assets/background.jpg"
@@ -0,0 +1,12 @@
+class OutputConfig:
+    OUTPUT_DIR = "output"
+
+    # Retention policy applied after each story is merged:
+    # "finals": chỉ giữ complete_story.mp4/.mp3 và metadata
+    # "cache": giữ segment audio/video để build lại từng phần, chỉ xoá bản segment đã chuẩn hoá khi merge re-encode
+    # "all": giữ mọi artifact trung gian
+    RETENTION = "cache"
+    RETENTION_POLICIES = ("finals", "cache", "all")
+
+    # Garbage collector (python -m src gc)
+    GC_MAX_BYTES = 50 * 1024 ** 3
@@ -6,9 +6,32 @@ class TTSConfig:
 
     # Audio settings
     AUDIO_FORMAT = "mp3"
+    # "stream" joins MP3 frames directly when possible, "reencode" always re-encodes
+    MERGE_MODE = "stream"
+    # Ghi thẳng response vào file segment theo từng buffer, không qua file tạm
+    STREAM_RESPONSES = True
+    STREAM_BUFFER_SIZE = 64 * 1024
 
     # Retry settings
     MAX_RETRIES = 3
     RETRY_MIN_WAIT = 4
     RETRY_MAX_WAIT = 10
     RETRY_MULTIPLIER = 1
+
+    # Cache settings
+    CACHE_ENABLED = True
+    CACHE_DIR = "cache/tts"
+    CACHE_MAX_BYTES = 2 * 1024 ** 3  # 2 GB
+
+    # Concurrency settings
+    MAX_CONCURRENCY = 4  # Number of TTS requests in flight at once
+    # "threads": một thread cho mỗi request; "async": asyncio backend với rate limit thích ứng
+    BACKEND = "threads"
+
+    # Async backend: quota của tài khoản và giới hạn concurrency thích ứng
+    REQUESTS_PER_MINUTE = 50
+    CHARS_PER_MINUTE = None  # None = không giới hạn
+    ASYNC_MIN_CONCURRENCY = 1
+    ASYNC_MAX_CONCURRENCY = 32
+    RATE_LIMIT_MAX_RETRIES = 8
+    REQUEST_TIMEOUT = 120
@@ -0,0 +1,183 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+import json
+import threading
+from .config.daemon_config import DaemonConfig
+from .services.job_queue import JobQueue
+from .utils.logger import Logger
+from .utils.performance_monitor import PerformanceMonitor
+
+
+class StoryDaemon:
+    """
+    Long-running worker that processes stories from a persistent JobQueue.
+
+    One StoryVideoGenerator is built up front and shared by every job, so
+    the Docs credentials and discovery client, the OpenAI client and its
+    connection pool, the TTS cache and the logging sinks stay warm between
+    stories. `concurrency` worker threads claim jobs by priority, and a
+    small HTTP server on localhost accepts new jobs and reports status:
+
+        POST /jobs      {"doc_id", "background"?, "priority"?, "resume"?}
+        GET  /jobs      ?status=queued|running|done|failed
+        GET  /jobs/<id>
+        GET  /health
+    """
+
+    def __init__(self, generator=None, queue: Optional[JobQueue] = None, concurrency: int = None,
+                 host: str = None, port: int = None, default_background: str = None):
+        self.logger = Logger(__name__)
+        if generator is None:
+            from .main import StoryVideoGenerator
+            generator = StoryVideoGenerator()
+        self.generator = generator
+        self.queue = queue or JobQueue(DaemonConfig.QUEUE_PATH)
+        self.concurrency = max(1, concurrency or DaemonConfig.CONCURRENCY)
+        # Mỗi worker có thể đang render một story: chia CPU cho render pool của từng story
+        self.generator.video_processor.concurrent_jobs = self.concurrency
+        self.default_background = default_background or DaemonConfig.DEFAULT_BACKGROUND
+        self.performance = PerformanceMonitor.shared()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._active_lock = threading.Lock()
+        self._active = 0
+        self._workers = []
+        self._server = ThreadingHTTPServer(
+            (host or DaemonConfig.HOST, DaemonConfig.PORT if port is None else port), self._make_handler()
+        )
+        self._server.daemon_threads = True
+        self._server_thread = None
+
+    @property
+    def address(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def submit(self, doc_id: str, background: str = None, priority: int = 0, resume: bool = False) -> int:
+        from .utils.validation_helper import ValidationHelper
+        ValidationHelper().validate_google_doc_id(doc_id)
+        job_id = self.queue.submit(doc_id, background or self.default_background, priority, resume)
+        self.logger.info(f"Queued job {job_id} for {doc_id} (priority {priority})")
+        self._wakeup.set()
+        return job_id
+
+    def start(self) -> "StoryDaemon":
+        self.queue.recover()
+        self._workers = [
+            threading.Thread(target=self._work, name=f"daemon-worker-{i}", daemon=True)
+            for i in range(self.concurrency)
+        ]
+        for worker in self._workers:
+            worker.start()
+        self._server_thread = threading.Thread(target=self._server.serve_forever, name="daemon-http", daemon=True)
+        self._server_thread.start()
+        self.logger.info(f"Daemon listening on {self.address} with {self.concurrency} workers")
+        return self
+
+    def serve_forever(self) -> None:
+        """Start and block until interrupted (Ctrl+C / SIGINT)"""
+        self.start()
+        try:
+            while not self._stopping.wait(1.0):
+                pass
+        except KeyboardInterrupt:
+            self.logger.info("Interrupted, finishing running jobs")
+        finally:
+            self.stop()
+
+    def stop(self) -> None:
+        """Stop accepting work and wait for running jobs to finish"""
+        self._stopping.set()
+        self._wakeup.set()
+        self._server.shutdown()
+        self._server.server_close()
+        for worker in self._workers:
+            worker.join()
+        if self.generator.tts_backend is not None:
+            self.generator.tts_backend.close()
+        self.queue.close()
+
+    def health(self) -> dict:
+        with self._active_lock:
+            active = self._active
+        return {"workers": self.concurrency, "active": active, "jobs": self.queue.counts()}
+
+    def _work(self) -> None:
+        while not self._stopping.is_set():
+            job = self.queue.claim()
+            if job is None:
+                # Chờ job mới (submit đánh thức ngay) hoặc tới lượt poll tiếp theo
+                self._wakeup.wait(DaemonConfig.POLL_INTERVAL)
+                self._wakeup.clear()
+                continue
+            self._run_job(job)
+
+    def _run_job(self, job: dict) -> None:
+        with self._active_lock:
+            self._active += 1
+        self.logger.info(f"Starting job {job['id']} for {job['doc_id']}")
+        span = None
+        try:
+            with self.performance.measure_time("Story job", job=job["id"]) as span:
+                video = self.generator.process_story(job["doc_id"], job["background"], resume=job["resume"])
+            self.queue.complete(job["id"], video)
+            self.logger.info(f"Job {job['id']} done: {video}")
+        except Exception as e:
+            self.queue.fail(job["id"], str(e))
+            self.logger.error(f"Job {job['id']} failed: {str(e)}")
+        finally:
+            # Monitor dùng chung: story đã export span của nó, bỏ đi để không tích luỹ mãi
+            if span is not None:
+                self.performance.discard(span)
+            with self._active_lock:
+                self._active -= 1
+            # Job cùng doc_id có thể đang chờ job này xong
+            self._wakeup.set()
+
+    def _make_handler(self):
+        daemon = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                parts = url.path.strip("/").split("/")
+                if parts == ["health"]:
+                    return self._send(200, daemon.health())
+                if parts == ["jobs"]:
+                    status = parse_qs(url.query).get("status", [None])[0]
+                    if status is not None and status not in JobQueue.STATUSES:
+                        return self._send(400, {"error": f"Unknown status: {status}"})
+                    return self._send(200, {"jobs": daemon.queue.list(status)})
+                if len(parts) == 2 and parts[0] == "jobs" and parts[1].isdigit():
+                    job = daemon.queue.get(int(parts[1]))
+                    return self._send(200, job) if job else self._send(404, {"error": "Job not found"})
+                self._send(404, {"error": "Not found"})
+
+            def do_POST(self):
+                if urlparse(self.path).path.strip("/") != "jobs":
+                    return self._send(404, {"error": "Not found"})
+                try:
+                    length = int(self.headers.get("Content-Length", 0))
+                    body = json.loads(self.rfile.read(length) or b"{}")
+                    job_id = daemon.submit(
+                        body["doc_id"], body.get("background"),
+                        int(body.get("priority", 0)), bool(body.get("resume", False)),
+                    )
+                except (KeyError, ValueError, TypeError) as e:
+                    return self._send(400, {"error": f"Invalid job: {e}"})
+                self._send(201, daemon.queue.get(job_id))
+
+            def _send(self, status, payload):
+                body = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                if daemon.logger.debug_enabled:
+                    daemon.logger.debug("HTTP {}", format % args)
+
+        return Handler
@@ -1,114 +1,458 @@
+from concurrent.futures import ThreadPoolExecutor
+import functools
 import os
+import queue
+import threading
+import time
 from dotenv import load_dotenv
+from .services.audio_postprocessor import AudioPostProcessor
 from .services.google_docs_service import GoogleDocsService
 from .services.text_processor import TextProcessor
 from .services.tts_service import TTSService
+from .services.tts_processor import TTSProcessor
+from .services.build_manifest import BuildManifest
+from .services.retention import RetentionPolicy
 from .services.video_processor import VideoProcessor
+from .config.audio_config import AudioConfig
+from .config.output_config import OutputConfig
+from .config.tts_config import TTSConfig
 from .utils.logger import Logger
 from .utils.validation_helper import ValidationHelper
 from .utils.performance_monitor import PerformanceMonitor
 from .utils.file_helper import FileHelper
 
 
+class StoryJob:
+    """State of one document as it moves through the pipeline stages"""
+
+    def __init__(self, doc_id: str, background_image: str, resume: bool = False):
+        self.doc_id = doc_id
+        self.background_image = background_image
+        self.resume = resume
+        self.content = None
+        self.source = None
+        self.story_dir = None
+        self.manifest = None
+        self.chunks = []
+        self.audio_files = []
+        self.video_segments = []
+        self.final_video = None
+
+
 class StoryVideoGenerator:
-    def __init__(self):
+    # Các stage của pipeline, theo thứ tự; BatchRunner chạy mỗi stage trên một pool riêng
+    STAGES = ("fetch", "chunk", "tts", "render", "merge")
+    # Chế độ streaming: render từng segment ngay khi audio của nó xong
+    STREAMING_STAGES = ("fetch", "chunk", "stream", "merge")
+    STREAM_QUEUE_SIZE = 4
+    # Text của run đang chạy dở, để resume không phải fetch lại document
+    SOURCE_FILENAME = "source.txt"
+
+    def __init__(self, streaming: bool = False, render_workers: int = 2,
+                 google_docs=None, tts_service=None, video_processor=None,
+                 save_text: bool = None, retention: str = None):
         # Load environment variables
         load_dotenv()
 
         self.logger = Logger(__name__)
         self.validator = ValidationHelper()
-        self.performance = PerformanceMonitor()
+        self.performance = PerformanceMonitor.shared()
 
-        # Initialize services
-        self.google_docs = GoogleDocsService()
+        # Initialize services (callers may pass pre-built or stand-in services)
+        self.google_docs = google_docs or GoogleDocsService()
         self.text_processor = TextProcessor("output")
-        self.tts_service = TTSService(os.getenv("OPENAI_API_KEY"), "output")
-        self.video_processor = VideoProcessor("output")
+        self.tts_service = tts_service or TTSService(os.getenv("OPENAI_API_KEY"), "output")
+        self.tts_backend = None
+        if TTSConfig.BACKEND == "async":
+            from .services.async_tts_backend import AsyncTTSBackend
+            # Một event loop + một client dùng chung cho mọi story của generator
+            self.tts_backend = AsyncTTSBackend(os.getenv("OPENAI_API_KEY"), cache=self.tts_service.cache,
+                                              config=self.tts_service.config)
+        self.tts_processor = TTSProcessor(self.tts_service, backend=self.tts_backend)
+        # Hậu kỳ audio (cắt khoảng lặng, chuẩn hoá loudness, khoảng nghỉ) giữa TTS và merge
+        self.audio_post = AudioPostProcessor() if AudioConfig.POSTPROCESS else None
+        self.video_processor = video_processor or VideoProcessor("output")
         self.file_helper = FileHelper()
+        self.streaming = streaming
+        self.render_workers = render_workers
+        self.retention = RetentionPolicy(retention or OutputConfig.RETENTION)
+        # Ghi partNNN.txt ra đĩa chỉ để debug (mặc định theo biến môi trường SAVE_TEXT_CHUNKS)
+        if save_text is None:
+            save_text = os.getenv("SAVE_TEXT_CHUNKS", "").lower() in ("1", "true", "yes")
+        self.save_text = save_text
 
-    def process_story(self, doc_id: str, background_image: str) -> str:
+    @property
+    def stages(self):
+        return self.STREAMING_STAGES if self.streaming else self.STAGES
+
+    def process_story(self, doc_id: str, background_image: str, resume: bool = False) -> str:
         """
-        Process complete story from Google Doc to final video
+        Process complete story from Google Doc to final video.
+        resume=True continues an interrupted run from its checkpoint: the
+        text saved by that run is reused instead of re-fetching the document,
+        and every part and segment it finished is skipped.
         """
         try:
-            # Validate inputs
-            self.validator.validate_google_doc_id(doc_id)
-            self.validator.validate_files_exist([background_image])
-
-            with self.performance.measure_time("Complete story processing"):
-                # Get document content
-                with self.performance.measure_time("Fetching document"):
-                    content = self.google_docs.get_document(doc_id)
-                    self.validator.validate_text_content(content)
-
-                # Process text into chunks
-                with self.performance.measure_time("Processing text"):
-                    story_name = self.file_helper.clean_filename(f"story_{doc_id}")
-                    text_files = self.text_processor.process_text(content, story_name)
-
-                # Generate audio files
-                with self.performance.measure_time("Generating audio"):
-                    audio_segments_dir = os.path.join("output", story_name, "segments")
-                    audio_final_dir = os.path.join("output", story_name, "final")
-
-                    # Ensure directories exist
-                    os.makedirs(audio_segments_dir, exist_ok=True)
-                    os.makedirs(audio_final_dir, exist_ok=True)
-
-                    audio_files = []
-                    for i, text_file in enumerate(text_files, 1):
-                        # Save segment audio to segments folder
-                        segment_audio = os.path.join(
-                            audio_segments_dir, f"part{i:03d}.mp3"
-                        )
-                        self.tts_service.generate_audio(text_file, segment_audio)
-                        audio_files.append(segment_audio)
-
-                    # Merge all audio segments into final audio
-                    final_audio = os.path.join(audio_final_dir, "complete_story.mp3")
-                    self.tts_service.merge_audio_files(audio_files, final_audio)
-
-                # Create necessary directories
-                story_dir = os.path.join("output", f"story_{doc_id}")
-                text_dir = os.path.join(story_dir, "text")
-                audio_dir = os.path.join(story_dir, "audio")
-                segments_dir = os.path.join(story_dir, "segments")
-                final_dir = os.path.join(story_dir, "final")
-
-                self.file_helper.ensure_dir(text_dir)
-                self.file_helper.ensure_dir(audio_dir)
-                self.file_helper.ensure_dir(segments_dir)
-                self.file_helper.ensure_dir(final_dir)
-
-                # Create final video
-                with self.performance.measure_time("Creating video"):
-                    final_video = self.video_processor.create_video(
-                        [final_audio], background_image, story_name
-                    )
-
-                # Validate output
-                self.validator.validate_output_structure(
-                    os.path.join("output", story_name)
-                )
-                self.validator.validate_video_output(final_video)
+            with self.performance.measure_time("Complete story processing") as root:
+                job = self.prepare_job(doc_id, background_image, resume)
+                for stage in self.stages:
+                    if job.final_video is not None:
+                        break
+                    self.run_stage(stage, job)
 
-                # Generate performance report
-                self.logger.info(self.performance.generate_report())
+            # Generate performance report: chỉ các span của lần gọi này, monitor có thể đang dùng chung
+            self.logger.info(self.performance.generate_report(root))
+            if job.story_dir:
+                self.performance.export_json(os.path.join(job.story_dir, "performance.json"), root)
+                self.performance.export_chrome_trace(os.path.join(job.story_dir, "trace.json"), root)
+                if self.performance.profiling:
+                    self.performance.export_profile(os.path.join(job.story_dir, "profile.json"), root)
 
-                self.logger.info(f"Video creation completed: {final_video}")
-                return final_video
+            self.logger.info(f"Video creation completed: {job.final_video}")
+            return job.final_video
 
         except Exception as e:
             self.logger.error(f"Failed to process story: {str(e)}")
             raise
 
+    def prepare_job(self, doc_id: str, background_image: str, resume: bool = False) -> "StoryJob":
+        # Validate inputs
+        self.validator.validate_google_doc_id(doc_id)
+        self.validator.validate_files_exist([background_image])
+        return StoryJob(doc_id, background_image, resume)
+
+    def run_stage(self, stage: str, job: "StoryJob") -> "StoryJob":
+        """Run a single pipeline stage for job and return it, checkpointing the stage"""
+        job = getattr(self, f"_stage_{stage}")(job)
+        checkpoint = job.manifest.get_meta("checkpoint") if job.manifest is not None else None
+        if checkpoint is not None:
+            checkpoint["stage"] = stage
+            job.manifest.set_meta("checkpoint", checkpoint)
+            job.manifest.save()
+        return job
+
+    def _stage_fetch(self, job):
+        story_name = self.file_helper.clean_filename(f"story_{job.doc_id}")
+        job.story_dir = os.path.join(OutputConfig.OUTPUT_DIR, story_name)
+        job.manifest = BuildManifest(job.story_dir)
+        # Garbage collector dọn các story ít dùng nhất trước
+        job.manifest.set_meta("last_used", time.time())
+        background = job.manifest.hash_file(job.background_image)
+        source_path = os.path.join(job.story_dir, self.SOURCE_FILENAME)
+
+        checkpoint = job.manifest.get_meta("checkpoint")
+        if (job.resume and checkpoint and checkpoint["source"]["background"] == background
+                and os.path.exists(source_path)):
+            # Tiếp tục run bị gián đoạn: dùng đúng bản text của run đó, không fetch lại
+            job.content = self.file_helper.read_text(source_path)
+            job.source = checkpoint["source"]
+            self.logger.info(
+                f"Resuming {job.doc_id} at revision {job.source['revision_id']} "
+                f"after stage '{checkpoint['stage']}'"
+            )
+            return job
+        if job.resume:
+            self.logger.info(f"No checkpoint to resume for {job.doc_id}, starting a full run")
+
+        # Get document content
+        with self.performance.measure_time("Fetching document"):
+            document = self.google_docs.fetch_document(job.doc_id)
+            job.content = document["text"]
+            self.validator.validate_text_content(job.content)
+
+        # Same document revision, background and build settings as the last build: nothing to redo
+        job.source = {
+            "revision_id": document["revision_id"],
+            "background": background,
+            "settings": self._build_settings(),
+        }
+        if (job.source["revision_id"] and job.manifest.get_meta("source") == job.source
+                and job.manifest.is_built("video:final")):
+            job.final_video = os.path.join(
+                job.story_dir, job.manifest.get("video:final")["path"]
+            )
+            self.logger.info(
+                f"Revision {job.source['revision_id']} already rendered, reusing {job.final_video}"
+            )
+            job.manifest.save()
+            return job
+
+        # Checkpoint của run này: text đã fetch + stage cuối cùng đã xong
+        self.file_helper.ensure_dir(job.story_dir)
+        self.file_helper.save_text(source_path, job.content)
+        job.manifest.set_meta("checkpoint", {"source": job.source, "stage": "fetch"})
+        job.manifest.save()
+        return job
+
+    def _build_settings(self):
+        """Every setting that changes the rendered output, so changing one invalidates the revision shortcut"""
+        return {
+            "max_chars": self.text_processor.config.MAX_CHARS,
+            "tts": self._tts_settings(),
+            "post": self.audio_post.settings() if self.audio_post is not None else None,
+            "pause": AudioConfig.PAUSE_SECONDS,
+            "video": {**self.video_processor.render_settings(), "merge_mode": self.video_processor.merge_mode},
+        }
+
+    def _tts_settings(self):
+        return {
+            "model": self.tts_service.config.MODEL,
+            "voice": self.tts_service.config.VOICE,
+            "format": self.tts_service.config.AUDIO_FORMAT,
+        }
+
+    def _stage_chunk(self, job):
+        # Process text into chunks
+        with self.performance.measure_time("Processing text"):
+            job.chunks = self.text_processor.build_chunks(job.content)
+            if self.save_text:
+                self.text_processor.save_chunks_async(
+                    job.chunks, os.path.join(job.story_dir, "text")
+                )
+        return job
+
+    def _stage_tts(self, job):
+        # Generate audio files
+        with self.performance.measure_time("Generating audio"):
+            audio_segments_dir = os.path.join(job.story_dir, "segments")
+
+            # Ensure directories exist
+            os.makedirs(audio_segments_dir, exist_ok=True)
+
+            job.audio_files = self._generate_audio(
+                job.chunks, audio_segments_dir, job.manifest
+            )
+            job.manifest.save()
+        return job
+
+    def _stage_stream(self, job):
+        """
+        Generate audio and render video segments concurrently: each part is
+        post-processed on a pool as soon as its mp3 lands and then handed to
+        the render workers through a bounded queue, so TTS latency,
+        post-processing and encode time overlap.
+        """
+        manifest = job.manifest
+        with self.performance.measure_time("Generating audio and video"):
+            segments_dir = os.path.join(job.story_dir, "segments")
+            os.makedirs(segments_dir, exist_ok=True)
+
+            job.audio_files, tts_jobs, pending = self._plan_audio(
+                job.chunks, segments_dir, manifest
+            )
+            segment_settings = self.video_processor.segment_settings(job.background_image, manifest)
+            job.video_segments = [None] * len(job.audio_files)
+            ready = queue.Queue(maxsize=self.STREAM_QUEUE_SIZE)
+            errors = []
+            parent = self.performance.current_span()
+
+            def render_worker():
+                with self.performance.adopt(parent):
+                    render_loop()
+
+            def render_loop():
+                while True:
+                    index = ready.get()
+                    if index is None:
+                        return
+                    if errors:
+                        # Đã có lỗi: chỉ rút hết queue để producer không bị chặn
+                        continue
+                    try:
+                        job.video_segments[index] = self.video_processor.render_segment(
+                            job.audio_files[index], job.background_image, segments_dir,
+                            manifest, segment_settings
+                        )
+                    except Exception as e:
+                        errors.append(e)
+
+            workers = [
+                threading.Thread(target=render_worker, name=f"render-{i}", daemon=True)
+                for i in range(self.render_workers)
+            ]
+            for worker in workers:
+                worker.start()
+
+            def part_finished(index, future):
+                # Chạy trên thread hậu kỳ: lỗi được gom vào errors, phần xong thì đưa đi render
+                error = future.exception()
+                if error is not None:
+                    errors.append(error)
+                else:
+                    ready.put(index)
+
+            post_pool = ThreadPoolExecutor(max_workers=AudioConfig.WORKERS, thread_name_prefix="audio-post")
+            completed = self.tts_processor.iter_completed(tts_jobs)
+            try:
+                # Các phần không đổi đã có audio, đưa đi render ngay
+                regenerating = {index for index, _, _ in pending}
+                for index in range(len(job.audio_files)):
+                    if index not in regenerating:
+                        ready.put(index)
+
+                for job_index, segment_audio in completed:
+                    index, key, inputs = pending[job_index]
+                    future = post_pool.submit(self._finish_part, segment_audio, key, inputs, manifest, parent)
+                    future.add_done_callback(functools.partial(part_finished, index))
+                    if errors:
+                        break
+            except Exception as e:
+                errors.append(e)
+            finally:
+                completed.close()
+                # Chờ các phần đang hậu kỳ đưa xong vào queue trước khi báo render worker dừng
+                post_pool.shutdown(wait=True)
+                for _ in workers:
+                    ready.put(None)
+                for worker in workers:
+                    worker.join()
+
+            manifest.save()
+            if errors:
+                raise errors[0]
+
+        if self.tts_service.cache is not None:
+            self.logger.info(f"TTS cache stats: {self.tts_service.cache.stats()}")
+        return job
+
+    def _stage_render(self, job):
+        # Create video segments (render_segments creates story_dir/segments)
+        with self.performance.measure_time("Creating video"):
+            job.video_segments = self.video_processor.render_segments(
+                job.audio_files, job.background_image, job.story_dir, job.manifest
+            )
+            job.manifest.save()
+        return job
+
+    def _stage_merge(self, job):
+        manifest = job.manifest
+        with self.performance.measure_time("Merging outputs"):
+            # Merge all audio segments into final audio, only if a part changed
+            audio_final_dir = os.path.join(job.story_dir, "final")
+            os.makedirs(audio_final_dir, exist_ok=True)
+            final_audio = os.path.join(audio_final_dir, "complete_story.mp3")
+            merge_inputs = {"parts": [manifest.hash_of(path) for path in job.audio_files]}
+            if manifest.is_fresh("audio:final", merge_inputs):
+                self.logger.info("Final audio is up to date, skipping merge")
+            else:
+                self.tts_service.merge_audio_files(job.audio_files, final_audio)
+                manifest.record("audio:final", final_audio, merge_inputs)
+
+            # Merge video segments into the final video
+            final_video = self.video_processor.finalize_video(
+                job.video_segments, job.audio_files, job.story_dir, manifest
+            )
+
+        part_count = len(job.chunks)
+        # Story ngắn đi: xoá luôn file của các phần không còn tồn tại
+        stale_files = manifest.prune(
+            [f"audio:part{i:03d}" for i in range(1, part_count + 1)]
+            + [f"video:part{i:03d}" for i in range(1, part_count + 1)]
+            + [f"video:norm:part{i:03d}" for i in range(1, part_count + 1)]
+            + ["audio:final", "video:final"]
+        )
+        for path in stale_files:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        if stale_files:
+            self.logger.info(f"Removed {len(stale_files)} artifacts of parts no longer in the story")
+        manifest.save()
+
+        # Validate output
+        self.validator.validate_output_structure(job.story_dir)
+        self.validator.validate_video_output(final_video)
+        self._validate_duration(final_video, job.audio_files, manifest)
+
+        # Chỉ đánh dấu revision là đã render khi video đã qua validation
+        manifest.set_meta("source", job.source)
+        # Story đã xong: không còn gì để resume
+        manifest.set_meta("checkpoint", None)
+        manifest.save()
+        source_path = os.path.join(job.story_dir, self.SOURCE_FILENAME)
+        if os.path.exists(source_path):
+            os.remove(source_path)
+
+        # Dọn artifact trung gian theo retention policy
+        self.retention.apply(manifest)
+        manifest.save()
+
+        job.final_video = final_video
+        return job
+
+    def _validate_duration(self, final_video, audio_files, manifest):
+        """Compare the final video's duration with its audio parts, all read from the media index"""
+        video_info = manifest.media_of(final_video)
+        audio_infos = [manifest.media_of(path) for path in audio_files]
+        if video_info is None or None in audio_infos:
+            self.logger.warning(f"No media metadata for {final_video}, skipping duration check")
+            return
+        expected = sum(info["duration"] for info in audio_infos)
+        # Mỗi segment có thể lệch một frame audio/video khi mux
+        tolerance = 1.0 + 0.05 * len(audio_files)
+        self.validator.validate_media_duration(final_video, video_info["duration"], expected, tolerance)
+
+    def _generate_audio(self, chunks, segments_dir, manifest):
+        """
+        Generate (and post-process) partNNN.mp3 for every chunk whose text,
+        TTS or post-processing settings changed since the last run, and
+        return all part paths in order
+        """
+        audio_files, tts_jobs, pending = self._plan_audio(
+            chunks, segments_dir, manifest
+        )
+        # Hậu kỳ từng phần ngay khi TTS của nó xong, chồng lên các request còn lại
+        parent = self.performance.current_span()
+        with ThreadPoolExecutor(max_workers=AudioConfig.WORKERS, thread_name_prefix="audio-post") as pool:
+            futures = [
+                pool.submit(self._finish_part, segment_audio, *pending[job_index][1:], manifest, parent)
+                for job_index, segment_audio in self.tts_processor.iter_completed(tts_jobs)
+            ]
+            for future in futures:
+                future.result()
+
+        if self.tts_service.cache is not None:
+            self.logger.info(f"TTS cache stats: {self.tts_service.cache.stats()}")
+        return audio_files
+
+    def _plan_audio(self, chunks, segments_dir, manifest):
+        """
+        Return (audio_files, tts_jobs, pending): every part path in order, the
+        (chunk, output_file) jobs for parts that must be regenerated, and
+        (part index, manifest key, inputs) for each of those jobs
+        """
+        tts_settings = self._tts_settings()
+        post_settings = self.audio_post.settings() if self.audio_post is not None else None
+        audio_files = []
+        tts_jobs = []
+        pending = []
+        for chunk in chunks:
+            # Save segment audio to segments folder, one slot per text part
+            segment_audio = os.path.join(segments_dir, f"part{chunk.index:03d}.mp3")
+            key = f"audio:part{chunk.index:03d}"
+            inputs = {"text": chunk.hash, **tts_settings}
+            if post_settings is not None:
+                # Khoảng nghỉ chỉ nằm giữa các phần, phần cuối không có
+                pause = 0.0 if chunk.index == len(chunks) else AudioConfig.PAUSE_SECONDS
+                inputs["post"] = {**post_settings, "pause": pause}
+            audio_files.append(segment_audio)
+            if not manifest.is_fresh(key, inputs):
+                tts_jobs.append((chunk, segment_audio))
+                pending.append((chunk.index - 1, key, inputs))
+
+        self.logger.info(f"Generating audio for {len(tts_jobs)}/{len(chunks)} changed parts")
+        return audio_files, tts_jobs, pending
+
+    def _finish_part(self, segment_audio, key, inputs, manifest, parent=None):
+        """Post-process a freshly generated part and record it in the manifest; parent is the submitter's span"""
+        if self.audio_post is not None:
+            with self.performance.adopt(parent), self.performance.measure_time("Post-processing audio"):
+                self.audio_post.process(segment_audio, inputs["post"]["pause"])
+        manifest.record(key, segment_audio, inputs)
+        return segment_audio
 
-# Example usage
-# Extract doc_id from the URL
-doc_id = "1_kOONJi4xRDPoTk-5LSD6R_dGULuZM7lUg9xM1XIv3k"
 
-generator = StoryVideoGenerator()
-video_path = generator.process_story(
-    doc_id=doc_id, background_image="assets/background.jpg"
-)
-print(f"Video generated successfully: {video_path}")
+if __name__ == "__main__":
+    from .cli import main
+    raise SystemExit(main())
@@ -0,0 +1,262 @@
+from concurrent.futures import Future
+from typing import Optional
+import asyncio
+import os
+import threading
+import uuid
+from openai import AsyncOpenAI, APIConnectionError, APIStatusError, APITimeoutError, RateLimitError
+from src.config.tts_config import TTSConfig
+from src.services.audio_merger import AudioMerger
+from src.services.text_chunker import TextChunker
+from src.services.tts_cache import TTSCache
+from src.utils.file_helper import FileHelper
+from src.utils.logger import Logger
+from src.utils.mp3_helper import Mp3StreamWriter
+
+
+class TokenBucket:
+    """Continuous-refill token bucket, e.g. for requests or characters per minute"""
+
+    def __init__(self, per_minute: float, capacity: Optional[float] = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self.tokens = self.capacity
+        self._updated = None
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, amount: float = 1) -> None:
+        # Một request lớn hơn cả bucket vẫn được đi khi bucket đầy
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            while True:
+                now = loop.time()
+                if self._updated is not None:
+                    self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD concurrency limit: halves on a 429 and pauses for Retry-After, then
+    grows by one after each full window of successful requests.
+    """
+
+    def __init__(self, initial: int, minimum: int, maximum: int):
+        self.limit = max(minimum, min(initial, maximum))
+        self.minimum = minimum
+        self.maximum = maximum
+        self.in_flight = 0
+        self._successes = 0
+        self._resume_at = 0.0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self) -> None:
+        loop = asyncio.get_running_loop()
+        async with self._condition:
+            while True:
+                pause = self._resume_at - loop.time()
+                if pause > 0:
+                    try:
+                        await asyncio.wait_for(self._condition.wait(), pause)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                if self.in_flight < self.limit:
+                    break
+                await self._condition.wait()
+            self.in_flight += 1
+
+    async def release(self, throttled: bool = False, retry_after: Optional[float] = None) -> None:
+        loop = asyncio.get_running_loop()
+        async with self._condition:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(self.minimum, self.limit // 2)
+                self._successes = 0
+                if retry_after:
+                    self._resume_at = max(self._resume_at, loop.time() + retry_after)
+            else:
+                self._successes += 1
+                if self._successes >= self.limit and self.limit < self.maximum:
+                    self.limit += 1
+                    self._successes = 0
+            self._condition.notify_all()
+
+
+class AsyncTTSBackend:
+    """
+    asyncio TTS backend running on its own event-loop thread.
+
+    All requests share one AsyncOpenAI client (and so one pooled HTTP
+    connection pool), pass through request- and character-per-minute token
+    buckets, and are admitted by an adaptive concurrency limit that backs
+    off on 429 / Retry-After and ramps back up on success. Synchronous
+    callers use `submit`, which returns a concurrent.futures.Future.
+    """
+
+    def __init__(self, api_key: str, cache: Optional[TTSCache] = None, config: TTSConfig = None):
+        self.logger = Logger(__name__)
+        self.config = config or TTSConfig()
+        self.cache = cache
+        self.chunker = TextChunker(self.config.MAX_CHARS)
+        self.merger = AudioMerger()
+        self.client = AsyncOpenAI(
+            api_key=api_key,
+            max_retries=0,  # retry và backoff do backend tự xử lý
+            timeout=self.config.REQUEST_TIMEOUT,
+        )
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="tts-async", daemon=True)
+        self._thread.start()
+        self._limiters_ready = asyncio.run_coroutine_threadsafe(self._create_limiters(), self._loop)
+        self._limiters_ready.result()
+
+    async def _create_limiters(self):
+        self.concurrency = AdaptiveConcurrency(
+            self.config.MAX_CONCURRENCY,
+            self.config.ASYNC_MIN_CONCURRENCY,
+            self.config.ASYNC_MAX_CONCURRENCY,
+        )
+        self.request_bucket = TokenBucket(self.config.REQUESTS_PER_MINUTE) if self.config.REQUESTS_PER_MINUTE else None
+        self.char_bucket = TokenBucket(self.config.CHARS_PER_MINUTE) if self.config.CHARS_PER_MINUTE else None
+
+    def submit(self, text: str, output_file: str) -> Future:
+        """Schedule audio generation for text into output_file"""
+        return asyncio.run_coroutine_threadsafe(self.generate_audio(text, output_file), self._loop)
+
+    def close(self) -> None:
+        if self._loop.is_closed():
+            return
+        asyncio.run_coroutine_threadsafe(self.client.close(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    async def generate_audio(self, text: str, output_file: str) -> str:
+        """Synthesize text (split into API-sized chunks) into one MP3 file"""
+        os.makedirs(os.path.dirname(output_file) or ".", exist_ok=True)
+        chunks = self.chunker.chunks(text)
+        temp_output = f"{output_file}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(temp_output, 'wb') as out:
+                writer = Mp3StreamWriter(out)
+                for chunk in chunks:
+                    await self._write_chunk(chunk, writer)
+            os.replace(temp_output, output_file)
+        except ValueError as e:
+            # Các phần có tham số MP3 khác nhau, không nối frame trực tiếp được
+            self.logger.warning(f"Streaming write failed for {output_file}, merging parts instead: {str(e)}")
+            await self._merge_chunks(chunks, output_file)
+        finally:
+            if os.path.exists(temp_output):
+                os.remove(temp_output)
+
+        # Segment chỉ có một chunk: hardlink tới cache entry thay vì giữ hai bản
+        if self.cache is not None and len(chunks) == 1:
+            cached_file = self.cache.path_for(self.cache.make_key(chunks[0], self.config))
+            if os.path.exists(cached_file):
+                FileHelper.link_or_copy(cached_file, output_file)
+        return output_file
+
+    async def _merge_chunks(self, chunks: list, output_file: str) -> None:
+        """Write every chunk to its own file (finished chunks come from the cache) and merge them with ffmpeg"""
+        part_files = []
+        try:
+            for i, chunk in enumerate(chunks):
+                part_file = f"{output_file}.part{i}.{uuid.uuid4().hex}.tmp"
+                part_files.append(part_file)
+                with open(part_file, 'wb') as out:
+                    await self._write_chunk(chunk, Mp3StreamWriter(out))
+            # Merge chạy ffmpeg đồng bộ: đưa ra thread để không chặn event loop
+            await self._loop.run_in_executor(None, self.merger.merge, part_files, output_file)
+        finally:
+            for part_file in part_files:
+                if os.path.exists(part_file):
+                    os.remove(part_file)
+
+    async def _write_chunk(self, text: str, writer: Mp3StreamWriter) -> None:
+        buffer_size = self.config.STREAM_BUFFER_SIZE
+        key = None
+        if self.cache is not None:
+            key = self.cache.make_key(text, self.config)
+            cached_file = self.cache.get(key)
+            if cached_file is not None:
+                writer.begin_part()
+                with open(cached_file, 'rb') as f:
+                    for block in iter(lambda: f.read(buffer_size), b''):
+                        writer.write(block)
+                writer.end_part()
+                return
+
+        attempt = 0
+        while True:
+            attempt += 1
+            if self.request_bucket is not None:
+                await self.request_bucket.acquire(1)
+            if self.char_bucket is not None:
+                await self.char_bucket.acquire(len(text))
+            await self.concurrency.acquire()
+            writer.begin_part()
+            try:
+                await self._stream_request(text, writer, key)
+            except RateLimitError as e:
+                writer.abort_part()
+                retry_after = self._retry_after(e)
+                await self.concurrency.release(throttled=True, retry_after=retry_after)
+                self.logger.warning(
+                    f"TTS rate limited (attempt {attempt}), concurrency now {self.concurrency.limit}, "
+                    f"retrying after {retry_after:.1f}s"
+                )
+                if attempt >= self.config.RATE_LIMIT_MAX_RETRIES:
+                    raise
+                continue
+            except (APIConnectionError, APITimeoutError, APIStatusError) as e:
+                writer.abort_part()
+                await self.concurrency.release()
+                status = getattr(e, "status_code", None)
+                if (status is not None and status < 500) or attempt >= self.config.MAX_RETRIES:
+                    raise
+                wait = min(self.config.RETRY_MAX_WAIT, self.config.RETRY_MIN_WAIT * 2 ** (attempt - 1))
+                self.logger.warning(f"TTS request failed (attempt {attempt}): {str(e)}, retrying in {wait}s")
+                await asyncio.sleep(wait)
+                continue
+            except BaseException:
+                writer.abort_part()
+                await self.concurrency.release()
+                raise
+            await self.concurrency.release()
+            writer.end_part()
+            return
+
+    async def _stream_request(self, text: str, writer: Mp3StreamWriter, key: Optional[str]) -> None:
+        buffer_size = self.config.STREAM_BUFFER_SIZE
+        async with self.client.audio.speech.with_streaming_response.create(
+            model=self.config.MODEL,
+            voice=self.config.VOICE,
+            input=text
+        ) as response:
+            if key is None:
+                async for block in response.iter_bytes(buffer_size):
+                    writer.write(block)
+                return
+            with self.cache.writer(key) as cache_file, open(cache_file, 'wb') as f:
+                async for block in response.iter_bytes(buffer_size):
+                    f.write(block)
+                    writer.write(block)
+
+    def _retry_after(self, error: RateLimitError) -> float:
+        headers = getattr(error.response, "headers", None) or {}
+        for name, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+            value = headers.get(name)
+            if value is not None:
+                try:
+                    return max(0.0, float(value) * scale)
+                except ValueError:
+                    pass
+        return float(self.config.RETRY_MIN_WAIT)
@@ -0,0 +1,81 @@
+from typing import List
+import os
+import uuid
+from src.config.tts_config import TTSConfig
+from src.utils.ffmpeg_helper import run_ffmpeg, write_concat_list
+from src.utils.logger import Logger
+from src.utils.mp3_helper import scan_mp3
+
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+class AudioMerger:
+    """
+    Joins MP3 files without decoding them.
+
+    When every input shares the same MPEG version, layer, sample rate and
+    channel count, the audio frames are copied straight into the output with
+    tags and Xing/Info headers stripped. Otherwise the inputs are re-encoded
+    in a single streaming ffmpeg pass instead of being held in memory.
+    """
+
+    def __init__(self, mode: str = TTSConfig.MERGE_MODE, audio_format: str = TTSConfig.AUDIO_FORMAT):
+        self.logger = Logger(__name__)
+        self.mode = mode
+        self.audio_format = audio_format
+
+    def merge(self, audio_files: List[str], output_file: str) -> str:
+        output_dir = os.path.dirname(output_file)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+
+        temp_file = f"{output_file}.{uuid.uuid4().hex}.tmp"
+        try:
+            if self.mode == "stream" and self._try_stream_merge(audio_files, temp_file):
+                self.logger.debug("Stream-merged {} files into {}", len(audio_files), output_file)
+            else:
+                self._reencode_merge(audio_files, temp_file)
+                self.logger.debug("Re-encoded {} files into {}", len(audio_files), output_file)
+            os.replace(temp_file, output_file)
+        finally:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+        return output_file
+
+    def _try_stream_merge(self, audio_files: List[str], output_file: str) -> bool:
+        if self.audio_format != "mp3":
+            return False
+        try:
+            infos = [scan_mp3(path) for path in audio_files]
+        except ValueError as e:
+            self.logger.warning(f"Falling back to re-encode merge: {e}")
+            return False
+
+        params = {info.params for info in infos}
+        if len(params) > 1:
+            self.logger.warning(f"Falling back to re-encode merge: mixed codec parameters {sorted(params)}")
+            return False
+
+        with open(output_file, 'wb') as out:
+            for path, info in zip(audio_files, infos):
+                with open(path, 'rb') as f:
+                    f.seek(info.data_start)
+                    remaining = info.data_end - info.data_start
+                    while remaining > 0:
+                        buf = f.read(min(COPY_BUFFER_SIZE, remaining))
+                        if not buf:
+                            break
+                        out.write(buf)
+                        remaining -= len(buf)
+        return True
+
+    def _reencode_merge(self, audio_files: List[str], output_file: str) -> None:
+        list_file = write_concat_list(audio_files, f"{output_file}.txt")
+        try:
+            run_ffmpeg([
+                "-f", "concat", "-safe", "0", "-i", list_file,
+                "-vn", "-f", self.audio_format,
+                output_file,
+            ], logger=self.logger)
+        finally:
+            os.remove(list_file)
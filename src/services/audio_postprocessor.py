@@ -0,0 +1,204 @@
+from collections import deque
+from typing import Tuple
+import math
+import os
+import subprocess
+import uuid
+from src.config.audio_config import AudioConfig
+from src.utils.ffmpeg_helper import open_ffmpeg, run_ffmpeg, wait_ffmpeg
+from src.utils.logger import Logger
+from src.utils.media_info import probe_media
+
+
+class AudioPostProcessor:
+    """
+    Streaming clean-up of one TTS part: leading/trailing silence trimming,
+    loudness normalization and the pause that separates it from the next part.
+
+    The file is decoded once by ffmpeg into a pipe and read in fixed-size
+    float32 blocks; each block is analysed in ~10 ms frames with NumPy and
+    written straight to a second ffmpeg that encodes it once. Loudness is
+    levelled by a single-pass AGC: a running estimate of the speech RMS
+    (silent frames excluded) sets a gain toward TARGET_DBFS, ramped across
+    each block (reductions apply from the start of the block, which is
+    already in hand) and capped by MAX_GAIN_DB and a peak ceiling. Only one block
+    plus at most MAX_SILENCE_SECONDS of held-back silence is ever in memory.
+
+    The result replaces the input atomically (temp file + os.replace),
+    never in place, since the part may be hardlinked to the TTS cache.
+    """
+
+    def __init__(self, config=AudioConfig):
+        self.logger = Logger(__name__)
+        self.config = config
+
+    def settings(self) -> dict:
+        """Parameters that change the output, for build manifest inputs"""
+        config = self.config
+        return {
+            "silence_dbfs": config.SILENCE_DBFS,
+            "keep_silence": config.KEEP_SILENCE_SECONDS,
+            "max_silence": config.MAX_SILENCE_SECONDS,
+            "target_dbfs": config.TARGET_DBFS,
+            "max_gain_db": config.MAX_GAIN_DB,
+            "agc_seconds": config.AGC_SECONDS,
+            "agc_attack_seconds": config.AGC_ATTACK_SECONDS,
+            "peak_dbfs": config.PEAK_DBFS,
+            "bitrate": config.BITRATE,
+        }
+
+    def process(self, input_path: str, pause: float = 0.0, output_path: str = None) -> str:
+        """Clean up input_path, append `pause` seconds of silence and write output_path (default: input_path)"""
+        output_path = output_path or input_path
+        info = probe_media(input_path)
+        sample_rate, channels = info["sample_rate"], info["channels"] or 1
+        pcm = ["-f", "f32le", "-ar", str(sample_rate), "-ac", str(channels)]
+        temp_output = f"{output_path}.{uuid.uuid4().hex}.tmp"
+
+        decoder = open_ffmpeg(["-i", input_path, "-vn", *pcm, "pipe:1"], stdout=subprocess.PIPE, logger=self.logger)
+        encoder = None
+        try:
+            encoder = open_ffmpeg([
+                *pcm, "-i", "pipe:0",
+                "-c:a", "libmp3lame", "-b:a", self.config.BITRATE, "-f", "mp3",
+                temp_output,
+            ], stdin=subprocess.PIPE, logger=self.logger)
+            written, has_speech = self._run(decoder.stdout, encoder.stdin, sample_rate, channels, pause)
+            wait_ffmpeg(decoder)
+            wait_ffmpeg(encoder)
+            if not has_speech:
+                # Trim hết sẽ ra file rỗng: giữ nguyên âm thanh, chỉ encode lại và thêm khoảng nghỉ
+                self.logger.warning(f"No speech detected in {input_path}, keeping it untrimmed")
+                self._pad(input_path, temp_output, sample_rate, channels, pause)
+                written = round((info["duration"] + pause) * sample_rate)
+            os.replace(temp_output, output_path)
+        except BaseException:
+            for process in (decoder, encoder):
+                if process is not None and process.poll() is None:
+                    process.kill()
+                    process.wait()
+            raise
+        finally:
+            if os.path.exists(temp_output):
+                os.remove(temp_output)
+
+        self.logger.debug("Post-processed {}: {:.2f}s -> {:.2f}s", input_path, info["duration"],
+                          written / sample_rate)
+        return output_path
+
+    def _pad(self, input_path: str, output_path: str, sample_rate: int, channels: int, pause: float) -> None:
+        """Re-encode input_path unchanged, with the same parameters as processed parts, plus `pause` seconds"""
+        pad = ["-af", f"apad=pad_dur={pause}"] if pause > 0 else []
+        run_ffmpeg([
+            "-i", input_path, "-vn", *pad, "-ar", str(sample_rate), "-ac", str(channels),
+            "-c:a", "libmp3lame", "-b:a", self.config.BITRATE, "-f", "mp3",
+            output_path,
+        ], logger=self.logger)
+
+    def _run(self, source, sink, sample_rate: int, channels: int, pause: float) -> Tuple[int, bool]:
+        """Stream samples from source to sink; returns (sample frames written, whether any speech was found)"""
+        import numpy as np
+
+        config = self.config
+        frame_len = max(1, round(sample_rate * config.FRAME_SECONDS))
+        block_len = frame_len * max(1, round(config.BLOCK_SECONDS / config.FRAME_SECONDS))
+        block_bytes = block_len * channels * 4
+        threshold = 10 ** (config.SILENCE_DBFS / 20)
+        keep = round(config.KEEP_SILENCE_SECONDS * sample_rate)
+        max_gap = max(keep, round(config.MAX_SILENCE_SECONDS * sample_rate))
+        target = 10 ** (config.TARGET_DBFS / 20)
+        max_gain = 10 ** (config.MAX_GAIN_DB / 20)
+        peak = 10 ** (config.PEAK_DBFS / 20)
+        release = math.exp(-config.BLOCK_SECONDS / config.AGC_SECONDS)
+        attack = math.exp(-config.BLOCK_SECONDS / config.AGC_ATTACK_SECONDS)
+
+        pending = deque()       # khoảng lặng chưa biết là ở giữa hay ở cuối phần
+        pending_len = 0
+        speech_started = False
+        energy = None           # ước lượng mean-square của giọng nói
+        gain = None
+        written = 0
+
+        def emit(pieces, start_gain, end_gain):
+            nonlocal written
+            samples = np.concatenate(pieces)
+            ramp = np.linspace(start_gain, end_gain, len(samples), dtype=np.float32)[:, None]
+            samples *= ramp
+            np.clip(samples, -peak, peak, out=samples)
+            sink.write(samples.astype('<f4', copy=False).tobytes())
+            written += len(samples)
+
+        while True:
+            raw = source.read(block_bytes)
+            usable = len(raw) - len(raw) % (channels * 4)
+            if usable == 0:
+                break
+            samples = np.frombuffer(raw[:usable], dtype='<f4').reshape(-1, channels)
+
+            # RMS theo frame, vector hoá trên cả block (frame cuối được pad bằng 0)
+            frames = -(-len(samples) // frame_len)
+            padded = np.zeros((frames * frame_len, channels), dtype=np.float32)
+            padded[:len(samples)] = samples
+            rms = np.sqrt(np.mean(np.square(padded.reshape(frames, -1)), axis=1))
+            silent = rms < threshold
+
+            speech = rms[~silent]
+            if len(speech):
+                mean_square = float(np.mean(np.square(speech)))
+                if energy is None:
+                    energy = mean_square
+                else:
+                    # Lên nhanh (giảm gain kịp khi giọng to hơn), xuống chậm
+                    decay = attack if mean_square > energy else release
+                    energy = decay * energy + (1 - decay) * mean_square
+            new_gain = min(max_gain, target / math.sqrt(energy)) if energy else gain
+            if gain is None or (new_gain is not None and new_gain < gain):
+                # Cả block đã có trong tay: giảm gain ngay từ đầu block thay vì ramp
+                gain = new_gain
+
+            # Chia block thành các đoạn liên tiếp cùng trạng thái im lặng / có tiếng
+            bounds = [0, *(np.flatnonzero(np.diff(silent)) + 1).tolist(), frames]
+            out = []
+            for start, end in zip(bounds, bounds[1:]):
+                piece = samples[start * frame_len:end * frame_len]
+                if silent[start]:
+                    pending.append(piece)
+                    pending_len += len(piece)
+                    # Trước tiếng nói đầu tiên chỉ giữ `keep`, ở giữa tối đa `max_gap`
+                    limit = max_gap if speech_started else keep
+                    while pending_len > limit:
+                        excess = pending_len - limit
+                        if len(pending[0]) <= excess:
+                            pending_len -= len(pending.popleft())
+                        else:
+                            pending[0] = pending[0][excess:]
+                            pending_len -= excess
+                else:
+                    out.extend(pending)
+                    pending.clear()
+                    pending_len = 0
+                    out.append(piece)
+                    speech_started = True
+            if out:
+                emit(out, gain, new_gain)
+            gain = new_gain
+
+        if gain is None:
+            gain = 1.0
+        # Khoảng lặng cuối: chỉ giữ `keep` mẫu đầu tiên
+        tail, tail_len = [], 0
+        while pending and speech_started and tail_len < keep:
+            piece = pending.popleft()[:keep - tail_len]
+            tail.append(piece)
+            tail_len += len(piece)
+        if tail:
+            emit(tail, gain, gain)
+
+        silence = np.zeros((block_len, channels), dtype='<f4').tobytes()
+        remaining = round(pause * sample_rate)
+        while remaining > 0:
+            count = min(block_len, remaining)
+            sink.write(silence[:count * channels * 4])
+            remaining -= count
+            written += count
+        return written, speech_started
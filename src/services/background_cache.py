@@ -0,0 +1,120 @@
+from typing import Optional, Tuple
+import hashlib
+import json
+import os
+import threading
+import uuid
+from src.utils.ffmpeg_helper import run_ffmpeg
+from src.utils.logger import Logger
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+class BackgroundCache:
+    """
+    On-disk cache of pre-encoded background loops.
+
+    A background image is resized once with Pillow to the target resolution
+    and encoded into a short clip that is exactly one closed GOP (keyframe
+    first, no B-frames), so it can be repeated with ``-stream_loop`` and
+    stream copy. Entries are keyed on the image hash, the resolution and
+    the encoder settings; since the catalog only uses a handful of
+    backgrounds, segment rendering is reduced to muxing audio next to a
+    copied video stream.
+    """
+
+    LOOP_SECONDS = 10
+
+    def __init__(self, cache_dir: str = "cache/backgrounds", fps: int = 24, video_codec: str = 'libx264',
+                 preset: str = 'medium'):
+        self.logger = Logger(__name__)
+        self.cache_dir = cache_dir
+        self.fps = fps
+        self.video_codec = video_codec
+        self.preset = preset
+        self._lock = threading.Lock()
+        # (path, size, mtime_ns) -> sha256, để không hash lại ảnh cho mỗi segment
+        self._image_hashes = {}
+
+    def settings(self) -> dict:
+        """Encoder settings that are part of every cache key"""
+        return {
+            "fps": self.fps,
+            "video_codec": self.video_codec,
+            "preset": self.preset,
+            "loop_seconds": self.LOOP_SECONDS,
+            "pix_fmt": "yuv420p",
+        }
+
+    def image_hash(self, image_path: str) -> str:
+        stat = os.stat(image_path)
+        stamp = (os.path.abspath(image_path), stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            cached = self._image_hashes.get(stamp)
+        if cached is not None:
+            return cached
+        digest = hashlib.sha256()
+        with open(image_path, 'rb') as f:
+            for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+                digest.update(block)
+        with self._lock:
+            self._image_hashes[stamp] = digest.hexdigest()
+        return digest.hexdigest()
+
+    def make_key(self, image_path: str, resolution: Tuple[int, int]) -> str:
+        payload = json.dumps({
+            "image": self.image_hash(image_path),
+            "resolution": list(resolution),
+            **self.settings(),
+        }, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.mp4")
+
+    @staticmethod
+    def target_resolution(image_path: str, resolution: Optional[Tuple[int, int]] = None) -> Tuple[int, int]:
+        """Requested resolution, or the image's own size; rounded down to even for yuv420p"""
+        if resolution is None:
+            from PIL import Image
+            with Image.open(image_path) as image:
+                resolution = image.size
+        width, height = resolution
+        return max(2, width - width % 2), max(2, height - height % 2)
+
+    def get_or_create(self, image_path: str, resolution: Optional[Tuple[int, int]] = None) -> str:
+        """Return the path of the loop clip for image_path, encoding it on first use"""
+        resolution = self.target_resolution(image_path, resolution)
+        key = self.make_key(image_path, resolution)
+        path = self.path_for(key)
+        if os.path.exists(path):
+            return path
+
+        self.logger.info(f"Encoding background loop for {image_path} at {resolution[0]}x{resolution[1]}")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_id = uuid.uuid4().hex
+        frame_path = f"{path}.{temp_id}.png"
+        temp_path = f"{path}.{temp_id}.tmp.mp4"
+        try:
+            from PIL import Image
+            with Image.open(image_path) as image:
+                image.convert("RGB").resize(resolution, Image.LANCZOS).save(frame_path)
+
+            frames = self.fps * self.LOOP_SECONDS
+            run_ffmpeg([
+                "-loop", "1", "-framerate", str(self.fps), "-i", frame_path,
+                "-frames:v", str(frames),
+                "-c:v", self.video_codec, "-tune", "stillimage", "-preset", self.preset,
+                # Cả clip là đúng một GOP đóng: lặp lại bằng stream copy vẫn bắt đầu bằng keyframe
+                "-g", str(frames), "-keyint_min", str(frames), "-sc_threshold", "0", "-bf", "0",
+                "-pix_fmt", "yuv420p", "-r", str(self.fps), "-an",
+                "-movflags", "+faststart",
+                temp_path,
+            ], logger=self.logger)
+            # Nhiều worker có thể cùng encode một lần đầu; os.replace giữ cho kết quả luôn nguyên vẹn
+            os.replace(temp_path, path)
+        finally:
+            for leftover in (frame_path, temp_path):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+        return path
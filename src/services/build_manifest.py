@@ -0,0 +1,216 @@
+from typing import List, Optional
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+from src.utils.media_info import probe_media
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+class BuildManifest:
+    """
+    Per-story record of every artifact produced by the pipeline.
+
+    Each artifact is stored under a key (e.g. ``audio:part001``) together
+    with the hashes of the inputs it was built from, the hash of the file
+    itself and its media metadata (duration, bitrate, sample rate, size,
+    read from the MP3/MP4 headers). On the next run an artifact whose inputs
+    are unchanged and whose file is still on disk is reused instead of
+    being rebuilt, and its metadata is read from here instead of re-probing.
+
+    Every record is also appended (and fsynced) to a journal next to the
+    manifest, so each finished unit is a durable checkpoint: after a crash
+    the journal is replayed on load and only unfinished units are redone.
+    save() folds the journal back into manifest.json.
+    """
+
+    FILENAME = "manifest.json"
+    JOURNAL_FILENAME = "manifest.journal"
+    VERSION = 1
+
+    def __init__(self, story_dir: str):
+        self.story_dir = story_dir
+        self.path = os.path.join(story_dir, self.FILENAME)
+        self.journal_path = os.path.join(story_dir, self.JOURNAL_FILENAME)
+        self._lock = threading.RLock()
+        self.data = self._load()
+        self._replay_journal()
+
+    @staticmethod
+    def hash_text(text: str) -> str:
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def hash_file(path: str) -> str:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def is_fresh(self, key: str, inputs: dict) -> bool:
+        """True if key was built from the same inputs and its file is unchanged on disk"""
+        with self._lock:
+            entry = self.data["artifacts"].get(key)
+        if not entry or entry.get("inputs") != inputs:
+            return False
+        return self._file_unchanged(entry)
+
+    def record(self, key: str, path: str, inputs: dict) -> str:
+        """Record a freshly built artifact and return its content hash"""
+        stat = os.stat(path)
+        file_hash = self.hash_file(path)
+        entry = {
+            "path": os.path.relpath(path, self.story_dir),
+            "inputs": inputs,
+            "hash": file_hash,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "media": self._probe(path),
+        }
+        with self._lock:
+            self.data["artifacts"][key] = entry
+            self._append_journal(key, entry)
+        return file_hash
+
+    def media_of(self, path: str) -> Optional[dict]:
+        """
+        Media metadata of path, from the index when the file hasn't changed;
+        otherwise read from its headers (and stored on the matching entry).
+        Returns None for files whose headers can't be parsed.
+        """
+        rel_path = os.path.relpath(path, self.story_dir)
+        with self._lock:
+            entries = [e for e in self.data["artifacts"].values() if e.get("path") == rel_path]
+        entries = [e for e in entries if self._file_unchanged(e)]
+        for entry in entries:
+            if entry.get("media"):
+                return entry["media"]
+        media = self._probe(path)
+        with self._lock:
+            for entry in entries:
+                entry["media"] = media
+        return media
+
+    def hash_of(self, path: str) -> str:
+        """Content hash of path, reusing the recorded hash when the file hasn't changed"""
+        rel_path = os.path.relpath(path, self.story_dir)
+        with self._lock:
+            entries = [e for e in self.data["artifacts"].values() if e.get("path") == rel_path]
+        for entry in entries:
+            if self._file_unchanged(entry):
+                return entry["hash"]
+        return self.hash_file(path)
+
+    def is_built(self, key: str) -> bool:
+        """True if key has been recorded and its file is unchanged on disk"""
+        with self._lock:
+            entry = self.data["artifacts"].get(key)
+        return bool(entry) and self._file_unchanged(entry)
+
+    def get_meta(self, name: str):
+        with self._lock:
+            return self.data.get("meta", {}).get(name)
+
+    def set_meta(self, name: str, value) -> None:
+        with self._lock:
+            self.data.setdefault("meta", {})[name] = value
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            return self.data["artifacts"].get(key)
+
+    def forget(self, key: str) -> None:
+        with self._lock:
+            if self.data["artifacts"].pop(key, None) is not None:
+                self._append_journal(key, None)
+
+    def prune(self, keep_keys) -> List[str]:
+        """
+        Drop entries for artifacts that are no longer part of the story and
+        return the paths of their files, for the caller to delete (a path
+        still used by a kept entry is not returned)
+        """
+        keep_keys = set(keep_keys)
+        with self._lock:
+            removed = [self.data["artifacts"].pop(key) for key in list(self.data["artifacts"])
+                       if key not in keep_keys]
+            kept_paths = {entry.get("path") for entry in self.data["artifacts"].values()}
+        return sorted({
+            os.path.join(self.story_dir, entry["path"])
+            for entry in removed if entry.get("path") and entry["path"] not in kept_paths
+        })
+
+    def save(self) -> None:
+        with self._lock:
+            self.data["updated_at"] = datetime.now().isoformat()
+            os.makedirs(self.story_dir, exist_ok=True)
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.data, f, indent=4, ensure_ascii=False)
+            os.replace(temp_path, self.path)
+            # Mọi record trong journal giờ đã nằm trong manifest.json
+            if os.path.exists(self.journal_path):
+                os.remove(self.journal_path)
+
+    def _append_journal(self, key: str, entry: Optional[dict]) -> None:
+        """Durably log one artifact change (entry None = removed); caller holds the lock"""
+        os.makedirs(self.story_dir, exist_ok=True)
+        line = json.dumps({"key": key, "entry": entry}, ensure_ascii=False)
+        with open(self.journal_path, 'a', encoding='utf-8') as f:
+            f.write(line + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _replay_journal(self) -> None:
+        try:
+            with open(self.journal_path, 'r', encoding='utf-8') as f:
+                lines = f.readlines()
+        except OSError:
+            return
+        for line in lines:
+            try:
+                change = json.loads(line)
+            except ValueError:
+                # Dòng cuối có thể bị ghi dở khi process chết giữa chừng
+                continue
+            if change.get("entry") is None:
+                self.data["artifacts"].pop(change["key"], None)
+            else:
+                self.data["artifacts"][change["key"]] = change["entry"]
+
+    @staticmethod
+    def _probe(path: str) -> Optional[dict]:
+        try:
+            return probe_media(path)
+        except (OSError, ValueError):
+            return None
+
+    def _file_unchanged(self, entry: dict) -> bool:
+        path = os.path.join(self.story_dir, entry["path"])
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        if stat.st_size != entry.get("size"):
+            return False
+        if stat.st_mtime_ns == entry.get("mtime_ns"):
+            return True
+        # Chỉ mtime đổi (vd. file hardlink với TTS cache được touch khi cache hit): so hash nội dung
+        if self.hash_file(path) != entry.get("hash"):
+            return False
+        with self._lock:
+            entry["mtime_ns"] = stat.st_mtime_ns
+        return True
+
+    def _load(self) -> dict:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get("version") == self.VERSION:
+                return data
+        except (OSError, ValueError):
+            pass
+        return {"version": self.VERSION, "artifacts": {}}
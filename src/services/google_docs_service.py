@@ -1,41 +1,178 @@
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
 from ..utils.logger import Logger
+import io
+import json
 import os
+import threading
+
+# Chỉ lấy các trường mà _extract_text dùng, bỏ qua toàn bộ style (kể cả bên trong bảng và mục lục)
+_TEXT_FIELDS = "paragraph/elements/textRun/content"
+# Bảng lồng trong ô bảng: đọc thêm một cấp
+_CELL_FIELDS = f"{_TEXT_FIELDS},table/tableRows/tableCells/content({_TEXT_FIELDS})"
+DOCUMENT_FIELDS = (
+    "revisionId,title,"
+    f"body/content({_TEXT_FIELDS},"
+    f"table/tableRows/tableCells/content({_CELL_FIELDS}),"
+    f"tableOfContents/content({_TEXT_FIELDS}))"
+)
+REVISION_FIELDS = "revisionId"
+DISCOVERY_URL = "https://docs.googleapis.com/$discovery/rest?version=v1"
 
 
 class GoogleDocsService:
-    def __init__(self, credentials_path=None):
+    def __init__(self, credentials_path=None, cache_dir="cache/docs", discovery_dir="cache/discovery"):
         if credentials_path is None:
             credentials_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 
                                           'credentials', 
                                           'optimum-door-441415-f6-9c330857586c.json')
         self.logger = Logger(__name__)
+        self.credentials_path = credentials_path
+        self.cache_dir = cache_dir
+        self.discovery_dir = discovery_dir
+        self._credentials = None
+        self._discovery = None
+        self._service_lock = threading.Lock()
+        # httplib2 không thread-safe: mỗi thread giữ một client (và connection) riêng
+        self._local = threading.local()
+
+    @property
+    def service(self):
+        """
+        Docs API client for the calling thread, built on first use from a
+        locally cached discovery document so commands that never call the
+        API skip the google imports. Credentials and the discovery document
+        are loaded once and shared; each thread keeps its client, and so its
+        open connection, for every later request.
+        """
+        service = getattr(self._local, "service", None)
+        if service is None:
+            try:
+                from googleapiclient.discovery import build_from_document
+                credentials, discovery = self._load_client_config()
+                service = build_from_document(discovery, credentials=credentials)
+            except Exception as e:
+                self.logger.error(f"Failed to initialize Google Docs service: {str(e)}")
+                raise
+            self._local.service = service
+        return service
+
+    def _load_client_config(self):
+        with self._service_lock:
+            if self._credentials is None:
+                from google.oauth2 import service_account
+                self._credentials = service_account.Credentials.from_service_account_file(
+                    self.credentials_path,
+                    scopes=["https://www.googleapis.com/auth/documents.readonly"],
+                )
+                self._discovery = json.loads(self._load_discovery())
+            return self._credentials, self._discovery
+
+    def _load_discovery(self):
+        """Return the Docs v1 discovery document, fetching and caching it on first use"""
+        path = os.path.join(self.discovery_dir, "docs.v1.json")
         try:
-            self.credentials = service_account.Credentials.from_service_account_file(
-                credentials_path,
-                scopes=["https://www.googleapis.com/auth/documents.readonly"],
-            )
-            self.service = build("docs", "v1", credentials=self.credentials)
-        except Exception as e:
-            self.logger.error(f"Failed to initialize Google Docs service: {str(e)}")
-            raise
+            with open(path, 'r', encoding='utf-8') as f:
+                return f.read()
+        except OSError:
+            pass
+
+        content = None
+        try:
+            # googleapiclient >= 2 đóng gói sẵn discovery document
+            from googleapiclient.discovery_cache import get_static_doc
+            content = get_static_doc("docs", "v1")
+        except ImportError:
+            pass
+        if content is None:
+            from urllib.request import urlopen
+            with urlopen(DISCOVERY_URL, timeout=30) as response:
+                content = response.read().decode('utf-8')
+
+        os.makedirs(self.discovery_dir, exist_ok=True)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(temp_path, path)
+        return content
 
     def get_document(self, doc_id):
+        return self.fetch_document(doc_id)["text"]
+
+    def get_revision(self, doc_id):
+        """Return the document's current revisionId (cheap access check)"""
+        return self.service.documents().get(documentId=doc_id, fields=REVISION_FIELDS).execute().get("revisionId")
+
+    def fetch_document(self, doc_id):
+        """
+        Return {"text", "title", "revision_id", "cached"} for a document.
+        When a local copy exists, only the revisionId is requested; the full
+        document is downloaded and re-extracted only if the revision changed.
+        """
+        from googleapiclient.errors import HttpError
         try:
-            document = self.service.documents().get(documentId=doc_id).execute()
-            return self._extract_text(document)
+            cached = self._load_cached(doc_id)
+            if cached is not None:
+                revision = self.get_revision(doc_id)
+                if revision and revision == cached.get("revision_id"):
+                    self.logger.info(f"Document {doc_id} unchanged at revision {revision}, using local copy")
+                    return {**cached, "cached": True}
+
+            document = self.service.documents().get(
+                documentId=doc_id, fields=DOCUMENT_FIELDS
+            ).execute()
+            result = {
+                "text": self._extract_text(document),
+                "title": document.get("title"),
+                "revision_id": document.get("revisionId"),
+            }
+            self._save_cached(doc_id, result)
+            return {**result, "cached": False}
         except HttpError as e:
             self.logger.error(f"Failed to fetch document {doc_id}: {str(e)}")
             raise
 
     def _extract_text(self, document):
-        text_content = []
-        for element in document.get("body").get("content"):
-            if "paragraph" in element:
-                paragraph = element.get("paragraph")
-                for elem in paragraph.get("elements"):
-                    if "textRun" in elem:
-                        text_content.append(elem.get("textRun").get("content"))
-        return "".join(text_content)
+        """Extract text in one pass, descending into tables and tables of contents"""
+        text_content = io.StringIO()
+        stack = [iter(document.get("body", {}).get("content", []))]
+        while stack:
+            element = next(stack[-1], None)
+            if element is None:
+                stack.pop()
+            elif "paragraph" in element:
+                for elem in element["paragraph"].get("elements", []):
+                    text_run = elem.get("textRun")
+                    if text_run:
+                        text_content.write(text_run.get("content", ""))
+            elif "table" in element:
+                stack.append(self._iter_table_content(element["table"]))
+            elif "tableOfContents" in element:
+                stack.append(iter(element["tableOfContents"].get("content", [])))
+        return text_content.getvalue()
+
+    @staticmethod
+    def _iter_table_content(table):
+        for row in table.get("tableRows", []):
+            for cell in row.get("tableCells", []):
+                yield from cell.get("content", [])
+
+    def _cache_path(self, doc_id):
+        return os.path.join(self.cache_dir, f"{doc_id}.json")
+
+    def _load_cached(self, doc_id):
+        try:
+            with open(self._cache_path(doc_id), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save_cached(self, doc_id, result):
+        if not result.get("revision_id"):
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            path = self._cache_path(doc_id)
+            with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+                json.dump(result, f, ensure_ascii=False)
+            os.replace(f"{path}.tmp", path)
+        except OSError as e:
+            self.logger.warning(f"Failed to cache document {doc_id}: {str(e)}")
@@ -0,0 +1,138 @@
+from typing import List, Optional
+import os
+import sqlite3
+import threading
+import time
+from ..utils.logger import Logger
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    doc_id TEXT NOT NULL,
+    background TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    resume INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'queued',
+    video TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_pending ON jobs (status, priority DESC, id);
+"""
+
+
+class JobQueue:
+    """
+    Persistent story queue backed by SQLite.
+
+    Jobs are claimed highest priority first, then in submission order,
+    skipping documents that already have a running job so two workers never
+    build the same story directory at once. Claiming is a single
+    transaction, so the worker threads of a daemon can share the queue. A
+    queue file belongs to one daemon process: at startup recover() puts
+    every job left 'running' back in the queue with resume set.
+    """
+
+    STATUSES = ("queued", "running", "done", "failed")
+
+    def __init__(self, path: str):
+        self.logger = Logger(__name__)
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        # isolation_level=None: tự quản lý transaction (BEGIN IMMEDIATE khi claim)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+
+    def submit(self, doc_id: str, background: str, priority: int = 0, resume: bool = False) -> int:
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO jobs (doc_id, background, priority, resume, created_at) VALUES (?, ?, ?, ?, ?)",
+                (doc_id, background, priority, int(resume), time.time()),
+            )
+            return cursor.lastrowid
+
+    def claim(self) -> Optional[dict]:
+        """Mark the next queued job as running and return it, or None if the queue is empty"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Cùng doc_id đang chạy thì để lại: hai job không được ghi chung một story_dir
+                row = self._conn.execute(
+                    "SELECT * FROM jobs WHERE status = 'queued'"
+                    " AND doc_id NOT IN (SELECT doc_id FROM jobs WHERE status = 'running')"
+                    " ORDER BY priority DESC, id LIMIT 1"
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'running', started_at = ? WHERE id = ?",
+                        (time.time(), row["id"]),
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return self._to_dict(row, status="running") if row is not None else None
+
+    def complete(self, job_id: int, video: str) -> None:
+        self._finish(job_id, "done", video=video)
+
+    def fail(self, job_id: int, error: str) -> None:
+        self._finish(job_id, "failed", error=error)
+
+    def recover(self) -> int:
+        """Requeue jobs interrupted by a previous daemon; they resume from their checkpoint.
+
+        Every 'running' row is assumed orphaned, so call this only from the
+        daemon that owns the queue file, before its workers start.
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = 'queued', resume = 1, started_at = NULL WHERE status = 'running'"
+            )
+        if cursor.rowcount:
+            self.logger.info(f"Requeued {cursor.rowcount} interrupted jobs")
+        return cursor.rowcount
+
+    def get(self, job_id: int) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row is not None else None
+
+    def list(self, status: Optional[str] = None, limit: int = 100) -> List[dict]:
+        query, params = "SELECT * FROM jobs", ()
+        if status is not None:
+            query, params = query + " WHERE status = ?", (status,)
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY id DESC LIMIT ?", (*params, limit)).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def counts(self) -> dict:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {**{status: 0 for status in self.STATUSES}, **{row[0]: row[1] for row in rows}}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _finish(self, job_id: int, status: str, video: str = None, error: str = None) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, video = ?, error = ?, finished_at = ? WHERE id = ?",
+                (status, video, error, time.time(), job_id),
+            )
+
+    @staticmethod
+    def _to_dict(row, **overrides) -> dict:
+        job = dict(row)
+        job["resume"] = bool(job["resume"])
+        job.update(overrides)
+        return job
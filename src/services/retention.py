@@ -0,0 +1,174 @@
+from typing import List
+import json
+import os
+import shutil
+import time
+from src.config.output_config import OutputConfig
+from src.services.build_manifest import BuildManifest
+from src.utils.logger import Logger
+
+FINAL_KEYS = ("audio:final", "video:final")
+
+
+class RetentionPolicy:
+    """
+    Removes a story's intermediate artifacts once its final video exists.
+
+    'finals' keeps only the final video, audio and metadata; 'cache' also
+    keeps the segment audio and videos an incremental rebuild reuses, and
+    drops only the normalized segment copies made for a re-encoding merge;
+    'all' keeps everything.
+    """
+
+    def __init__(self, policy: str = OutputConfig.RETENTION):
+        if policy not in OutputConfig.RETENTION_POLICIES:
+            raise ValueError(f"Unknown retention policy: {policy}")
+        self.logger = Logger(__name__)
+        self.policy = policy
+
+    def removable_keys(self, manifest: BuildManifest) -> List[str]:
+        keys = []
+        for key in manifest.data["artifacts"]:
+            if key in FINAL_KEYS or self.policy == "all":
+                continue
+            if self.policy == "finals" or key.startswith("video:norm:"):
+                keys.append(key)
+        return keys
+
+    def apply(self, manifest: BuildManifest) -> int:
+        """Delete the artifacts the policy doesn't keep; returns bytes freed"""
+        freed = 0
+        for key in self.removable_keys(manifest):
+            path = os.path.join(manifest.story_dir, manifest.get(key)["path"])
+            freed += _remove(path)
+            manifest.forget(key)
+        if freed:
+            self.logger.info(f"Retention '{self.policy}' freed {freed / 1024 ** 2:.1f} MB in {manifest.story_dir}")
+        return freed
+
+
+def _file_size(path: str) -> int:
+    """Bytes freed by removing path: 0 when another hardlink (e.g. the TTS cache) keeps the data"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return 0
+    return stat.st_size if stat.st_nlink == 1 else 0
+
+
+def _remove(path: str) -> int:
+    """Remove a file and return the bytes actually freed"""
+    freed = _file_size(path)
+    try:
+        os.remove(path)
+    except OSError:
+        return 0
+    return freed
+
+
+def _tree_size(directory: str) -> int:
+    """Bytes that removing directory would free (hardlinks shared with the cache don't count)"""
+    return sum(_file_size(os.path.join(root, name))
+               for root, _, files in os.walk(directory) for name in files)
+
+
+class StoryGarbageCollector:
+    """
+    Reclaims space across all stories under output/, least recently used first.
+
+    Stories over the budget are first trimmed to their final outputs; only
+    with delete_finals=True are whole stories removed after that. Stories
+    with a pending checkpoint (interrupted or still being built) are left
+    alone, since trimming them would destroy their resume state.
+    """
+
+    def __init__(self, output_dir: str = OutputConfig.OUTPUT_DIR):
+        self.logger = Logger(__name__)
+        self.output_dir = output_dir
+
+    def stories(self) -> List[dict]:
+        """Every story directory with its reclaimable size and last use, oldest first"""
+        stories = []
+        if not os.path.isdir(self.output_dir):
+            return stories
+        for name in os.listdir(self.output_dir):
+            story_dir = os.path.join(self.output_dir, name)
+            if not os.path.isdir(story_dir):
+                continue
+            stories.append({
+                "story_dir": story_dir,
+                "size": _tree_size(story_dir),
+                "last_used": self._last_used(story_dir),
+            })
+        stories.sort(key=lambda story: story["last_used"])
+        return stories
+
+    def collect(self, max_bytes: int = OutputConfig.GC_MAX_BYTES, delete_finals: bool = False,
+                dry_run: bool = False) -> dict:
+        stories = self.stories()
+        total = sum(story["size"] for story in stories)
+        report = {"before": total, "trimmed": [], "deleted": [], "skipped": [], "freed": 0}
+
+        # Lượt 1: chỉ giữ final của các story ít dùng nhất
+        for story in stories:
+            if total <= max_bytes:
+                break
+            manifest = BuildManifest(story["story_dir"])
+            if manifest.get_meta("checkpoint") is not None:
+                # Story đang chạy hoặc chờ resume: đừng đụng vào
+                report["skipped"].append(story["story_dir"])
+                continue
+            policy = RetentionPolicy("finals")
+            if not policy.removable_keys(manifest):
+                continue
+            if dry_run:
+                freed = sum(_file_size(os.path.join(manifest.story_dir, manifest.get(key)["path"]))
+                            for key in policy.removable_keys(manifest))
+            else:
+                freed = policy.apply(manifest) + self._remove_leftovers(story["story_dir"])
+                manifest.save()
+            total -= freed
+            story["size"] -= freed
+            report["freed"] += freed
+            report["trimmed"].append(story["story_dir"])
+
+        # Lượt 2: xoá hẳn story, chỉ khi được cho phép
+        if delete_finals:
+            for story in stories:
+                if total <= max_bytes:
+                    break
+                if story["story_dir"] in report["skipped"]:
+                    continue
+                if not dry_run:
+                    shutil.rmtree(story["story_dir"], ignore_errors=True)
+                total -= story["size"]
+                report["freed"] += story["size"]
+                report["deleted"].append(story["story_dir"])
+
+        report["after"] = total
+        return report
+
+    @staticmethod
+    def _last_used(story_dir: str) -> float:
+        try:
+            with open(os.path.join(story_dir, BuildManifest.FILENAME), 'r', encoding='utf-8') as f:
+                last_used = json.load(f).get("meta", {}).get("last_used")
+            if last_used:
+                return last_used
+        except (OSError, ValueError):
+            pass
+        try:
+            return os.path.getmtime(story_dir)
+        except OSError:
+            return time.time()
+
+    @staticmethod
+    def _remove_leftovers(story_dir: str) -> int:
+        """Drop untracked files in segments/ (e.g. from interrupted renders)"""
+        freed = 0
+        segments_dir = os.path.join(story_dir, "segments")
+        if os.path.isdir(segments_dir):
+            freed = _tree_size(segments_dir)
+            shutil.rmtree(segments_dir, ignore_errors=True)
+        return freed
+
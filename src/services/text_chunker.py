@@ -0,0 +1,106 @@
+import hashlib
+import re
+from typing import Iterator, List, NamedTuple, Tuple
+
+# Kết thúc câu: dấu chấm/chấm than/chấm hỏi (kể cả dấu ba chấm và dấu câu
+# Unicode), có thể theo sau bởi dấu đóng ngoặc kép/ngoặc đơn, rồi khoảng trắng.
+# Mỗi dấu xuống dòng là ranh giới đoạn văn.
+_BOUNDARY = re.compile(
+    r"(?:[.!?…。！？‼⁇⁈⁉]+[\"'”’»›」』)\]]*(?=\s|$))|\n"
+)
+
+
+class Chunk(NamedTuple):
+    """A piece of the story passed between pipeline stages in memory"""
+    index: int   # 1-based position in the story, matches partNNN
+    text: str
+    hash: str    # sha256 of the text, used by the cache and build manifest
+    start: int   # span of the chunk in the source text
+    end: int
+
+    @staticmethod
+    def hash_text(text: str) -> str:
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class TextChunker:
+    """
+    Splits text into chunks of at most ``max_chars`` characters in one linear pass.
+
+    Chunks are returned as (start, end) spans into the original string, with
+    surrounding whitespace excluded, so callers only copy text when they
+    need it. Chunks end on a sentence boundary, preferring a paragraph
+    boundary when one falls in the second half of the chunk; a single
+    sentence longer than the limit is cut at the last space that fits.
+    """
+
+    def __init__(self, max_chars: int):
+        if max_chars <= 0:
+            raise ValueError("max_chars must be positive")
+        self.max_chars = max_chars
+
+    def spans(self, text: str) -> List[Tuple[int, int]]:
+        max_chars = self.max_chars
+        length = len(text)
+        spans = []
+
+        start = self._skip_whitespace(text, 0, length)
+        end = start          # cuối câu hoàn chỉnh cuối cùng trong chunk hiện tại
+        paragraph_end = None  # cuối đoạn văn cuối cùng trong chunk hiện tại
+
+        for boundary, is_paragraph in self._iter_boundaries(text):
+            if boundary <= start:
+                continue
+            while boundary - start > max_chars:
+                if paragraph_end is not None and paragraph_end - start >= max_chars // 2:
+                    cut = paragraph_end
+                elif end > start:
+                    cut = end
+                else:
+                    # Một câu dài hơn giới hạn: cắt tại khoảng trắng cuối cùng còn vừa
+                    cut = text.rfind(" ", start + 1, start + max_chars + 1)
+                    if cut <= start:
+                        cut = start + max_chars
+                self._append(spans, text, start, cut)
+                start = self._skip_whitespace(text, cut, length)
+                end = max(end, start)
+                paragraph_end = None
+                if start >= boundary:
+                    break
+            if boundary > start:
+                end = boundary
+                if is_paragraph:
+                    paragraph_end = boundary
+
+        if start < length:
+            self._append(spans, text, start, length)
+        return spans
+
+    def chunks(self, text: str) -> List[str]:
+        return [text[start:end] for start, end in self.spans(text)]
+
+    def build_chunks(self, text: str) -> List[Chunk]:
+        chunks = []
+        for index, (start, end) in enumerate(self.spans(text), 1):
+            chunk_text = text[start:end]
+            chunks.append(Chunk(index, chunk_text, Chunk.hash_text(chunk_text), start, end))
+        return chunks
+
+    @staticmethod
+    def _iter_boundaries(text: str) -> Iterator[Tuple[int, bool]]:
+        for match in _BOUNDARY.finditer(text):
+            yield match.end(), match.group() == "\n"
+        yield len(text), True
+
+    @staticmethod
+    def _skip_whitespace(text: str, position: int, length: int) -> int:
+        while position < length and text[position].isspace():
+            position += 1
+        return position
+
+    @staticmethod
+    def _append(spans: list, text: str, start: int, end: int) -> None:
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        if end > start:
+            spans.append((start, end))
@@ -1,12 +1,15 @@
-import re
-from typing import List
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Sequence, Tuple, Union
 from src.config.tts_config import TTSConfig
+from src.services.text_chunker import Chunk, TextChunker
 import os
 
 class TextProcessor:
     def __init__(self, output_path):
         self.output_path = output_path
         self.config = TTSConfig()
+        self.chunker = TextChunker(self.config.MAX_CHARS)
+        self._writer = None
         
     def split_into_chunks(self, text: str) -> List[str]:
         """
@@ -15,51 +18,30 @@ class TextProcessor:
         2. Không vượt quá giới hạn ký tự của TTS
         3. Cố gắng chia theo đoạn văn hoặc ý nghĩa
         """
-        # Tách theo đoạn văn (dựa vào dấu xuống dòng)
-        paragraphs = text.split('\n')
-        chunks = []
-        current_chunk = ""
-        
-        for paragraph in paragraphs:
-            # Bỏ qua đoạn trống
-            if not paragraph.strip():
-                continue
-                
-            # Nếu đoạn văn quá dài, cần chia nhỏ hơn
-            if len(paragraph) > self.config.MAX_CHARS:
-                # Tách thành các câu
-                sentences = re.split('([.!?]+)', paragraph)
-                
-                for i in range(0, len(sentences), 2):
-                    sentence = sentences[i]
-                    # Thêm dấu câu nếu có
-                    if i + 1 < len(sentences):
-                        sentence += sentences[i + 1]
-                        
-                    # Nếu chunk hiện tại + câu mới vẫn trong giới hạn
-                    if len(current_chunk) + len(sentence) < self.config.MAX_CHARS:
-                        current_chunk += sentence
-                    else:
-                        # Lưu chunk hiện tại và bắt đầu chunk mới
-                        if current_chunk:
-                            chunks.append(current_chunk.strip())
-                        current_chunk = sentence
-            else:
-                # Nếu đoạn văn ngắn, kiểm tra xem có thể thêm vào chunk hiện tại không
-                if len(current_chunk) + len(paragraph) + 1 < self.config.MAX_CHARS:
-                    current_chunk += ("\n" if current_chunk else "") + paragraph
-                else:
-                    if current_chunk:
-                        chunks.append(current_chunk.strip())
-                    current_chunk = paragraph
-        
-        # Thêm chunk cuối cùng nếu còn
-        if current_chunk:
-            chunks.append(current_chunk.strip())
-            
-        return chunks
+        return [text[start:end] for start, end in self.split_into_spans(text)]
+
+    def split_into_spans(self, text: str) -> List[Tuple[int, int]]:
+        """
+        Như split_into_chunks nhưng trả về các cặp (start, end) trỏ vào văn bản gốc
+        """
+        return self.chunker.spans(text)
+
+    def build_chunks(self, text: str) -> List[Chunk]:
+        """
+        Chia văn bản thành các Chunk (index, text, hash) để truyền trực tiếp
+        giữa các stage trong bộ nhớ, không cần ghi ra file
+        """
+        return self.chunker.build_chunks(text)
+
+    def save_chunks_async(self, chunks: Sequence[Chunk], output_dir: str, prefix: str = "part") -> Future:
+        """
+        Ghi các chunk ra file ở một thread nền (chỉ để debug), không chặn pipeline
+        """
+        if self._writer is None:
+            self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="text-writer")
+        return self._writer.submit(self.save_chunks, list(chunks), output_dir, prefix)
 
-    def save_chunks(self, chunks: List[str], output_dir: str, prefix: str = "part") -> List[str]:
+    def save_chunks(self, chunks: Sequence[Union[str, Chunk]], output_dir: str, prefix: str = "part") -> List[str]:
         """
         Lưu các đoạn văn vào file và trả về danh sách đường dẫn
         """
@@ -73,7 +55,7 @@ class TextProcessor:
             filepath = f"{output_dir}/{filename}"
             
             with open(filepath, 'w', encoding='utf-8') as f:
-                f.write(chunk)
+                f.write(chunk.text if isinstance(chunk, Chunk) else chunk)
             
             file_paths.append(filepath)
             
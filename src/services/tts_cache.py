@@ -0,0 +1,134 @@
+from contextlib import contextmanager
+from typing import Optional
+import hashlib
+import os
+import threading
+import uuid
+from src.config.tts_config import TTSConfig
+from src.utils.logger import Logger
+
+
+class TTSCache:
+    """
+    Content-addressed on-disk cache for TTS audio.
+
+    Entries are keyed on the normalized chunk text plus the model, voice and
+    audio format of the calling service's config, so the same paragraph is
+    never synthesized twice and a settings change never reuses old audio. Writes go
+    to a temp file and are renamed into place, and the least recently used
+    entries are evicted once the cache grows past ``max_bytes``.
+    """
+
+    def __init__(self, cache_dir: str = TTSConfig.CACHE_DIR, max_bytes: int = TTSConfig.CACHE_MAX_BYTES):
+        self.logger = Logger(__name__)
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._size = self._scan_size()
+
+    @staticmethod
+    def normalize_text(text: str) -> str:
+        # Chuẩn hóa khoảng trắng để các bản sửa chỉ khác dấu cách vẫn trùng cache
+        return ' '.join(text.split())
+
+    def make_key(self, text: str, config) -> str:
+        """Key for text synthesized with config.MODEL/VOICE/AUDIO_FORMAT; it ends with the file extension"""
+        payload = "\0".join([config.MODEL, config.VOICE, config.AUDIO_FORMAT, self.normalize_text(text)])
+        return f"{hashlib.sha256(payload.encode('utf-8')).hexdigest()}.{config.AUDIO_FORMAT}"
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached file path for key, or None on a miss"""
+        path = self.path_for(key)
+        try:
+            # Cập nhật mtime để eviction biết entry này vừa được dùng
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return path
+
+    @contextmanager
+    def writer(self, key: str):
+        """
+        Yield a temp path to write the entry to; it is atomically moved into
+        place when the block exits without error.
+        """
+        path = self.path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            yield temp_path
+            size = os.path.getsize(temp_path)
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+        with self._lock:
+            self._size += size
+            over_limit = self._size > self.max_bytes
+        if over_limit:
+            self.evict(keep=path)
+
+    def evict(self, keep: Optional[str] = None) -> None:
+        """Remove least recently used entries until the cache fits in max_bytes"""
+        with self._lock:
+            entries = []
+            total = 0
+            for root, _, files in os.walk(self.cache_dir):
+                for name in files:
+                    if name.endswith('.tmp'):
+                        continue
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, path))
+                    total += stat.st_size
+
+            entries.sort()
+            removed = 0
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                if path == keep:
+                    continue
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                removed += 1
+
+            self._size = total
+        if removed:
+            self.logger.debug("Evicted {} TTS cache entries", removed)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size_bytes': self._size,
+                'max_bytes': self.max_bytes,
+            }
+
+    def _scan_size(self) -> int:
+        total = 0
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass
+        return total
@@ -1,58 +1,98 @@
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import List
-import hashlib
-import os
-from functools import lru_cache
-from src.utils.logger import setup_logger
+from typing import Iterator, List, Optional, Tuple, Union
+from src.config.tts_config import TTSConfig
+from src.services.text_chunker import Chunk
+from src.utils.logger import Logger
 
-# Setup logger
-logger = setup_logger(__name__)
 
 class TTSProcessor:
-    def __init__(self, max_workers=4, cache_dir="cache/tts", batch_size=10):
-        self.max_workers = max_workers
-        self.cache_dir = cache_dir
-        os.makedirs(cache_dir, exist_ok=True)
-        self.batch_size = batch_size
-
-    @lru_cache(maxsize=100)
-    def get_cache_path(self, text: str) -> str:
-        # Tạo unique filename dựa trên content
-        text_hash = hashlib.md5(text.encode()).hexdigest()
-        return os.path.join(self.cache_dir, f"{text_hash}.mp3")
-
-    def process_batch(self, texts: List[str]) -> List[str]:
-        audio_files = []
-        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            future_to_text = {executor.submit(self.text_to_speech, text): text 
-                            for text in texts}
-            
-            for future in as_completed(future_to_text):
+    """
+    Bounded worker pool that runs TTS requests concurrently, either on
+    threads or on an AsyncTTSBackend when one is given.
+    """
+
+    def __init__(self, tts_service, max_workers: Optional[int] = None, backend=None):
+        self.logger = Logger(__name__)
+        self.tts_service = tts_service
+        self.max_workers = max_workers or TTSConfig.MAX_CONCURRENCY
+        self.backend = backend
+
+    def process_batch(self, jobs: List[Tuple[Union[Chunk, str], str]]) -> List[str]:
+        """
+        Generate audio for (source, output_file) pairs concurrently, where
+        source is an in-memory Chunk or the path of a text file.
+        Output files are returned in the same order as the jobs, regardless
+        of the order in which the requests complete.
+        """
+        audio_files = [None] * len(jobs)
+        for index, output_file in self.iter_completed(jobs):
+            audio_files[index] = output_file
+        return audio_files
+
+    def iter_completed(self, jobs: List[Tuple[Union[Chunk, str], str]]) -> Iterator[Tuple[int, str]]:
+        """
+        Generate audio for (source, output_file) pairs concurrently and
+        yield (job index, output_file) as soon as each one is written.
+        """
+        if not jobs:
+            return
+
+        if self.backend is not None:
+            yield from self._iter_backend(jobs)
+            return
+
+        workers = min(self.max_workers, len(jobs))
+        executor = ThreadPoolExecutor(max_workers=workers)
+        try:
+            future_to_index = {
+                executor.submit(self._generate, source, output_file): i
+                for i, (source, output_file) in enumerate(jobs)
+            }
+
+            for future in as_completed(future_to_index):
+                index = future_to_index[future]
+                source, output_file = jobs[index]
                 try:
-                    audio_file = future.result()
-                    audio_files.append(audio_file)
+                    future.result()
                 except Exception as e:
-                    logger.error(f"Failed to process TTS: {e}")
-                    
-        return audio_files 
-
-    def optimize_text(self, text: str) -> str:
-        # Loại bỏ các ký tự không cần thiết
-        text = text.strip()
-        # Chuẩn hóa khoảng trắng
-        text = ' '.join(text.split())
-        # Các tối ưu khác tùy vào yêu cầu
-        return text
-
-    def text_to_speech(self, text: str) -> str:
-        optimized_text = self.optimize_text(text)
-        return self._process_tts(optimized_text)
-
-    def process_texts(self, texts: List[str]) -> List[str]:
-        results = []
-        # Xử lý theo batch
-        for i in range(0, len(texts), self.batch_size):
-            batch = texts[i:i + self.batch_size]
-            batch_results = self.process_batch(batch)
-            results.extend(batch_results)
-        return results
\ No newline at end of file
+                    name = f"part {source.index}" if isinstance(source, Chunk) else source
+                    self.logger.error(f"Failed to process TTS for {name}: {e}")
+                    raise
+                yield index, output_file
+        finally:
+            # Một phần bị lỗi (hoặc consumer dừng sớm) thì hủy các job còn lại
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def _iter_backend(self, jobs: List[Tuple[Union[Chunk, str], str]]) -> Iterator[Tuple[int, str]]:
+        # Backend tự giới hạn concurrency và rate, nên submit toàn bộ job một lần
+        future_to_index = {
+            self.backend.submit(self._read_text(source), output_file): i
+            for i, (source, output_file) in enumerate(jobs)
+        }
+        try:
+            for future in as_completed(future_to_index):
+                index = future_to_index[future]
+                source, output_file = jobs[index]
+                try:
+                    future.result()
+                except Exception as e:
+                    name = f"part {source.index}" if isinstance(source, Chunk) else source
+                    self.logger.error(f"Failed to process TTS for {name}: {e}")
+                    raise
+                yield index, output_file
+        finally:
+            for future in future_to_index:
+                future.cancel()
+
+    @staticmethod
+    def _read_text(source: Union[Chunk, str]) -> str:
+        if isinstance(source, Chunk):
+            return source.text
+        with open(source, 'r', encoding='utf-8') as f:
+            return f.read()
+
+    def _generate(self, source: Union[Chunk, str], output_file: str) -> None:
+        if isinstance(source, Chunk):
+            self.tts_service.generate_audio_from_text(source.text, output_file)
+        else:
+            self.tts_service.generate_audio(source, output_file)
@@ -1,76 +1,107 @@
-from openai import OpenAI
 from src.config.tts_config import TTSConfig
-from tenacity import retry, stop_after_attempt, wait_exponential
+from src.services.audio_merger import AudioMerger
+from src.services.text_chunker import TextChunker
+from src.services.tts_cache import TTSCache
+from src.utils.file_helper import FileHelper
+from src.utils.logger import Logger
+from src.utils.mp3_helper import Mp3StreamWriter
+from tenacity import retry, retry_if_not_exception_type, stop_after_attempt, wait_exponential
 import os
+import threading
+import uuid
+
+# Retry cho từng sub-request: chỉ chunk bị lỗi được gọi lại, không phải cả segment.
+# ValueError (tham số MP3 khác nhau) không phải lỗi tạm thời nên không retry.
+sub_request_retry = retry(
+    stop=stop_after_attempt(TTSConfig.MAX_RETRIES),
+    wait=wait_exponential(
+        multiplier=TTSConfig.RETRY_MULTIPLIER,
+        min=TTSConfig.RETRY_MIN_WAIT,
+        max=TTSConfig.RETRY_MAX_WAIT
+    ),
+    retry=retry_if_not_exception_type(ValueError),
+    reraise=True,
+)
+
 
 class TTSService:
-    def __init__(self, api_key: str, output_dir: str):
-        self.client = OpenAI(api_key=api_key)
+    def __init__(self, api_key: str, output_dir: str, cache: TTSCache = None):
+        self.logger = Logger(__name__)
+        self.api_key = api_key
+        self._client = None
+        self._client_lock = threading.Lock()
         self.output_dir = output_dir
         self.config = TTSConfig()
+        if cache is None and self.config.CACHE_ENABLED:
+            cache = TTSCache()
+        self.cache = cache
+        self.merger = AudioMerger()
+        self.chunker = TextChunker(self.config.MAX_CHARS)
+
+    @property
+    def client(self):
+        # openai import chậm, chỉ tạo client khi thật sự gọi API
+        with self._client_lock:
+            if self._client is None:
+                from openai import OpenAI
+                self._client = OpenAI(api_key=self.api_key)
+            return self._client
 
     def split_text(self, text: str) -> list[str]:
         """Split text into chunks that are small enough for the API"""
-        chunks = []
-        current_chunk = ""
-        
-        # Split by sentences (roughly)
-        sentences = text.split('.')
-        
-        for sentence in sentences:
-            if len(current_chunk) + len(sentence) < self.config.MAX_CHARS:
-                current_chunk += sentence + '.'
-            else:
-                if current_chunk:
-                    chunks.append(current_chunk)
-                current_chunk = sentence + '.'
-        
-        if current_chunk:
-            chunks.append(current_chunk)
-            
-        return chunks
+        return self.chunker.chunks(text)
 
-    @retry(
-        stop=stop_after_attempt(TTSConfig.MAX_RETRIES),
-        wait=wait_exponential(
-            multiplier=TTSConfig.RETRY_MULTIPLIER,
-            min=TTSConfig.RETRY_MIN_WAIT,
-            max=TTSConfig.RETRY_MAX_WAIT
-        )
-    )
     def generate_audio(self, text_file: str, output_file: str) -> None:
         """
         Generates audio from text file and saves it to the output file
         """
+        with open(text_file, 'r', encoding='utf-8') as f:
+            text = f.read()
+        self.generate_audio_from_text(text, output_file)
+
+    def generate_audio_from_text(self, text: str, output_file: str) -> None:
+        """
+        Generates audio from in-memory text and saves it to the output file.
+        Each sub-request is retried on its own, and finished ones are
+        checkpointed in the TTS cache, so a failure never repeats them.
+        """
         # Create output directory if it doesn't exist
         os.makedirs(os.path.dirname(output_file), exist_ok=True)
         
-        # Read the text file
-        with open(text_file, 'r') as f:
-            text = f.read()
-        
         # Split text into chunks
         chunks = self.split_text(text)
         
-        # Generate audio for each chunk
+        if self.config.STREAM_RESPONSES and self.config.AUDIO_FORMAT == "mp3":
+            try:
+                self._stream_chunks(chunks, output_file)
+                self._link_cached(chunks, output_file)
+                return
+            except ValueError as e:
+                # Các phần có tham số MP3 khác nhau, không nối frame trực tiếp được
+                self.logger.warning(f"Streaming write failed for {output_file}, merging parts instead: {str(e)}")
+        
+        # Generate audio for each chunk, reusing cached audio when possible
+        part_files = []
         temp_files = []
         for i, chunk in enumerate(chunks):
-            temp_file = f"{output_file}.part{i}.{self.config.AUDIO_FORMAT}"
-            response = self.client.audio.speech.create(
-                model=self.config.MODEL,
-                voice=self.config.VOICE,
-                input=chunk
-            )
-            response.stream_to_file(temp_file)
-            temp_files.append(temp_file)
+            if self.cache is not None:
+                part_files.append(self._synthesize_cached(chunk))
+            else:
+                temp_file = f"{output_file}.part{i}.{self.config.AUDIO_FORMAT}"
+                self._synthesize(chunk, temp_file)
+                part_files.append(temp_file)
+                temp_files.append(temp_file)
         
         # Merge all chunks
-        if len(temp_files) == 1:
-            # If only one chunk, just rename it
-            os.rename(temp_files[0], output_file)
+        if len(part_files) == 1:
+            # If only one chunk, just copy (cache entry) or rename (temp file) it
+            if temp_files:
+                os.replace(part_files[0], output_file)
+            else:
+                FileHelper.link_or_copy(part_files[0], output_file)
         else:
             # Merge multiple chunks
-            self.merge_audio_files(temp_files, output_file)
+            self.merge_audio_files(part_files, output_file)
             
             # Clean up temp files
             for temp_file in temp_files:
@@ -79,19 +110,95 @@ class TTSService:
                 except OSError:
                     pass
 
+    def _link_cached(self, chunks: list[str], output_file: str) -> None:
+        """
+        A single-chunk segment has the same audio as its cache entry, so
+        hardlink it to the entry instead of keeping a second copy on disk.
+        """
+        if self.cache is None or len(chunks) != 1:
+            return
+        cached_file = self.cache.path_for(self.cache.make_key(chunks[0], self.config))
+        if os.path.exists(cached_file):
+            FileHelper.link_or_copy(cached_file, output_file)
+
+    def _stream_chunks(self, chunks: list[str], output_file: str) -> None:
+        """
+        Stream every chunk's audio straight into output_file in fixed-size
+        buffers, joining the parts on MP3 frame boundaries. No per-chunk temp
+        files are written and nothing is decoded, so memory stays constant
+        however long the segment is.
+        """
+        temp_output = f"{output_file}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(temp_output, 'wb') as out:
+                writer = Mp3StreamWriter(out)
+                for chunk in chunks:
+                    self._stream_part(chunk, writer)
+            os.replace(temp_output, output_file)
+        finally:
+            if os.path.exists(temp_output):
+                os.remove(temp_output)
+
+    @sub_request_retry
+    def _stream_part(self, text: str, writer: Mp3StreamWriter) -> None:
+        """Stream one chunk as a part of writer, rolling the part back if it fails"""
+        writer.begin_part()
+        try:
+            self._stream_chunk(text, writer)
+        except BaseException:
+            writer.abort_part()
+            raise
+        writer.end_part()
+
+    def _stream_chunk(self, text: str, writer: Mp3StreamWriter) -> None:
+        buffer_size = self.config.STREAM_BUFFER_SIZE
+        key = None
+        if self.cache is not None:
+            key = self.cache.make_key(text, self.config)
+            cached_file = self.cache.get(key)
+            if cached_file is not None:
+                with open(cached_file, 'rb') as f:
+                    for block in iter(lambda: f.read(buffer_size), b''):
+                        writer.write(block)
+                return
+
+        with self.client.audio.speech.with_streaming_response.create(
+            model=self.config.MODEL,
+            voice=self.config.VOICE,
+            input=text
+        ) as response:
+            if key is None:
+                for block in response.iter_bytes(buffer_size):
+                    writer.write(block)
+                return
+            # Ghi song song vào cache để lần sau không phải gọi API
+            with self.cache.writer(key) as cache_file, open(cache_file, 'wb') as f:
+                for block in response.iter_bytes(buffer_size):
+                    f.write(block)
+                    writer.write(block)
+
+    @sub_request_retry
+    def _synthesize(self, text: str, output_file: str) -> None:
+        """Call the speech API for one chunk and write the response to output_file"""
+        response = self.client.audio.speech.create(
+            model=self.config.MODEL,
+            voice=self.config.VOICE,
+            input=text
+        )
+        response.stream_to_file(output_file)
+
+    def _synthesize_cached(self, text: str) -> str:
+        """Return the cached audio file for text, calling the API only on a miss"""
+        key = self.cache.make_key(text, self.config)
+        cached_file = self.cache.get(key)
+        if cached_file is None:
+            with self.cache.writer(key) as temp_file:
+                self._synthesize(text, temp_file)
+            cached_file = self.cache.path_for(key)
+        return cached_file
+
     def merge_audio_files(self, audio_files: list[str], output_file: str) -> None:
         """
         Merges multiple audio files into one
         """
-        # Create output directory if it doesn't exist
-        os.makedirs(os.path.dirname(output_file), exist_ok=True)
-        
-        # Use pydub to merge audio files
-        from pydub import AudioSegment
-        
-        combined = AudioSegment.empty()
-        for audio_file in audio_files:
-            segment = AudioSegment.from_mp3(audio_file)
-            combined += segment
-            
-        combined.export(output_file, format=self.config.AUDIO_FORMAT)
\ No newline at end of file
+        self.merger.merge(audio_files, output_file)
@@ -1,71 +1,207 @@
-from moviepy.editor import VideoFileClip, AudioFileClip, ImageClip, concatenate_videoclips
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import NamedTuple, Optional
+import multiprocessing
 import os
+import shutil
+import tempfile
+import time
+import uuid
+from .background_cache import BackgroundCache
 from ..utils.logger import Logger
 from ..utils.file_helper import FileHelper
 from ..utils.performance_monitor import PerformanceMonitor
 from ..utils.validation_helper import ValidationHelper
+from ..utils.ffmpeg_helper import probe_streams, run_ffmpeg, write_concat_list
+from ..utils.media_info import probe_media
+from ..utils.mp3_helper import scan_mp3
 from tenacity import retry, stop_after_attempt, wait_exponential # type: ignore
 from datetime import datetime
 from proglog import ProgressBarLogger
 
+# Retry theo từng đơn vị (một segment, một lần normalize, bước concat cuối)
+unit_retry = retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10), reraise=True)
+
+
 class MyBarLogger(ProgressBarLogger):
     def bars_callback(self, bar, attr, value, old_value=None):
         # Do nothing - this keeps progress bar from appearing
         pass
 
+
+def available_cpus() -> int:
+    """CPUs this process may run on (respects affinity / container cpusets)"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def plan_render_workers(segments: int, engine: str = 'loop', cpus: Optional[int] = None):
+    """
+    Return (worker processes, x264 threads per worker) for rendering
+    `segments` segments. A 1 fps still-image encode gains little past two
+    x264 threads, so cores are spent on more segments in parallel instead;
+    moviepy encodes full-rate frames and gets more threads per worker, and
+    the loop engine only encodes audio.
+    """
+    cpus = cpus or available_cpus()
+    threads = min({'loop': 1, 'ffmpeg': 2}.get(engine, 4), cpus)
+    workers = max(1, min(segments, cpus // threads))
+    return workers, threads
+
+
+class SegmentPlan(NamedTuple):
+    audio_file: str
+    video_path: str
+    key: str
+    inputs: Optional[dict]
+    fresh: bool
+
+
+# Mỗi worker process giữ một VideoProcessor riêng, tạo một lần trong initializer
+_worker_processor = None
+
+
+def _init_render_worker(options):
+    global _worker_processor
+    _worker_processor = VideoProcessor(**options)
+
+
+def _render_in_worker(audio_file, background_image, video_path, duration, threads):
+    start = time.perf_counter()
+    _worker_processor._render_segment(audio_file, background_image, video_path, duration, threads)
+    return os.getpid(), start, time.perf_counter() - start
+
 class VideoProcessor:
-    def __init__(self, output_dir, fps=24, video_codec='libx264', audio_codec='aac'):
+    # Thứ tự cũng là thứ tự fallback khi một engine lỗi
+    ENGINES = ('loop', 'ffmpeg', 'moviepy')
+    MERGE_MODES = ('copy', 'reencode')
+
+    def __init__(self, output_dir, fps=24, video_codec='libx264', audio_codec='aac',
+                 engine='loop', still_fps=1, merge_mode='copy', workers=None, threads=None,
+                 resolution=None, background_cache_dir="cache/backgrounds", concurrent_jobs=1):
+        """
+        engine: 'loop' repeats a cached, pre-encoded clip of the background by
+        stream copy and only encodes the audio; 'ffmpeg' encodes each segment
+        with a direct ffmpeg call tuned for a still image; 'moviepy' renders
+        frames through moviepy at `fps`. A failing engine falls back to the
+        next one in that order.
+        resolution: (width, height) of the video, None keeps the image's size.
+        merge_mode: 'copy' joins segments with the concat demuxer without
+        re-encoding when their streams match; 'reencode' always normalizes
+        each segment first (see _normalize_segments).
+        workers / threads: render processes and encoder threads per render;
+        None picks them from the available CPUs (see plan_render_workers).
+        workers=1 renders in-process, one segment at a time.
+        concurrent_jobs: stories rendering at the same time through this
+        processor (batch render pool, daemon workers); each one plans its
+        render pool on an equal share of the CPUs.
+        """
+        if engine not in self.ENGINES:
+            raise ValueError(f"Unknown video engine: {engine}")
+        if merge_mode not in self.MERGE_MODES:
+            raise ValueError(f"Unknown merge mode: {merge_mode}")
         self.logger = Logger(__name__)
         self.file_helper = FileHelper()
-        self.performance = PerformanceMonitor()
+        self.performance = PerformanceMonitor.shared()
         self.validator = ValidationHelper()
         self.output_dir = output_dir
         self.fps = fps
         self.video_codec = video_codec
         self.audio_codec = audio_codec
+        self.engine = engine
+        self.still_fps = still_fps
+        self.merge_mode = merge_mode
+        self.workers = workers
+        self.threads = threads
+        self.concurrent_jobs = max(1, concurrent_jobs)
+        self.resolution = tuple(resolution) if resolution else None
+        self.background_cache_dir = background_cache_dir
+        self._background_cache = None
         self.progress_logger = MyBarLogger()
+        # Tham số để tạo lại VideoProcessor trong worker process
+        self._options = {
+            'output_dir': output_dir, 'fps': fps, 'video_codec': video_codec,
+            'audio_codec': audio_codec, 'engine': engine, 'still_fps': still_fps,
+            'merge_mode': merge_mode, 'workers': 1, 'threads': threads,
+            'resolution': resolution, 'background_cache_dir': background_cache_dir,
+        }
+
+    @property
+    def background_cache(self):
+        if self._background_cache is None:
+            self._background_cache = BackgroundCache(
+                # fps đầy đủ: video stream copy chỉ cắt được theo frame, 1 fps sẽ lệch tới 1s mỗi segment
+                self.background_cache_dir, fps=self.fps, video_codec=self.video_codec
+            )
+        return self._background_cache
         
-    def create_video(self, audio_files, background_image, output_dir):
+    def create_video(self, audio_files, background_image, output_dir, manifest=None):
         """
-        Create complete video from audio files and background image
+        Create complete video from audio files and background image.
+        With a BuildManifest, segments and the final merge are only
+        rebuilt when their inputs changed.
         """
+        video_segments = self.render_segments(audio_files, background_image, output_dir, manifest)
+        return self.finalize_video(video_segments, audio_files, output_dir, manifest)
+
+    def render_segments(self, audio_files, background_image, output_dir, manifest=None):
+        """Render one video segment per audio file into output_dir/segments"""
         try:
             # Validate inputs
             self.validator.validate_files_exist([background_image, *audio_files])
             
             # Create output directories
             segments_dir = os.path.join(output_dir, "segments")
-            final_dir = os.path.join(output_dir, "final")
             self.file_helper.ensure_dir(segments_dir)
-            self.file_helper.ensure_dir(final_dir)
             
             # Create individual segments
             with self.performance.measure_time("Creating video segments"):
-                video_segments = self._create_segments(
+                return self._create_segments(
                     audio_files, 
                     background_image, 
-                    segments_dir
+                    segments_dir,
+                    manifest
                 )
             
+        except Exception as e:
+            self.logger.error(f"Error in video processing: {str(e)}")
+            raise
+
+    def finalize_video(self, video_segments, audio_files, output_dir, manifest=None):
+        """Merge rendered segments into output_dir/final and write its metadata"""
+        try:
+            final_dir = os.path.join(output_dir, "final")
+            self.file_helper.ensure_dir(final_dir)
+            
             # Merge segments
             with self.performance.measure_time("Merging video segments"):
-                final_video_path = self._merge_segments(
-                    video_segments,
-                    os.path.join(final_dir, "complete_story.mp4")
-                )
+                final_video_path = os.path.join(final_dir, "complete_story.mp4")
+                merge_inputs = None
+                if manifest is not None:
+                    merge_inputs = {
+                        "segments": [manifest.hash_of(path) for path in video_segments],
+                        "merge_mode": self.merge_mode,
+                    }
+                if merge_inputs is not None and manifest.is_fresh("video:final", merge_inputs):
+                    self.logger.info("Final video is up to date, skipping merge")
+                else:
+                    self._merge_segments(video_segments, final_video_path, manifest)
+                    if manifest is not None:
+                        manifest.record("video:final", final_video_path, merge_inputs)
             
-            # Add metadata
-            total_duration = 0
-            for audio_file in audio_files:
-                audio_clip = AudioFileClip(audio_file)
-                total_duration += audio_clip.duration
-                audio_clip.close()
+            # Add metadata (durations come from the media index, not from decoding)
+            total_duration = sum(self._media_info(audio_file, manifest)["duration"] for audio_file in audio_files)
+            video_info = self._media_info(final_video_path, manifest)
             
             metadata = {
                 'title': "Story Name",
                 'creation_date': datetime.now().isoformat(),
                 'segments': len(audio_files),
-                'duration': total_duration
+                'duration': total_duration,
+                'video_duration': video_info["duration"],
+                'size': video_info["size"],
+                'bitrate': video_info["bitrate"],
             }
             self.file_helper.save_json(filepath=os.path.join(final_dir, 'metadata.json'), data=metadata)
             
@@ -76,81 +212,357 @@ class VideoProcessor:
             self.logger.error(f"Error in video processing: {str(e)}")
             raise
             
-    def _create_segments(self, audio_files, background_image, output_dir):
-        """Create individual video segments for each audio file"""
-        video_paths = []
-        
-        for audio_file in audio_files:
+    def _create_segments(self, audio_files, background_image, output_dir, manifest=None):
+        """
+        Create individual video segments for each audio file, spreading the
+        stale ones over a process pool; paths are returned in audio order.
+        """
+        segment_settings = self.segment_settings(background_image, manifest)
+        plans = [
+            self.plan_segment(audio_file, background_image, output_dir, manifest, segment_settings)
+            for audio_file in audio_files
+        ]
+        stale = [plan for plan in plans if not plan.fresh]
+        # Nhiều story render cùng lúc: mỗi story chỉ dùng phần CPU của mình, tránh N x CPU process ffmpeg
+        cpus = max(1, available_cpus() // self.concurrent_jobs)
+        workers, threads = plan_render_workers(len(stale), self.engine, cpus)
+        if self.workers:
+            workers = max(1, min(self.workers, len(stale)))
+        threads = self.threads or threads
+
+        # Chỉ tính thông tin debug cho từng segment khi DEBUG đang bật
+        if self.logger.debug_enabled:
+            for i, plan in enumerate(plans, 1):
+                self.logger.debug("Segment {}/{}: {} ({} bytes, {})", i, len(plans), plan.audio_file,
+                                  os.path.getsize(plan.audio_file), "fresh" if plan.fresh else "stale")
+
+        if stale and self.engine == 'loop':
+            # Encode loop nền một lần ở process cha, trước khi các worker cùng cần đến nó
             try:
-                # Generate output path
-                base_name = os.path.splitext(os.path.basename(audio_file))[0]
-                video_path = os.path.join(output_dir, f"{base_name}.mp4")
-                
-                # Create video segment
-                with self.performance.measure_time(f"Processing segment {base_name}"):
-                    audio_clip = AudioFileClip(audio_file)
-                    image_clip = (ImageClip(background_image)
-                                .set_duration(audio_clip.duration)
-                                .set_fps(24))
-                    
-                    # Combine image and audio
-                    video = image_clip.set_audio(audio_clip)
-                    
-                    # Write video file with custom logger
-                    video.write_videofile(
-                        video_path,
-                        codec=self.video_codec,
-                        audio_codec=self.audio_codec,
-                        temp_audiofile='temp-audio.m4a',
-                        remove_temp=True,
-                        threads=4,  # Multithread support
-                        bitrate="2000k",  # Video quality
-                        logger=self.progress_logger
-                    )
-                    
-                    # Clean up
-                    video.close()
-                    audio_clip.close()
-                    image_clip.close()
-                    
-                video_paths.append(video_path)
-                
+                self.background_cache.get_or_create(background_image, self.resolution)
             except Exception as e:
-                self.logger.error(f"Failed to create segment from {audio_file}: {str(e)}")
-                raise
-                
-        return video_paths
+                self.logger.warning(f"Could not prepare background loop for {background_image}: {str(e)}")
+
+        if workers <= 1:
+            for plan in stale:
+                self._render_planned(plan, background_image, manifest, threads)
+        else:
+            self.logger.info(f"Rendering {len(stale)} segments with {workers} workers x {threads} threads")
+            self._render_parallel(stale, background_image, manifest, workers, threads)
+        return [plan.video_path for plan in plans]
+
+    def _render_parallel(self, plans, background_image, manifest, workers, threads):
+        """
+        Render planned segments in worker processes, recording each one as it
+        finishes. After a failure the segments not yet started are cancelled,
+        but every one that still completes is recorded before the error is
+        re-raised, so a resume only redoes what is actually missing.
+        """
+        # spawn: không fork một process đang có thread (loguru queue, TTS pool...)
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                 initializer=_init_render_worker, initargs=(self._options,)) as pool:
+            futures = {
+                pool.submit(_render_in_worker, plan.audio_file, background_image, plan.video_path,
+                            self._media_info(plan.audio_file, manifest)["duration"], threads): plan
+                for plan in plans
+            }
+            error = None
+            for future in as_completed(futures):
+                if future.cancelled():
+                    continue
+                plan = futures[future]
+                try:
+                    pid, start, duration = future.result()
+                except Exception as e:
+                    self.logger.error(f"Failed to create segment from {plan.audio_file}: {str(e)}")
+                    if error is None:
+                        error = e
+                        # Bỏ các segment chưa bắt đầu, vẫn chờ và ghi nhận các segment đang render
+                        for other in futures:
+                            other.cancel()
+                    continue
+                self.performance.record_span(
+                    "Processing segment", start, duration, thread_id=pid,
+                    thread_name=f"render-worker-{pid}", segment=os.path.basename(plan.audio_file),
+                )
+                if manifest is not None:
+                    manifest.record(plan.key, plan.video_path, plan.inputs)
+            if error is not None:
+                raise error
+
+    def segment_settings(self, background_image, manifest=None):
+        """Inputs shared by every segment, recorded in the manifest alongside each segment's audio hash"""
+        if manifest is None:
+            return None
+        return {"background": manifest.hash_file(background_image), **self.render_settings()}
+
+    def render_settings(self):
+        """Encoder settings that change a rendered segment, independent of its inputs"""
+        return {
+            "engine": self.engine,
+            "fps": self.still_fps if self.engine == 'ffmpeg' else self.fps,
+            "resolution": list(self.resolution) if self.resolution else None,
+            "video_codec": self.video_codec,
+            "audio_codec": self.audio_codec,
+        }
+
+    def render_segment(self, audio_file, background_image, output_dir, manifest=None, segment_settings=None):
+        """Render the video segment for one audio file, unless the manifest says it is up to date"""
+        plan = self.plan_segment(audio_file, background_image, output_dir, manifest, segment_settings)
+        if not plan.fresh:
+            self._render_planned(plan, background_image, manifest, self.threads)
+        return plan.video_path
+
+    def plan_segment(self, audio_file, background_image, output_dir, manifest=None, segment_settings=None):
+        """Work out a segment's output path and manifest inputs, and whether it is up to date"""
+        # Generate output path
+        base_name = os.path.splitext(os.path.basename(audio_file))[0]
+        video_path = os.path.join(output_dir, f"{base_name}.mp4")
+
+        key = f"video:{base_name}"
+        inputs = None
+        fresh = False
+        if manifest is not None:
+            if segment_settings is None:
+                segment_settings = self.segment_settings(background_image, manifest)
+            inputs = {"audio": manifest.hash_of(audio_file), **segment_settings}
+            fresh = manifest.is_fresh(key, inputs)
+            if fresh:
+                self.logger.debug("Segment {} is up to date, skipping render", base_name)
+        return SegmentPlan(audio_file, video_path, key, inputs, fresh)
+
+    def _render_planned(self, plan, background_image, manifest=None, threads=None):
+        """Render one planned segment in this process and record it in the manifest"""
+        try:
+            base_name = os.path.splitext(os.path.basename(plan.audio_file))[0]
+            duration = self._media_info(plan.audio_file, manifest)["duration"]
+            with self.performance.measure_time("Processing segment", segment=base_name):
+                self._render_segment(plan.audio_file, background_image, plan.video_path, duration, threads)
+
+            if manifest is not None:
+                manifest.record(plan.key, plan.video_path, plan.inputs)
+
+        except Exception as e:
+            self.logger.error(f"Failed to create segment from {plan.audio_file}: {str(e)}")
+            raise
+
+
+    def _media_info(self, path, manifest=None):
+        """Media metadata for path, from the manifest's index when there is one"""
+        media = manifest.media_of(path) if manifest is not None else None
+        return media if media is not None else probe_media(path)
+
+    @unit_retry
+    def _render_segment(self, audio_file, background_image, video_path, duration=None, threads=None):
+        """
+        Render one segment with the configured engine inside a private
+        workspace next to the output, then move it into place, so concurrent
+        renders (other workers, other stories) never share temp files.
+        """
+        threads = threads or plan_render_workers(1, self.engine)[1]
+        workspace = tempfile.mkdtemp(prefix=".render-", dir=os.path.dirname(video_path) or ".")
+        try:
+            temp_video = os.path.join(workspace, os.path.basename(video_path))
+            engines = self.ENGINES[self.ENGINES.index(self.engine):]
+            for engine in engines[:-1]:
+                try:
+                    render = getattr(self, f"_render_segment_{engine}")
+                    render(audio_file, background_image, temp_video, duration, threads)
+                    break
+                except Exception as e:
+                    self.logger.warning(f"{engine} engine failed for {audio_file}, falling back: {str(e)}")
+            else:
+                self._render_segment_moviepy(audio_file, background_image, temp_video, workspace, threads)
+            os.replace(temp_video, video_path)
+        finally:
+            shutil.rmtree(workspace, ignore_errors=True)
+
+    def _render_segment_loop(self, audio_file, background_image, video_path, duration=None, threads=None):
+        """
+        Repeat the cached pre-encoded background clip by stream copy and mux
+        the audio in, so no video frames are encoded for the segment.
+        """
+        if duration is None:
+            duration = scan_mp3(audio_file).duration
+        loop_clip = self.background_cache.get_or_create(background_image, self.resolution)
+        run_ffmpeg([
+            "-stream_loop", "-1", "-i", loop_clip,
+            "-i", audio_file,
+            "-map", "0:v", "-map", "1:a",
+            "-c:v", "copy",
+            "-c:a", self.audio_codec, "-b:a", "192k",
+            "-t", f"{duration:.3f}", "-movflags", "+faststart",
+            video_path,
+        ], logger=self.logger)
+
+    def _render_segment_ffmpeg(self, audio_file, background_image, video_path, duration=None, threads=2):
+        """
+        Encode a looped still image at a low frame rate and mux the audio in a
+        single ffmpeg call, without passing frames or samples through Python.
+        """
+        # -shortest không dừng chính xác với input ảnh lặp, nên giới hạn bằng độ dài audio
+        if duration is None:
+            duration = scan_mp3(audio_file).duration
+        run_ffmpeg([
+            "-loop", "1", "-framerate", str(self.still_fps), "-t", f"{duration:.3f}", "-i", background_image,
+            "-i", audio_file,
+            "-map", "0:v", "-map", "1:a",
+            # libx264 với yuv420p cần kích thước chẵn
+            "-vf", "scale=trunc(iw/2)*2:trunc(ih/2)*2,setsar=1,format=yuv420p",
+            "-c:v", self.video_codec, "-tune", "stillimage", "-preset", "medium",
+            "-threads", str(threads), "-r", str(self.still_fps),
+            "-c:a", self.audio_codec, "-b:a", "192k",
+            "-t", f"{duration:.3f}", "-movflags", "+faststart",
+            video_path,
+        ], logger=self.logger)
+
+    def _render_segment_moviepy(self, audio_file, background_image, video_path, workspace, threads=4):
+        """Render a segment by pushing every frame through moviepy"""
+        # moviepy chỉ cần khi render hoặc merge bằng moviepy, import lúc dùng để khởi động nhanh
+        from moviepy.editor import AudioFileClip, ImageClip
+        audio_clip = AudioFileClip(audio_file)
+        image_clip = (ImageClip(background_image)
+                    .set_duration(audio_clip.duration)
+                    .set_fps(self.fps))
         
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
-    def _merge_segments(self, video_paths, output_path):
-        """Merge all video segments into final video with retry logic"""
-        clips = []
+        # Combine image and audio
+        video = image_clip.set_audio(audio_clip)
+        
+        # Write video file with custom logger
+        video.write_videofile(
+            video_path,
+            codec=self.video_codec,
+            audio_codec=self.audio_codec,
+            temp_audiofile=os.path.join(workspace, 'temp-audio.m4a'),
+            remove_temp=True,
+            threads=threads,
+            bitrate="2000k",  # Video quality
+            logger=self.progress_logger
+        )
+        
+        # Clean up
+        video.close()
+        audio_clip.close()
+        image_clip.close()
+
+    def _merge_segments(self, video_paths, output_path, manifest=None):
+        """
+        Merge segments into the final video by stream copy. Segments that
+        can't be copied together are first normalized one at a time, each
+        checkpointed in the manifest and retried on its own, so a transient
+        error never re-encodes the whole story.
+        """
+        if self.merge_mode == 'reencode' or not self._segments_compatible(video_paths, manifest):
+            video_paths = self._normalize_segments(video_paths, manifest)
+        return self._merge_segments_copy(video_paths, output_path)
+
+    def _segments_compatible(self, video_paths, manifest=None):
+        """True if every segment shares codec, resolution and timebase, so they can be stream-copied"""
         try:
-            for path in video_paths:
-                clip = VideoFileClip(path)
-                clips.append(clip)
-            
-            final_video = concatenate_videoclips(clips)
-            final_video.write_videofile(
-                output_path,
-                codec='libx264',
-                audio_codec='aac',
-                logger=self.progress_logger
-            )
+            all_streams = self._segment_streams(video_paths, manifest)
+        except Exception as e:
+            self.logger.warning(f"Could not probe segments, re-encoding merge: {str(e)}")
+            return False
+        reference = all_streams[0]
+        for path, streams in zip(video_paths[1:], all_streams[1:]):
+            if streams != reference:
+                self.logger.warning(
+                    f"Segment {path} does not match {video_paths[0]} ({streams} != {reference}), re-encoding merge"
+                )
+                return False
+        return True
+
+    def _segment_streams(self, video_paths, manifest=None):
+        """Stream parameters of every segment, from the MP4 headers (via the index) or ffprobe as a fallback"""
+        try:
+            all_streams = [self._media_info(path, manifest).get("streams") for path in video_paths]
+            if all(all_streams):
+                return all_streams
+        except (OSError, ValueError):
+            pass
+        # Không đọc được header của một segment: dùng ffprobe cho tất cả để so sánh cùng một nguồn
+        return [probe_streams(path) for path in video_paths]
+
+    @unit_retry
+    def _merge_segments_copy(self, video_paths, output_path):
+        """Join segments with the concat demuxer and stream copy, without re-encoding"""
+        list_file = write_concat_list(video_paths, f"{output_path}.txt")
+        temp_output = f"{output_path}.{uuid.uuid4().hex}.tmp.mp4"
+        try:
+            run_ffmpeg([
+                "-f", "concat", "-safe", "0", "-i", list_file,
+                "-c", "copy", "-movflags", "+faststart",
+                temp_output,
+            ], logger=self.logger)
+            os.replace(temp_output, output_path)
             return output_path
-            
         except Exception as e:
             self.logger.error(f"Failed to merge video segments: {str(e)}")
             raise
-            
         finally:
-            # Ensure all clips are closed
-            for clip in clips:
-                try:
-                    clip.close()
-                except:
-                    pass
-            try:
-                final_video.close()
-            except:
-                pass
\ No newline at end of file
+            os.remove(list_file)
+            if os.path.exists(temp_output):
+                os.remove(temp_output)
+
+    def _normalize_segments(self, video_paths, manifest=None):
+        """
+        Re-encode every segment to the first segment's resolution and audio
+        format (plus the configured codecs and fps) so they can be joined by
+        stream copy. Returns the normalized paths in order.
+        """
+        reference = {stream["type"]: stream for stream in self._segment_streams(video_paths[:1], manifest)[0]}
+        target = {
+            "width": reference.get("video", {}).get("width"),
+            "height": reference.get("video", {}).get("height"),
+            "sample_rate": reference.get("audio", {}).get("sample_rate") or 44100,
+            "channels": reference.get("audio", {}).get("channels") or 2,
+            "fps": self.fps,
+            "video_codec": self.video_codec,
+            "audio_codec": self.audio_codec,
+        }
+        normalized_paths = []
+        with self.performance.measure_time("Normalizing segments", segments=len(video_paths)):
+            for path in video_paths:
+                base_name = os.path.splitext(os.path.basename(path))[0]
+                normalized = os.path.join(os.path.dirname(path), "normalized", f"{base_name}.mp4")
+                key = f"video:norm:{base_name}"
+                inputs = None
+                if manifest is not None:
+                    inputs = {"segment": manifest.hash_of(path), **target}
+                    if manifest.is_fresh(key, inputs):
+                        normalized_paths.append(normalized)
+                        continue
+                self._normalize_segment(path, normalized, target)
+                if manifest is not None:
+                    manifest.record(key, normalized, inputs)
+                normalized_paths.append(normalized)
+        return normalized_paths
+
+    @unit_retry
+    def _normalize_segment(self, video_path, output_path, target):
+        """Re-encode one segment to the target format (one retryable unit)"""
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        temp_output = f"{output_path}.{uuid.uuid4().hex}.tmp.mp4"
+        video_filter = "setsar=1,format=yuv420p"
+        if target["width"] and target["height"]:
+            width, height = target["width"], target["height"]
+            video_filter = (
+                f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+                f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,{video_filter}"
+            )
+        try:
+            run_ffmpeg([
+                "-i", video_path,
+                "-vf", video_filter, "-r", str(target["fps"]),
+                "-c:v", target["video_codec"], "-preset", "medium",
+                "-threads", str(self.threads or plan_render_workers(1, 'moviepy')[1]),
+                "-c:a", target["audio_codec"], "-b:a", "192k",
+                "-ar", str(target["sample_rate"]), "-ac", str(target["channels"]),
+                "-movflags", "+faststart",
+                temp_output,
+            ], logger=self.logger)
+            os.replace(temp_output, output_path)
+        finally:
+            if os.path.exists(temp_output):
+                os.remove(temp_output)
@@ -0,0 +1,155 @@
+import json
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+from functools import lru_cache
+from .logger import Logger
+
+
+@lru_cache(maxsize=1)
+def get_ffmpeg_exe() -> str:
+    """Locate the ffmpeg binary, preferring the system one over moviepy's bundled copy"""
+    ffmpeg = os.getenv("FFMPEG_BINARY") or shutil.which("ffmpeg")
+    if ffmpeg:
+        return ffmpeg
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except Exception:
+        raise RuntimeError("ffmpeg binary not found; install FFmpeg or imageio-ffmpeg")
+
+
+def run_ffmpeg(args, logger: Logger = None) -> None:
+    """Run ffmpeg with the given arguments, raising RuntimeError with its stderr on failure"""
+    cmd = [get_ffmpeg_exe(), "-hide_banner", "-loglevel", "error", "-y", *args]
+    if logger is not None and logger.debug_enabled:
+        logger.debug("Running: {}", " ".join(cmd))
+    result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        stderr = result.stderr.decode('utf-8', errors='replace').strip()
+        raise RuntimeError(f"ffmpeg exited with code {result.returncode}: {stderr[-2000:]}")
+
+
+def open_ffmpeg(args, stdin=None, stdout=None, logger: Logger = None) -> subprocess.Popen:
+    """
+    Start ffmpeg without waiting for it, e.g. with stdin/stdout=subprocess.PIPE
+    to stream raw samples through it. Finish with wait_ffmpeg().
+    """
+    cmd = [get_ffmpeg_exe(), "-hide_banner", "-loglevel", "error", "-y", *args]
+    if logger is not None and logger.debug_enabled:
+        logger.debug("Running: {}", " ".join(cmd))
+    # stderr vào file tạm: pipe đầy sẽ chặn ffmpeg khi ta chỉ đọc stdout
+    stderr = tempfile.TemporaryFile()
+    try:
+        process = subprocess.Popen(cmd, stdin=stdin, stdout=stdout or subprocess.DEVNULL, stderr=stderr)
+    except Exception:
+        stderr.close()
+        raise
+    process.stderr_file = stderr
+    return process
+
+
+def wait_ffmpeg(process: subprocess.Popen) -> None:
+    """Wait for an open_ffmpeg() process, raising RuntimeError with its stderr on failure"""
+    for stream in (process.stdin, process.stdout):
+        if stream is not None:
+            stream.close()
+    returncode = process.wait()
+    with process.stderr_file as stderr_file:
+        stderr_file.seek(0)
+        stderr = stderr_file.read().decode('utf-8', errors='replace').strip()
+    if returncode != 0:
+        raise RuntimeError(f"ffmpeg exited with code {returncode}: {stderr[-2000:]}")
+
+
+def write_concat_list(paths, list_path: str) -> str:
+    """Write an ffmpeg concat-demuxer list file for the given media paths"""
+    with open(list_path, 'w', encoding='utf-8') as f:
+        for path in paths:
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+    return list_path
+
+
+@lru_cache(maxsize=1)
+def get_ffprobe_exe():
+    """Locate ffprobe if it is installed; moviepy's bundled ffmpeg ships without it"""
+    return os.getenv("FFPROBE_BINARY") or shutil.which("ffprobe")
+
+
+def probe_streams(path: str) -> list:
+    """
+    Return a normalized description of each stream in a media file:
+    codec, resolution, pixel format and timebase for video; codec,
+    sample rate and channel count for audio.
+    """
+    ffprobe = get_ffprobe_exe()
+    if ffprobe:
+        result = subprocess.run(
+            [ffprobe, "-v", "error", "-of", "json", "-show_entries",
+             "stream=codec_type,codec_name,width,height,pix_fmt,time_base,sample_rate,channels",
+             path],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"ffprobe failed for {path}: {result.stderr.decode('utf-8', errors='replace').strip()}")
+        streams = []
+        for stream in json.loads(result.stdout).get("streams", []):
+            if stream.get("codec_type") == "video":
+                streams.append({
+                    "type": "video",
+                    "codec": stream.get("codec_name"),
+                    "width": stream.get("width"),
+                    "height": stream.get("height"),
+                    "pix_fmt": stream.get("pix_fmt"),
+                    "timebase": stream.get("time_base", "").split("/")[-1],
+                })
+            elif stream.get("codec_type") == "audio":
+                streams.append({
+                    "type": "audio",
+                    "codec": stream.get("codec_name"),
+                    "sample_rate": int(stream.get("sample_rate", 0)),
+                    "channels": stream.get("channels"),
+                })
+        return streams
+
+    # Không có ffprobe: đọc thông tin stream từ stderr của `ffmpeg -i`
+    result = subprocess.run([get_ffmpeg_exe(), "-hide_banner", "-i", path],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    streams = []
+    for line in result.stderr.decode('utf-8', errors='replace').splitlines():
+        video = _VIDEO_STREAM_RE.search(line)
+        if video:
+            streams.append({
+                "type": "video",
+                "codec": video.group("codec"),
+                "width": int(video.group("width")),
+                "height": int(video.group("height")),
+                "pix_fmt": video.group("pix_fmt"),
+                "timebase": (_TBN_RE.search(line) or [None, None])[1],
+            })
+            continue
+        audio = _AUDIO_STREAM_RE.search(line)
+        if audio:
+            layout = audio.group("layout")
+            streams.append({
+                "type": "audio",
+                "codec": audio.group("codec"),
+                "sample_rate": int(audio.group("sample_rate")),
+                "channels": _CHANNEL_LAYOUTS.get(layout, layout),
+            })
+    if not streams:
+        raise RuntimeError(f"Could not read stream info from {path}")
+    return streams
+
+
+_VIDEO_STREAM_RE = re.compile(
+    r"Stream #\d+:\d+.*?: Video: (?P<codec>\w+)[^,]*, (?P<pix_fmt>\w+)(?:\([^)]*\))?, (?P<width>\d+)x(?P<height>\d+)"
+)
+_AUDIO_STREAM_RE = re.compile(
+    r"Stream #\d+:\d+.*?: Audio: (?P<codec>\w+)[^,]*, (?P<sample_rate>\d+) Hz, (?P<layout>[\w.()]+)"
+)
+_TBN_RE = re.compile(r"(\d+(?:\.\d+)?k?) tbn")
+_CHANNEL_LAYOUTS = {"mono": 1, "stereo": 2}
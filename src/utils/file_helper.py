@@ -2,8 +2,12 @@ import os
 import shutil
 import json
 import re
+import uuid
 from .logger import Logger
 
+# ioctl FICLONE của Linux: reflink (copy-on-write) trên btrfs, XFS...
+_FICLONE = 0x40049409
+
 class FileHelper:
     def __init__(self):
         self.logger = Logger(__name__)
@@ -18,15 +22,44 @@ class FileHelper:
                 self.logger.debug(f"Created directory: {directory}")
             return directory  # Return the normalized path
             
+    @staticmethod
+    def link_or_copy(src, dst):
+        """
+        Make dst share src's data instead of duplicating it: a hardlink when
+        both are on the same filesystem, else a reflink where supported,
+        else a plain copy. dst is replaced atomically. Returns the method used.
+        """
+        temp_path = f"{dst}.{uuid.uuid4().hex}.tmp"
+        try:
+            try:
+                os.link(src, temp_path)
+                method = "hardlink"
+            except OSError:
+                try:
+                    import fcntl
+                    with open(src, 'rb') as s, open(temp_path, 'wb') as d:
+                        fcntl.ioctl(d.fileno(), _FICLONE, s.fileno())
+                    method = "reflink"
+                except (ImportError, OSError):
+                    shutil.copyfile(src, temp_path)
+                    method = "copy"
+            os.replace(temp_path, dst)
+            return method
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
     def clean_filename(self, filename):
         """Remove invalid characters from filename"""
         return "".join(c for c in filename if c.isalnum() or c in (' ', '-', '_')).strip()
         
     def save_text(self, file_path, content):
-        """Save text content to file"""
+        """Save text content to file (written to a temp file and renamed, never half-written)"""
         try:
-            with open(file_path, 'w', encoding='utf-8') as f:
+            temp_path = f"{file_path}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
                 f.write(content)
+            os.replace(temp_path, file_path)
             self.logger.debug(f"Saved text to: {file_path}")
         except Exception as e:
             self.logger.error(f"Failed to save text file {file_path}: {str(e)}")
@@ -1,32 +1,71 @@
 from loguru import logger
 import sys
 import os
+import threading
+
+LOG_FORMAT = "{time:YYYY-MM-DD HH:mm:ss} | {level} | {name} | {message}"
+
+_configure_lock = threading.Lock()
+_configured = False
+_min_level = None
+_DEBUG = logger.level("DEBUG").no
+
+
+def configure_logging(level: str = None, json: bool = None, log_dir: str = None, force: bool = False):
+    """
+    Configure the process-wide loguru sinks once.
+
+    Defaults come from LOG_LEVEL (INFO), LOG_JSON and LOG_DIR (logs). Both
+    sinks are enqueued, so writes happen on loguru's background thread and
+    never block the caller; records below the level are dropped before
+    the message is formatted. Later calls are no-ops unless force=True.
+    """
+    global _configured, _min_level
+    with _configure_lock:
+        if _configured and not force:
+            return
+        level = (level or os.getenv("LOG_LEVEL", "INFO")).upper()
+        if json is None:
+            json = os.getenv("LOG_JSON", "").lower() in ("1", "true", "yes")
+        log_dir = log_dir or os.getenv("LOG_DIR", "logs")
+
+        logger.remove()
+        # serialize=True: mỗi record là một dòng JSON (message, level, time, extra...)
+        logger.add(sys.stderr, level=level, format=LOG_FORMAT, serialize=json, enqueue=True)
+        logger.add(os.path.join(log_dir, "app.log"), level=level, format=LOG_FORMAT,
+                   serialize=json, enqueue=True, rotation="10 MB")
+        _min_level = logger.level(level).no
+        _configured = True
+
 
 class Logger:
+    """
+    Thin per-component handle on the shared loguru logger.
+
+    Messages may use loguru's lazy formatting, e.g.
+    logger.debug("Rendered {} in {:.2f}s", name, elapsed), so nothing is
+    formatted when the level is disabled.
+    """
+
     def __init__(self, name):
-        self.logger = logger
-        
-        # Configure logger
-        log_format = "{time:YYYY-MM-DD HH:mm:ss} | {level} | {name} | {message}"
-        
-        # Remove default handler
-        self.logger.remove()
-        
-        # Add console handler
-        self.logger.add(sys.stderr, format=log_format)
-        
-        # Add file handler
-        log_path = os.path.join("logs", f"{name}.log")
-        self.logger.add(log_path, rotation="10 MB", format=log_format)
-        
-    def info(self, message):
-        self.logger.info(message)
-        
-    def error(self, message):
-        self.logger.error(message)
-        
-    def debug(self, message):
-        self.logger.debug(message)
-        
-    def warning(self, message):
-        self.logger.warning(message) 
\ No newline at end of file
+        configure_logging()
+        # depth=1: {name} trong format là module gọi log, không phải src.utils.logger
+        self.logger = logger.bind(component=name).opt(depth=1)
+        self.name = name
+
+    @property
+    def debug_enabled(self) -> bool:
+        """Cheap check for guarding expensive debug-only work"""
+        return _min_level <= _DEBUG
+
+    def info(self, message, *args, **kwargs):
+        self.logger.info(message, *args, **kwargs)
+
+    def error(self, message, *args, **kwargs):
+        self.logger.error(message, *args, **kwargs)
+
+    def debug(self, message, *args, **kwargs):
+        self.logger.debug(message, *args, **kwargs)
+
+    def warning(self, message, *args, **kwargs):
+        self.logger.warning(message, *args, **kwargs)
@@ -0,0 +1,36 @@
+import os
+from .mp3_helper import scan_mp3
+from .mp4_helper import scan_mp4
+
+
+def probe_media(path: str) -> dict:
+    """
+    Describe an MP3 or MP4 file from its headers alone: duration, average
+    bitrate, sample rate, channels and size, plus stream parameters for MP4.
+    Raises ValueError for other formats or unreadable headers.
+    """
+    size = os.path.getsize(path)
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".mp3":
+        info = scan_mp3(path)
+        return {
+            "format": "mp3",
+            "duration": info.duration,
+            "bitrate": info.bitrate,
+            "sample_rate": info.sample_rate,
+            "channels": info.channels,
+            "size": size,
+        }
+    if extension in (".mp4", ".m4a", ".mov"):
+        info = scan_mp4(path)
+        audio = next((s for s in info.streams if s["type"] == "audio"), {})
+        return {
+            "format": "mp4",
+            "duration": info.duration,
+            "bitrate": int(size * 8 / info.duration) if info.duration else 0,
+            "sample_rate": audio.get("sample_rate"),
+            "channels": audio.get("channels"),
+            "size": size,
+            "streams": info.streams,
+        }
+    raise ValueError(f"Unsupported media format: {path}")
@@ -0,0 +1,303 @@
+"""
+Minimal MPEG audio frame parser used to join MP3 files without decoding.
+
+Only the frame headers are inspected: ID3v2 tags, Xing/Info/VBRI header
+frames and any trailing tags (ID3v1, APE) are skipped so the remaining
+frames can be copied byte-for-byte into a merged file.
+"""
+from typing import NamedTuple, Optional, Tuple
+import os
+
+# Bitrate tables in kbps, indexed by [version_is_mpeg1][layer][bitrate_index]
+_BITRATES = {
+    True: {
+        1: (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+        2: (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+        3: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    },
+    False: {
+        1: (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+        2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+        3: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    },
+}
+
+# Sample rates in Hz, indexed by version bits then sample rate index
+_SAMPLE_RATES = {
+    3: (44100, 48000, 32000),  # MPEG 1
+    2: (22050, 24000, 16000),  # MPEG 2
+    0: (11025, 12000, 8000),   # MPEG 2.5
+}
+
+_LAYERS = {3: 1, 2: 2, 1: 3}
+
+READ_BLOCK_SIZE = 1024 * 1024
+
+
+class FrameHeader(NamedTuple):
+    version: int       # raw version bits: 3 = MPEG1, 2 = MPEG2, 0 = MPEG2.5
+    layer: int         # 1, 2 or 3
+    bitrate: int       # bits per second
+    sample_rate: int
+    channels: int
+    protected: bool
+    frame_length: int
+    samples: int
+
+    @property
+    def params(self) -> Tuple[int, int, int, int]:
+        """Codec parameters that must match for frames to be concatenated"""
+        return (self.version, self.layer, self.sample_rate, self.channels)
+
+
+class Mp3Info(NamedTuple):
+    params: Tuple[int, int, int, int]
+    data_start: int    # offset of the first audio frame (after tags and Xing frame)
+    data_end: int      # offset just past the last audio frame
+    frames: int
+    duration: float
+    bitrate: int       # average bits per second
+    sample_rate: int
+    channels: int
+
+
+def parse_frame_header(data, offset: int = 0) -> Optional[FrameHeader]:
+    """Parse a 4-byte MPEG audio frame header, or return None if it isn't one"""
+    if offset + 4 > len(data):
+        return None
+    b0, b1, b2, b3 = data[offset], data[offset + 1], data[offset + 2], data[offset + 3]
+    if b0 != 0xFF or (b1 & 0xE0) != 0xE0:
+        return None
+
+    version = (b1 >> 3) & 0x03
+    layer_bits = (b1 >> 1) & 0x03
+    bitrate_index = (b2 >> 4) & 0x0F
+    sample_rate_index = (b2 >> 2) & 0x03
+    if version == 1 or layer_bits == 0 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        # Reserved values, or free-format bitrate which can't be framed from the header alone
+        return None
+
+    mpeg1 = version == 3
+    layer = _LAYERS[layer_bits]
+    bitrate = _BITRATES[mpeg1][layer][bitrate_index] * 1000
+    sample_rate = _SAMPLE_RATES[version][sample_rate_index]
+    padding = (b2 >> 1) & 0x01
+    channels = 1 if (b3 >> 6) == 3 else 2
+
+    if layer == 1:
+        samples = 384
+        frame_length = (12 * bitrate // sample_rate + padding) * 4
+    elif layer == 2 or mpeg1:
+        samples = 1152
+        frame_length = 144 * bitrate // sample_rate + padding
+    else:
+        samples = 576
+        frame_length = 72 * bitrate // sample_rate + padding
+
+    return FrameHeader(
+        version=version,
+        layer=layer,
+        bitrate=bitrate,
+        sample_rate=sample_rate,
+        channels=channels,
+        protected=not (b1 & 0x01),
+        frame_length=frame_length,
+        samples=samples,
+    )
+
+
+def id3v2_size(data, offset: int = 0) -> int:
+    """Return the total size of an ID3v2 tag at offset, or 0 if there is none"""
+    if len(data) - offset < 10 or bytes(data[offset:offset + 3]) != b'ID3':
+        return 0
+    flags = data[offset + 5]
+    size = 0
+    for b in data[offset + 6:offset + 10]:
+        size = (size << 7) | (b & 0x7F)
+    footer = 10 if flags & 0x10 else 0
+    return 10 + size + footer
+
+
+def is_info_frame(data, offset: int, header: FrameHeader) -> bool:
+    """True if the frame at offset is a Xing/Info or VBRI header rather than audio"""
+    if header.layer != 3:
+        return False
+    if header.version == 3:
+        side_info = 17 if header.channels == 1 else 32
+    else:
+        side_info = 9 if header.channels == 1 else 17
+    tag_offset = offset + 4 + (2 if header.protected else 0) + side_info
+    if bytes(data[tag_offset:tag_offset + 4]) in (b'Xing', b'Info'):
+        return True
+    return bytes(data[offset + 36:offset + 40]) == b'VBRI'
+
+
+def scan_mp3(path: str) -> Mp3Info:
+    """
+    Walk the frame headers of an MP3 file without decoding any audio.
+    Raises ValueError if no MPEG audio frames are found.
+    """
+    file_size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        head = f.read(min(file_size, READ_BLOCK_SIZE))
+        offset = id3v2_size(head)
+
+        # Dò frame hợp lệ đầu tiên (một số encoder để padding sau tag)
+        f.seek(offset)
+        block = f.read(READ_BLOCK_SIZE)
+        pos = 0
+        header = None
+        while pos + 4 <= len(block):
+            header = parse_frame_header(block, pos)
+            if header is not None:
+                following = parse_frame_header(block, pos + header.frame_length)
+                if following is not None or pos + header.frame_length >= len(block):
+                    break
+            header = None
+            pos += 1
+        if header is None:
+            raise ValueError(f"No MPEG audio frames found in {path}")
+
+        data_start = offset + pos
+        if is_info_frame(block, pos, header):
+            data_start += header.frame_length
+
+        params = None
+        frames = 0
+        samples = 0
+        frame_bytes = 0
+        offset = data_start
+        buffer = b''
+        buffer_start = offset
+        f.seek(offset)
+        while True:
+            rel = offset - buffer_start
+            if rel + 4 > len(buffer):
+                f.seek(offset)
+                buffer = f.read(READ_BLOCK_SIZE)
+                buffer_start = offset
+                rel = 0
+            header = parse_frame_header(buffer, rel)
+            if header is None or offset + header.frame_length > file_size:
+                break
+            if params is None:
+                params = header.params
+            elif header.params != params:
+                raise ValueError(f"Codec parameters change mid-stream in {path}")
+            frames += 1
+            samples += header.samples
+            frame_bytes += header.frame_length
+            offset += header.frame_length
+
+    if params is None:
+        raise ValueError(f"No MPEG audio frames found in {path}")
+
+    sample_rate = params[2]
+    duration = samples / sample_rate
+    return Mp3Info(
+        params=params,
+        data_start=data_start,
+        data_end=offset,
+        frames=frames,
+        duration=duration,
+        bitrate=int(frame_bytes * 8 / duration) if duration else 0,
+        sample_rate=sample_rate,
+        channels=params[3],
+    )
+
+
+class Mp3StreamWriter:
+    """
+    Appends several MP3 byte streams to one file, frame by frame.
+
+    Bytes can be fed in arbitrary pieces as they arrive from the network;
+    only complete frames are written, ID3v2 tags and the Xing/Info header
+    frame at the start of each part are dropped, and anything that isn't an
+    MPEG frame (e.g. trailing ID3v1/APE tags) is skipped. At most one frame
+    plus the last fed piece is held in memory.
+    """
+
+    def __init__(self, fileobj):
+        self.out = fileobj
+        self.params = None
+        self.frames = 0
+        self.bytes_written = 0
+        self._buffer = bytearray()
+        self._skip = 0
+        self._at_part_start = True
+        self._first_frame = True
+        self._part_start = None
+
+    def begin_part(self) -> None:
+        """Start a new MP3 stream (which may carry its own tags and Xing header)"""
+        self._buffer.clear()
+        self._skip = 0
+        self._at_part_start = True
+        self._first_frame = True
+        self._part_start = (self.out.tell(), self.frames, self.bytes_written)
+
+    def abort_part(self) -> None:
+        """Discard everything written since begin_part, so the part can be retried"""
+        offset, self.frames, self.bytes_written = self._part_start
+        self.out.seek(offset)
+        self.out.truncate()
+        self.begin_part()
+
+    def write(self, data: bytes) -> None:
+        if self._skip:
+            skipped = min(self._skip, len(data))
+            self._skip -= skipped
+            data = data[skipped:]
+        self._buffer += data
+        self._drain()
+
+    def end_part(self) -> None:
+        """Finish the current stream, discarding any incomplete trailing frame or tag"""
+        self._drain()
+        self._buffer.clear()
+
+    def _drain(self) -> None:
+        buffer = self._buffer
+        pos = 0
+        while True:
+            if self._at_part_start:
+                if len(buffer) - pos < 10:
+                    break
+                tag_size = id3v2_size(buffer, pos)
+                self._at_part_start = False
+                if tag_size:
+                    available = len(buffer) - pos
+                    if tag_size > available:
+                        self._skip = tag_size - available
+                        pos = len(buffer)
+                        break
+                    pos += tag_size
+                    continue
+
+            if len(buffer) - pos < 4:
+                break
+            header = parse_frame_header(buffer, pos)
+            if header is None:
+                # Không phải frame: dò tới byte sync tiếp theo
+                next_sync = buffer.find(b'\xff', pos + 1)
+                pos = next_sync if next_sync != -1 else len(buffer)
+                continue
+            if len(buffer) - pos < header.frame_length:
+                break
+
+            if self._first_frame:
+                self._first_frame = False
+                if is_info_frame(buffer, pos, header):
+                    pos += header.frame_length
+                    continue
+            if self.params is None:
+                self.params = header.params
+            elif header.params != self.params:
+                raise ValueError(f"MP3 stream parameters changed from {self.params} to {header.params}")
+
+            self.out.write(buffer[pos:pos + header.frame_length])
+            self.frames += 1
+            self.bytes_written += header.frame_length
+            pos += header.frame_length
+
+        del buffer[:pos]
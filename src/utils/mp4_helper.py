@@ -0,0 +1,137 @@
+"""
+Minimal ISO-BMFF (MP4/M4A) header parser.
+
+Reads only the moov box: the movie duration from mvhd and, per track,
+the timescale (mdhd), handler type (hdlr) and first sample description
+(stsd), which is enough to get durations and compare stream parameters
+without starting ffprobe or decoding anything.
+"""
+from typing import Iterator, List, NamedTuple, Tuple
+import os
+import struct
+
+# fourcc của sample entry -> tên codec như ffprobe báo
+_CODECS = {
+    "avc1": "h264", "avc3": "h264",
+    "hvc1": "hevc", "hev1": "hevc",
+    "mp4a": "aac",
+    "Opus": "opus",
+    ".mp3": "mp3",
+}
+
+
+class Mp4Info(NamedTuple):
+    duration: float
+    streams: List[dict]   # normalized like ffmpeg_helper.probe_streams, minus pix_fmt
+
+
+def _iter_boxes(data: bytes, start: int, end: int) -> Iterator[Tuple[str, int, int]]:
+    """Yield (type, payload_start, box_end) for each box in data[start:end]"""
+    offset = start
+    while offset + 8 <= end:
+        size, box_type = struct.unpack_from(">I4s", data, offset)
+        header_size = 8
+        if size == 1:
+            size = struct.unpack_from(">Q", data, offset + 8)[0]
+            header_size = 16
+        elif size == 0:
+            size = end - offset
+        if size < header_size or offset + size > end:
+            raise ValueError("Truncated MP4 box")
+        yield box_type.decode('latin-1'), offset + header_size, offset + size
+        offset += size
+
+
+def _find(data: bytes, start: int, end: int, box_type: str):
+    for found, payload, box_end in _iter_boxes(data, start, end):
+        if found == box_type:
+            return payload, box_end
+    return None
+
+
+def _read_duration(data: bytes, payload: int) -> Tuple[int, int]:
+    """(timescale, duration) from an mvhd or mdhd payload"""
+    version = data[payload]
+    if version == 1:
+        return struct.unpack_from(">IQ", data, payload + 20)
+    return struct.unpack_from(">II", data, payload + 12)
+
+
+def _read_moov(path: str) -> bytes:
+    """Return the moov box payload, seeking over mdat and other top-level boxes"""
+    file_size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        offset = 0
+        while offset + 8 <= file_size:
+            f.seek(offset)
+            header = f.read(16)
+            size, box_type = struct.unpack_from(">I4s", header)
+            header_size = 8
+            if size == 1:
+                size = struct.unpack_from(">Q", header, 8)[0]
+                header_size = 16
+            elif size == 0:
+                size = file_size - offset
+            if size < header_size:
+                break
+            if box_type == b"moov":
+                f.seek(offset + header_size)
+                return f.read(size - header_size)
+            offset += size
+    raise ValueError(f"No moov box found in {path}")
+
+
+def _parse_track(data: bytes, start: int, end: int):
+    mdia = _find(data, start, end, "mdia")
+    if mdia is None:
+        return None
+    mdhd = _find(data, *mdia, "mdhd")
+    hdlr = _find(data, *mdia, "hdlr")
+    if mdhd is None or hdlr is None:
+        return None
+    timescale, _ = _read_duration(data, mdhd[0])
+    handler = data[hdlr[0] + 8:hdlr[0] + 12].decode('latin-1')
+
+    entry_type, entry = None, None
+    stbl = None
+    minf = _find(data, *mdia, "minf")
+    if minf is not None:
+        stbl = _find(data, *minf, "stbl")
+    if stbl is not None:
+        stsd = _find(data, *stbl, "stsd")
+        if stsd is not None:
+            # Bỏ qua version/flags và entry_count, lấy sample entry đầu tiên
+            for entry_type, entry, _ in _iter_boxes(data, stsd[0] + 8, stsd[1]):
+                break
+    codec = _CODECS.get(entry_type, entry_type)
+
+    if handler == "vide":
+        width, height = struct.unpack_from(">HH", data, entry + 24) if entry is not None else (None, None)
+        return {"type": "video", "codec": codec, "width": width, "height": height, "timebase": str(timescale)}
+    if handler == "soun":
+        channels, sample_rate = None, timescale
+        if entry is not None:
+            channels = struct.unpack_from(">H", data, entry + 16)[0]
+            sample_rate = struct.unpack_from(">I", data, entry + 24)[0] >> 16 or timescale
+        return {"type": "audio", "codec": codec, "sample_rate": sample_rate, "channels": channels}
+    return None
+
+
+def scan_mp4(path: str) -> Mp4Info:
+    """Read duration and stream parameters from an MP4 file's moov box"""
+    try:
+        moov = _read_moov(path)
+        mvhd = _find(moov, 0, len(moov), "mvhd")
+        if mvhd is None:
+            raise ValueError(f"No mvhd box found in {path}")
+        timescale, duration = _read_duration(moov, mvhd[0])
+
+        streams = []
+        for box_type, payload, box_end in _iter_boxes(moov, 0, len(moov)):
+            if box_type == "trak":
+                stream = _parse_track(moov, payload, box_end)
+                if stream is not None:
+                    streams.append(stream)
+    except struct.error as e:
+        raise ValueError(f"Malformed MP4 header in {path}: {e}")
+    return Mp4Info(duration / timescale if timescale else 0.0, streams)
@@ -1,35 +1,526 @@
+import json
+import math
+import os
+import platform
+import re
+import sys
+import threading
 import time
+import tracemalloc
 from contextlib import contextmanager
 from .logger import Logger
 
+try:
+    import resource
+except ImportError:  # Windows: không có getrusage, bỏ qua số liệu CPU/RSS
+    resource = None
+
+
+def _maxrss_bytes(who):
+    usage = resource.getrusage(who).ru_maxrss
+    # Linux báo KB, macOS báo bytes
+    return usage if sys.platform == "darwin" else usage * 1024
+
+
+def _format_bytes(size):
+    sign = "-" if size < 0 else ""
+    size = abs(size)
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{sign}{size:.0f} {unit}" if unit == "B" else f"{sign}{size:.1f} {unit}"
+        size /= 1024
+    return f"{sign}{size:.2f} GB"
+
+
 class PerformanceMonitor:
+    """
+    Collects timing spans for pipeline operations.
+
+    Spans nest per thread, so an operation measured inside another one is
+    recorded as its child. Repeated operations keep every sample instead of
+    overwriting each other, and the report aggregates them into
+    count/total/min/max/p50/p95. Use PerformanceMonitor.shared() so that
+    every service records into the same monitor. Work handed to a pool
+    thread joins its submitter's tree through adopt(), so reports and
+    exports can be limited to the spans under one root span (e.g. one
+    story while others run concurrently).
+
+    Resource profiling is opt-in (configure_profiling or PROFILE_RESOURCES=1).
+    Every span then also records process CPU time, its own thread's CPU
+    time, CPU time and peak RSS of finished child processes (ffmpeg), the
+    process peak RSS and, with tracemalloc, the Python heap peak during the
+    span and the top allocation sites of the stage. One stage can also be
+    run under cProfile, dumping a .prof file per run.
+    """
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
     def __init__(self):
         self.logger = Logger(__name__)
-        self.metrics = {}
-        
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._next_id = 0
+        self.profiling = False
+        self.tracemalloc_top = 0
+        self.snapshot_depth = 2
+        self.cprofile_stage = None
+        self.profile_dir = "logs/profiles"
+        self._open_peaks = {}
+        self._cprofile_active = False
+        self.reset()
+        if os.getenv("PROFILE_RESOURCES", "").lower() in ("1", "true", "yes"):
+            self.configure_profiling(enabled=True)
+
+    def configure_profiling(self, enabled: bool = True, tracemalloc_top: int = None, cprofile_stage: str = None,
+                            profile_dir: str = None, snapshot_depth: int = None):
+        """
+        Turn per-span resource profiling on or off.
+
+        tracemalloc_top: allocation sites kept per stage (PROFILE_TRACEMALLOC_TOP,
+        default 10); 0 leaves tracemalloc off, which is much cheaper.
+        snapshot_depth: only spans this close to the root (1 = top level)
+        take tracemalloc snapshots, and only the first run of each; every
+        span still gets its heap peak.
+        cprofile_stage: span name to run under cProfile (PROFILE_STAGE); the
+        profile covers the thread that opened the span.
+        profile_dir: where .prof files go (PROFILE_DIR, default logs/profiles/).
+        """
+        self.profiling = enabled and resource is not None
+        if tracemalloc_top is None:
+            tracemalloc_top = int(os.getenv("PROFILE_TRACEMALLOC_TOP", "10"))
+        self.tracemalloc_top = tracemalloc_top if self.profiling else 0
+        self.cprofile_stage = (cprofile_stage or os.getenv("PROFILE_STAGE")) if self.profiling else None
+        self.profile_dir = profile_dir or os.getenv("PROFILE_DIR", "logs/profiles")
+        if snapshot_depth is not None:
+            self.snapshot_depth = snapshot_depth
+        if self.tracemalloc_top and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @classmethod
+    def shared(cls):
+        """Process-wide monitor shared by all services"""
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    def reset(self):
+        """Drop all recorded spans (including those of calls still running)"""
+        with self._lock:
+            self.spans = []
+            self._snapshot_paths = set()
+            self._origin = time.perf_counter()
+            self._origin_wall = time.time()
+
     @contextmanager
-    def measure_time(self, operation_name):
+    def measure_time(self, operation_name, **attributes):
         """Context manager to measure execution time"""
-        start_time = time.time()
+        stack = self._stack()
+        parent = stack[-1] if stack else None
+        with self._lock:
+            self._next_id += 1
+            span_id = self._next_id
+        thread = threading.current_thread()
+        span = {
+            'id': span_id,
+            'name': operation_name,
+            'parent': parent['id'] if parent else None,
+            'path': (*parent['path'], operation_name) if parent else (operation_name,),
+            'thread_id': thread.ident,
+            'thread_name': thread.name,
+            'attributes': attributes,
+            'start': time.perf_counter(),
+            'duration': None,
+        }
+        probe = self._begin_resources(span) if self.profiling else None
+        stack.append(span)
+        try:
+            yield span
+        finally:
+            span['duration'] = time.perf_counter() - span['start']
+            stack.pop()
+            if probe is not None:
+                span['resources'] = self._end_resources(span, probe)
+            with self._lock:
+                self.spans.append(span)
+            self.logger.debug("{} took {:.2f} seconds", operation_name, span['duration'])
+
+    def current_span(self):
+        """The innermost open span of the calling thread, or None"""
+        stack = self._stack()
+        return stack[-1] if stack else None
+
+    @contextmanager
+    def adopt(self, span):
+        """Nest spans opened by this thread under span, which another thread opened (no-op for None)"""
+        stack = self._stack()
+        if span is not None:
+            stack.append(span)
         try:
             yield
         finally:
-            execution_time = time.time() - start_time
-            self.metrics[operation_name] = execution_time
-            self.logger.debug(f"{operation_name} took {execution_time:.2f} seconds")
-            
-    def get_metrics(self):
-        """Return all collected metrics"""
-        return self.metrics
-        
-    def generate_report(self):
-        """Generate performance report"""
+            if span is not None:
+                stack.pop()
+
+    def discard(self, root):
+        """Drop a finished root span and everything recorded under it"""
+        with self._lock:
+            drop = {span['id'] for span in self._subtree(self.spans, root)}
+            self.spans = [span for span in self.spans if span['id'] not in drop]
+
+    def record_span(self, operation_name, start, duration, thread_id=None, thread_name=None, **attributes):
+        """
+        Record work that was timed elsewhere (e.g. in a worker process, with
+        time.perf_counter) as a child of the caller's current span.
+        """
+        stack = self._stack()
+        parent = stack[-1] if stack else None
+        thread = threading.current_thread()
+        with self._lock:
+            self._next_id += 1
+            self.spans.append({
+                'id': self._next_id,
+                'name': operation_name,
+                'parent': parent['id'] if parent else None,
+                'path': (*parent['path'], operation_name) if parent else (operation_name,),
+                'thread_id': thread_id if thread_id is not None else thread.ident,
+                'thread_name': thread_name or thread.name,
+                'attributes': attributes,
+                'start': start,
+                'duration': duration,
+            })
+
+    def get_metrics(self, root=None):
+        """Return per-operation statistics keyed by operation name (only under root, if given)"""
+        groups = {}
+        for span in self._snapshot(root):
+            groups.setdefault(span['name'], []).append(span['duration'])
+        return {name: self._stats(durations) for name, durations in groups.items()}
+
+    def generate_report(self, root=None):
+        """Generate performance report (only for the spans under root, if given)"""
+        spans = self._snapshot(root)
+        depth = len(root['path']) if root is not None else 1
+        groups = {}
+        for span in spans:
+            groups.setdefault(span['path'], []).append(span['duration'])
+
+        profiles = self._resource_profiles(spans)
+
         report = ["Performance Report:"]
-        total_time = 0
-        
-        for operation, duration in self.metrics.items():
-            report.append(f"- {operation}: {duration:.2f}s")
-            total_time += duration
-            
-        report.append(f"\nTotal execution time: {total_time:.2f}s")
-        return "\n".join(report) 
\ No newline at end of file
+        # Sắp xếp theo path để con nằm ngay dưới cha
+        for path in sorted(groups, key=lambda p: self._path_order(p, spans)):
+            stats = self._stats(groups[path])
+            indent = "  " * (len(path) - depth)
+            if stats['count'] == 1:
+                report.append(f"{indent}- {path[-1]}: {stats['total']:.2f}s")
+            else:
+                report.append(
+                    f"{indent}- {path[-1]}: {stats['total']:.2f}s total, {stats['count']} calls "
+                    f"(min {stats['min']:.2f}s, p50 {stats['p50']:.2f}s, "
+                    f"p95 {stats['p95']:.2f}s, max {stats['max']:.2f}s)"
+                )
+            profile = profiles.get(path)
+            if profile is not None:
+                report.extend(f"{indent}    {line}" for line in self._format_profile(profile))
+
+        report.append(f"\nTotal execution time: {self._wall_time(spans):.2f}s")
+        return "\n".join(report)
+
+    def export_json(self, filepath, root=None):
+        """Write every span (under root, if given) plus per-operation statistics to a JSON file"""
+        spans = self._snapshot(root)
+        origin, origin_wall = self._origin_of(root)
+        data = {
+            'started_at': origin_wall,
+            'total_time': self._wall_time(spans),
+            'operations': self.get_metrics(root),
+            'spans': [
+                {
+                    'id': span['id'],
+                    'name': span['name'],
+                    'parent': span['parent'],
+                    'path': list(span['path']),
+                    'thread': span['thread_name'],
+                    'start': span['start'] - origin,
+                    'duration': span['duration'],
+                    'attributes': span['attributes'],
+                    **({'resources': span['resources']} if 'resources' in span else {}),
+                }
+                for span in spans
+            ],
+        }
+        self._write_json(filepath, data)
+        return filepath
+
+    def profile_metrics(self, root=None):
+        """Resource usage aggregated per span path ("Parent / Child"), for comparing runs"""
+        return {
+            " / ".join(path): profile
+            for path, profile in self._resource_profiles(self._snapshot(root)).items()
+        }
+
+    def export_profile(self, filepath, root=None):
+        """Write the per-stage resource profile to a JSON file that can be diffed between releases"""
+        self._write_json(filepath, {
+            'started_at': self._origin_of(root)[1],
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'stages': self.profile_metrics(root),
+        })
+        return filepath
+
+    def _begin_resources(self, span):
+        probe = {
+            'self': resource.getrusage(resource.RUSAGE_SELF),
+            'children': resource.getrusage(resource.RUSAGE_CHILDREN),
+            'thread_cpu': time.thread_time(),
+            'maxrss': _maxrss_bytes(resource.RUSAGE_SELF),
+        }
+        if tracemalloc.is_tracing():
+            with self._lock:
+                self._observe_heap_peak()
+                probe['traced'] = tracemalloc.get_traced_memory()[0]
+                self._open_peaks[span['id']] = probe['traced']
+            # Snapshot tốn thời gian tỉ lệ với số allocation: chỉ chụp lần chạy đầu của mỗi stage
+            if self.tracemalloc_top and len(span['path']) <= self.snapshot_depth:
+                with self._lock:
+                    first_run = span['path'] not in self._snapshot_paths
+                    self._snapshot_paths.add(span['path'])
+                if first_run:
+                    probe['snapshot'] = tracemalloc.take_snapshot()
+        if span['name'] == self.cprofile_stage:
+            with self._lock:
+                # cProfile chỉ chạy một profile mỗi lúc
+                start_profile = not self._cprofile_active
+                self._cprofile_active = self._cprofile_active or start_profile
+            if start_profile:
+                import cProfile
+                probe['cprofile'] = cProfile.Profile()
+                probe['cprofile'].enable()
+        return probe
+
+    def _end_resources(self, span, probe):
+        profiler = probe.get('cprofile')
+        dump_path = None
+        if profiler is not None:
+            profiler.disable()
+            slug = re.sub(r"[^A-Za-z0-9]+", "_", span['name']).strip("_").lower()
+            dump_path = os.path.join(self.profile_dir, f"{slug}-{int(time.time())}-{span['id']}.prof")
+            os.makedirs(self.profile_dir, exist_ok=True)
+            profiler.dump_stats(dump_path)
+            with self._lock:
+                self._cprofile_active = False
+            self.logger.info(f"cProfile dump for '{span['name']}' written to {dump_path}")
+
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        before, children_before = probe['self'], probe['children']
+        maxrss = _maxrss_bytes(resource.RUSAGE_SELF)
+        result = {
+            # CPU của cả process (mọi thread) trong khoảng thời gian của span
+            'cpu_user': usage.ru_utime - before.ru_utime,
+            'cpu_system': usage.ru_stime - before.ru_stime,
+            'thread_cpu': time.thread_time() - probe['thread_cpu'],
+            # Child process (ffmpeg...) chỉ được tính khi đã kết thúc và được wait
+            'children_cpu': (children.ru_utime + children.ru_stime)
+                            - (children_before.ru_utime + children_before.ru_stime),
+            'children_max_rss': _maxrss_bytes(resource.RUSAGE_CHILDREN),
+            'max_rss': maxrss,
+            'rss_growth': maxrss - probe['maxrss'],
+        }
+        if 'traced' in probe:
+            with self._lock:
+                self._observe_heap_peak()
+                peak = self._open_peaks.pop(span['id'], probe['traced'])
+            current = tracemalloc.get_traced_memory()[0]
+            result['traced_peak'] = peak
+            result['traced_delta'] = current - probe['traced']
+        if 'snapshot' in probe:
+            result['top_allocations'] = self._top_allocations(probe['snapshot'])
+        if dump_path is not None:
+            result['cprofile'] = dump_path
+        return result
+
+    def _observe_heap_peak(self):
+        """Fold the heap peak since the last observation into every open span; caller holds the lock"""
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.reset_peak()
+        for span_id, span_peak in self._open_peaks.items():
+            if peak > span_peak:
+                self._open_peaks[span_id] = peak
+
+    def _top_allocations(self, start_snapshot):
+        filters = [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        ]
+        snapshot = tracemalloc.take_snapshot().filter_traces(filters)
+        diff = sorted(snapshot.compare_to(start_snapshot.filter_traces(filters), 'lineno'),
+                      key=lambda stat: stat.size_diff, reverse=True)
+        return [
+            {
+                'where': f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                'size_diff': stat.size_diff,
+                'count_diff': stat.count_diff,
+                'size': stat.size,
+            }
+            for stat in [stat for stat in diff if stat.size_diff > 0][:self.tracemalloc_top]
+        ]
+
+    def _resource_profiles(self, spans):
+        """Aggregate the resources of spans sharing a path: CPU summed, memory as the worst run"""
+        profiles = {}
+        for span in spans:
+            usage = span.get('resources')
+            if usage is None:
+                continue
+            profile = profiles.setdefault(span['path'], {
+                'count': 0, 'seconds': 0.0, 'cpu_seconds': 0.0, 'thread_cpu_seconds': 0.0,
+                'children_cpu_seconds': 0.0, 'children_max_rss_bytes': 0,
+                'max_rss_bytes': 0, 'rss_growth_bytes': 0,
+            })
+            profile['count'] += 1
+            profile['seconds'] += span['duration']
+            profile['cpu_seconds'] += usage['cpu_user'] + usage['cpu_system']
+            profile['thread_cpu_seconds'] += usage['thread_cpu']
+            profile['children_cpu_seconds'] += usage['children_cpu']
+            profile['children_max_rss_bytes'] = max(profile['children_max_rss_bytes'], usage['children_max_rss'])
+            profile['max_rss_bytes'] = max(profile['max_rss_bytes'], usage['max_rss'])
+            profile['rss_growth_bytes'] = max(profile['rss_growth_bytes'], usage['rss_growth'])
+            if 'traced_peak' in usage:
+                if usage['traced_peak'] >= profile.get('traced_peak_bytes', 0):
+                    profile['traced_peak_bytes'] = usage['traced_peak']
+                    if 'top_allocations' in usage:
+                        profile['top_allocations'] = usage['top_allocations']
+                profile['traced_delta_bytes'] = max(profile.get('traced_delta_bytes', 0), usage['traced_delta'])
+            if 'cprofile' in usage:
+                profile.setdefault('cprofile', []).append(usage['cprofile'])
+        return profiles
+
+    @staticmethod
+    def _format_profile(profile):
+        line = (
+            f"cpu {profile['cpu_seconds']:.2f}s (thread {profile['thread_cpu_seconds']:.2f}s), "
+            f"children {profile['children_cpu_seconds']:.2f}s, "
+            f"peak RSS {_format_bytes(profile['max_rss_bytes'])} (+{_format_bytes(profile['rss_growth_bytes'])})"
+        )
+        if 'traced_peak_bytes' in profile:
+            line += f", Python heap peak {_format_bytes(profile['traced_peak_bytes'])}"
+        lines = [line]
+        # Báo cáo chỉ in vài dòng đầu; file profile có đủ danh sách
+        for allocation in profile.get('top_allocations', [])[:3]:
+            lines.append(f"  {_format_bytes(allocation['size_diff']):>10}  {allocation['where']}")
+        for dump in profile.get('cprofile', []):
+            lines.append(f"  cProfile: {dump}")
+        return lines
+
+    def export_chrome_trace(self, filepath, root=None):
+        """Write spans (under root, if given) in Chrome trace-event format (chrome://tracing, Perfetto)"""
+        spans = self._snapshot(root)
+        origin = self._origin_of(root)[0]
+        pid = os.getpid()
+        events = []
+        threads = {}
+        for span in spans:
+            threads.setdefault(span['thread_id'], span['thread_name'])
+            events.append({
+                'name': span['name'],
+                'cat': span['path'][0],
+                'ph': 'X',
+                'ts': (span['start'] - origin) * 1e6,
+                'dur': span['duration'] * 1e6,
+                'pid': pid,
+                'tid': span['thread_id'],
+                'args': span['attributes'],
+            })
+        for thread_id, thread_name in threads.items():
+            events.append({
+                'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': thread_id,
+                'args': {'name': thread_name},
+            })
+        self._write_json(filepath, {'traceEvents': events, 'displayTimeUnit': 'ms'})
+        return filepath
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _snapshot(self, root=None):
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span['start'])
+        return spans if root is None else self._subtree(spans, root)
+
+    def _origin_of(self, root):
+        """Time origin for exports: the monitor's, or root's start when exporting one tree"""
+        if root is None:
+            return self._origin, self._origin_wall
+        return root['start'], self._origin_wall + (root['start'] - self._origin)
+
+    @staticmethod
+    def _subtree(spans, root):
+        """root and its descendants among spans, in their original order"""
+        children = {}
+        for span in spans:
+            children.setdefault(span['parent'], []).append(span['id'])
+        ids, pending = set(), [root['id']]
+        while pending:
+            span_id = pending.pop()
+            ids.add(span_id)
+            pending.extend(children.get(span_id, ()))
+        return [span for span in spans if span['id'] in ids]
+
+    @staticmethod
+    def _stats(durations):
+        ordered = sorted(durations)
+
+        def percentile(p):
+            # Nearest-rank percentile
+            rank = math.ceil(p / 100 * len(ordered))
+            return ordered[max(rank, 1) - 1]
+
+        return {
+            'count': len(ordered),
+            'total': sum(ordered),
+            'min': ordered[0],
+            'max': ordered[-1],
+            'p50': percentile(50),
+            'p95': percentile(95),
+        }
+
+    @staticmethod
+    def _path_order(path, spans):
+        # Thứ tự: theo thời điểm bắt đầu sớm nhất của từng tiền tố trong path
+        first_start = {}
+        for span in spans:
+            first_start.setdefault(span['path'], span['start'])
+        return tuple(first_start.get(path[:i + 1], 0) for i in range(len(path)))
+
+    @staticmethod
+    def _wall_time(spans):
+        """Length of the union of all span intervals, so nested or parallel work is not counted twice"""
+        total = 0.0
+        current_start = current_end = None
+        for span in spans:
+            start, end = span['start'], span['start'] + span['duration']
+            if current_end is None or start > current_end:
+                if current_end is not None:
+                    total += current_end - current_start
+                current_start, current_end = start, end
+            else:
+                current_end = max(current_end, end)
+        if current_end is not None:
+            total += current_end - current_start
+        return total
+
+    @staticmethod
+    def _write_json(filepath, data):
+        directory = os.path.dirname(filepath)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(filepath, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
@@ -1,6 +1,10 @@
 import os
+import re
 from .logger import Logger
 
+# ID trong URL docs.google.com/document/d/<id>/edit
+DOC_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]+$")
+
 class ValidationHelper:
     def __init__(self):
         self.logger = Logger(__name__)
@@ -13,7 +17,7 @@ class ValidationHelper:
                 
     def validate_google_doc_id(self, doc_id):
         """Validate Google Doc ID format"""
-        if not doc_id or not isinstance(doc_id, str):
+        if not doc_id or not isinstance(doc_id, str) or not DOC_ID_PATTERN.match(doc_id):
             raise ValueError("Invalid Google Doc ID")
             
     def validate_text_content(self, text):
@@ -38,6 +42,11 @@ class ValidationHelper:
         if not os.path.exists(dir_path):
             raise ValueError(f"Output directory missing: {dir_path}")
                 
+    def validate_media_duration(self, path, duration, expected, tolerance=1.0):
+        """Check that a rendered file is as long as the audio it was built from"""
+        if duration is None or abs(duration - expected) > tolerance:
+            raise ValueError(f"{path} is {duration}s long, expected {expected:.2f}s")
+
     def validate_video_output(self, video_path):
         """Validate video file"""
         if not os.path.exists(video_path):